@@ -1 +1,4 @@
-from installer import (HoneyInstaller, get_choice, get_version, Popen, check_output)
+from installer import (HoneyInstaller, STATE_DIR, get_choice, get_version, honeytail_options, Popen, call, check_output)
+from backfill import (take_snapshot, write_tail_state)
+from probe import sample_log
+from tracing import TRACER
@@ -0,0 +1,446 @@
+"""helpers for splitting a log file into record-aligned byte ranges, finding
+rotated copies of a log, and feeding either to honeytail workers over stdin"""
+import bz2
+import gzip
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from distutils.spawn import find_executable
+from multiprocessing.pool import ThreadPool
+
+
+class RecordStart(object):
+    """the lines that start a record for a parser.  With header_run, a run of
+    consecutive matching lines is the header of a single record (mysql's
+    "# Time:" then "# User@Host:"); otherwise every matching line starts one."""
+    def __init__(self, pattern, header_run=False):
+        self.pattern = re.compile(pattern)
+        self.header_run = header_run
+
+    def match(self, line):
+        return self.pattern.match(line)
+
+
+class RecordCounter(object):
+    """counts the records in lines fed to it in order"""
+    def __init__(self, record_start=None):
+        self.record_start = record_start
+        self.records = 0
+        self.in_header = False
+
+    def add(self, line):
+        """returns whether line starts a record"""
+        if self.record_start is None:
+            starts = True
+        else:
+            matched = self.record_start.match(line) is not None
+            starts = matched and not self.in_header
+            self.in_header = matched and self.record_start.header_run
+        if starts:
+            self.records += 1
+        return starts
+
+
+# a line matching one of these starts a new record for the given parser.
+# None means every line is its own record.
+RECORD_START = {
+    "nginx": None,
+    "mysql": RecordStart(r"^# (Time|User@Host): ", header_run=True),
+    # 2.6+: 2016-10-01T12:00:00.123+0000, 2.4: Sat Oct  1 12:00:00.123
+    "mongo": RecordStart(r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}|[A-Z][a-z]{2} [A-Z][a-z]{2} +\d+ \d{2}:\d{2}:\d{2})"),
+}
+
+# how much to read at a time when looking backwards through a file
+LINE_WINDOW = 64 * 1024
+
+COPY_CHUNK_SIZE = 256 * 1024
+
+# access.log.1, access.log.2.gz, slow.log-20161001.gz, mongod.log.2016-10-01T12-00-00
+ROTATED_SUFFIX = re.compile(r"^[.-](\d+|\d{4}-?\d{2}-?\d{2}[-T0-9:.]*)(\.(gz|bz2|xz))?$")
+# logrotate's dateext suffix, as opposed to a rotation number
+DATEEXT = re.compile(r"^\d{4}-?\d{2}-?\d{2}")
+COMPRESSED_EXTENSIONS = (".gz", ".bz2", ".xz")
+
+
+def _lines_backward(fh, end, window=LINE_WINDOW):
+    """yields (offset, line) for each whole line of fh before end, last
+    first.  A partial line at end is skipped."""
+    pos = end
+    buf = b""
+    partial = True
+    while True:
+        if pos > 0:
+            start = max(0, pos - window)
+            fh.seek(start)
+            buf = fh.read(pos - start) + buf
+            pos = start
+        if partial:
+            newline = buf.rfind(b"\n")
+            if newline < 0:
+                if pos == 0:
+                    return
+                continue
+            buf = buf[:newline + 1]
+            partial = False
+        while buf:
+            newline = buf.rfind(b"\n", 0, len(buf) - 1)
+            if newline < 0 and pos > 0:
+                # the line starts before what we've read
+                break
+            yield pos + newline + 1, buf[newline + 1:]
+            buf = buf[:newline + 1]
+        if pos == 0:
+            return
+
+
+def find_record_boundary(fh, offset, record_start=None, end=None):
+    """returns the offset of the first record that starts at or after offset.
+    If offset falls in the middle of a line, the rest of that line is skipped,
+    as is the rest of a header run it lands in.  Returns end (or the file
+    size) if no record starts before it."""
+    fh.seek(0, 2)
+    size = fh.tell()
+    if end is None or end > size:
+        end = size
+    if offset <= 0:
+        fh.seek(0)
+    else:
+        # look at the previous byte so an offset right after a newline
+        # counts as a line start
+        fh.seek(offset - 1)
+        if fh.read(1) != b"\n":
+            fh.readline()
+
+    in_header = False
+    if record_start is not None and record_start.header_run:
+        pos = fh.tell()
+        previous = next(_lines_backward(fh, pos), (0, b""))[1]
+        in_header = record_start.match(previous) is not None
+        fh.seek(pos)
+
+    while True:
+        pos = fh.tell()
+        if pos >= end:
+            return end
+        line = fh.readline()
+        if not line:
+            return end
+        if record_start is None:
+            return pos
+        matched = record_start.match(line) is not None
+        if matched and not in_header:
+            return pos
+        in_header = matched and record_start.header_run
+
+
+def find_snapshot_end(path, size, record_start=None, window=LINE_WINDOW):
+    """returns the offset, at or before size, just past the last record of
+    path that is certainly complete: the end of the last whole line, or for
+    multi-line records, the start of the last record (of its header run, for
+    mysql).  Returns 0 if there's no such point."""
+    header_start = None
+    with open(path, "rb") as fh:
+        for offset, line in _lines_backward(fh, size, window):
+            if record_start is None:
+                return offset + len(line)
+            if record_start.match(line):
+                if not record_start.header_run:
+                    return offset
+                # keep going back to the first line of the run
+                header_start = offset
+            elif header_start is not None:
+                return header_start
+    return header_start or 0
+
+
+class Snapshot(object):
+    """the part of a live log file a backfill covers: everything before offset
+    in the file identified by device and inode.  The tail picks up from there."""
+    def __init__(self, device, inode, offset):
+        self.device = device
+        self.inode = inode
+        self.offset = offset
+
+    def matches(self, st):
+        return st.st_dev == self.device and st.st_ino == self.inode
+
+
+def take_snapshot(path, record_start=None):
+    st = os.stat(path)
+    return Snapshot(st.st_dev, st.st_ino, find_snapshot_end(path, st.st_size, record_start))
+
+
+def write_tail_state(statefile, inode, offset):
+    """seeds honeytail's state file so --tail.read_from=last starts reading
+    the file with that inode at offset"""
+    directory = os.path.dirname(statefile)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp = statefile + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump({"INode": inode, "Offset": offset}, fh)
+    os.rename(tmp, statefile)
+
+
+def split_segments(path, count, record_start=None, start=0, end=None):
+    """splits path[start:end] into at most count (start, end) byte ranges,
+    each beginning on a record boundary."""
+    with open(path, "rb") as fh:
+        fh.seek(0, 2)
+        if end is None:
+            end = fh.tell()
+        length = end - start
+        if length <= 0:
+            return []
+
+        count = max(1, min(count, length))
+        points = [start]
+        for i in xrange(1, count):
+            point = find_record_boundary(fh, start + length * i // count, record_start, end)
+            if point > points[-1]:
+                points.append(point)
+        points.append(end)
+
+    return [(points[i], points[i+1]) for i in xrange(len(points) - 1) if points[i+1] > points[i]]
+
+
+def copy_stream(src, dest, limit=None, progress=None):
+    """copies up to limit bytes (or everything) from the file-like src to the
+    file-like dest, then closes dest.  Returns the number of bytes written,
+    which is short if the reader went away.  Errors reading src propagate."""
+    written = 0
+    try:
+        while limit is None or written < limit:
+            size = COPY_CHUNK_SIZE if limit is None else min(COPY_CHUNK_SIZE, limit - written)
+            chunk = src.read(size)
+            if not chunk:
+                break
+            try:
+                dest.write(chunk)
+            except IOError:
+                # broken pipe - honeytail exited early; the caller sees its exit status
+                break
+            written += len(chunk)
+            if progress:
+                progress(len(chunk))
+    finally:
+        try:
+            dest.close()
+        except IOError:
+            pass
+    return written
+
+
+def copy_range(path, start, end, dest, progress=None):
+    """writes path[start:end] to the file-like dest and closes it.  Returns the
+    number of bytes written."""
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        return copy_stream(fh, dest, end - start, progress)
+
+
+def find_rotated_logs(log_file):
+    """returns the rotated siblings of log_file (access.log.1, access.log.2.gz,
+    ...), oldest first"""
+    log_dir = os.path.dirname(os.path.abspath(log_file))
+    base = os.path.basename(log_file)
+    found = []
+    try:
+        names = os.listdir(log_dir)
+    except OSError:
+        return []
+    for name in names:
+        match = ROTATED_SUFFIX.match(name[len(base):]) if name.startswith(base) else None
+        if not match:
+            continue
+        path = os.path.join(log_dir, name)
+        if os.path.isfile(path):
+            # logrotate keeps mtimes, so break ties with the suffix:
+            # access.log.2 is older than access.log.1, but
+            # access.log-20160101 is older than access.log-20160102
+            suffix = match.group(1)
+            if DATEEXT.match(suffix):
+                key = (0, suffix)
+            else:
+                key = (-int(suffix), "")
+            found.append((os.path.getmtime(path), key, path))
+    return [path for _, _, path in sorted(found)]
+
+
+def is_compressed(path):
+    return path.endswith(COMPRESSED_EXTENSIONS)
+
+
+class _ProcessReader(object):
+    """file-like wrapper around a decompressor's stdout"""
+    def __init__(self, p, args):
+        self.p = p
+        self.args = args
+
+    def read(self, size=-1):
+        return self.p.stdout.read(size)
+
+    def close(self):
+        self.p.stdout.close()
+        if self.p.wait() != 0:
+            raise IOError("{} exited with status {}".format(" ".join(self.args), self.p.returncode))
+
+
+def _has_lzma():
+    try:
+        import lzma
+        return True
+    except ImportError:
+        return False
+
+
+def can_open_log(path):
+    """whether open_log can decompress path: .xz needs the lzma module
+    (python 3) or an xz binary"""
+    return not path.endswith(".xz") or _has_lzma() or find_executable("xz") is not None
+
+
+def open_log(path, popen=subprocess.Popen):
+    """opens path for streaming reads, decompressing .gz/.bz2/.xz on the fly.
+    popen must raise OSError, not exit, if it can't run xz; that surfaces
+    here as an IOError."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.BZ2File(path, "rb")
+    if path.endswith(".xz"):
+        if _has_lzma():
+            import lzma
+            return lzma.open(path, "rb")
+        args = ["xz", "--decompress", "--stdout", path]
+        try:
+            return _ProcessReader(popen(args, stdout=subprocess.PIPE), args)
+        except OSError as e:
+            raise IOError("couldn't run xz: {}".format(e.strerror))
+    return open(path, "rb")
+
+
+class SegmentResult(object):
+    def __init__(self, index, start, end, written, returncode, elapsed):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.written = written
+        self.returncode = returncode
+        self.elapsed = elapsed
+
+
+class FileResult(object):
+    def __init__(self, index, path, written, returncode, elapsed, error=None):
+        self.index = index
+        self.path = path
+        self.written = written
+        self.returncode = returncode
+        self.elapsed = elapsed
+        self.error = error
+
+
+class _WorkerExit(Exception):
+    """a SystemExit raised by a pool worker, carried out to the main thread"""
+
+
+def run_pool(func, items, workers):
+    """calls func on each of items using at most workers threads, and returns
+    the results in order.  If func exits, so does the caller."""
+    def call(item):
+        try:
+            return func(item)
+        except SystemExit as e:
+            # the pool only hands Exceptions back; a SystemExit would kill
+            # the worker and leave the pool waiting on it forever
+            raise _WorkerExit(e.code)
+
+    pool = ThreadPool(max(1, min(workers, len(items))))
+    try:
+        # map_async + get with a timeout keeps the main thread responsive to ^C
+        return pool.map_async(call, items, chunksize=1).get(1 << 31)
+    except _WorkerExit as e:
+        sys.exit(e.args[0])
+    finally:
+        pool.terminate()
+
+
+def run_segments(path, segments, spawn, workers, on_done=None, progress=None, checkpoint=None,
+                 record_start=None, piece_size=None):
+    """backfills each segment, at most workers at a time.  spawn(index, start,
+    end) must return a Popen whose stdin is a pipe; those bytes are streamed
+    into it.  With piece_size, a segment is split on record boundaries into
+    pieces of about that size, each fed to its own honeytail in turn, and a
+    failed piece ends its segment.  If checkpoint is given, the end of each
+    piece whose honeytail exits cleanly is recorded in it as the position of
+    the segment at the same index.  on_done is called with each
+    SegmentResult as it finishes.  Returns the list of SegmentResults in
+    segment order."""
+    lock = threading.Lock()
+
+    def _run(item):
+        index, (start, end) = item
+        began = time.time()
+        pieces = [(start, end)]
+        if piece_size:
+            pieces = split_segments(path, -(-(end - start) // piece_size), record_start, start, end)
+
+        written, returncode = 0, 0
+        for piece_start, piece_end in pieces:
+            p = spawn(index, piece_start, piece_end)
+            count = copy_range(path, piece_start, piece_end, p.stdin, progress)
+            written += count
+            returncode = p.wait()
+            if returncode != 0 or count != piece_end - piece_start:
+                break
+            if checkpoint:
+                checkpoint.set(index, piece_end)
+        if checkpoint and returncode == 0 and written == end - start:
+            checkpoint.finish(index)
+        result = SegmentResult(index, start, end, written, returncode, time.time() - began)
+        if on_done:
+            with lock:
+                on_done(result)
+        return result
+
+    return run_pool(_run, list(enumerate(segments)), workers)
+
+
+def run_files(paths, spawn, workers, on_done=None, popen=subprocess.Popen, starts=None):
+    """like run_segments, but streams each of paths (decompressed if need be)
+    into its own honeytail.  popen is what open_log runs xz with.  starts maps
+    uncompressed paths to the offset to start streaming them from.  Returns
+    the list of FileResults in paths order."""
+    lock = threading.Lock()
+
+    def _run(item):
+        index, path = item
+        began = time.time()
+        written, returncode, error = 0, None, None
+        p = spawn(index, path)
+        try:
+            src = open_log(path, popen)
+            try:
+                if starts and starts.get(path):
+                    src.seek(starts[path])
+                written = copy_stream(src, p.stdin)
+            finally:
+                src.close()
+        except (IOError, EOFError) as e:
+            error = e
+            try:
+                p.stdin.close()
+            except IOError:
+                pass
+        returncode = p.wait()
+        result = FileResult(index, path, written, returncode, time.time() - began, error)
+        if on_done:
+            with lock:
+                on_done(result)
+        return result
+
+    return run_pool(_run, list(enumerate(paths)), workers)
@@ -0,0 +1,108 @@
+"""a content-addressed cache of honeytail binaries, shared between installer
+runs on a host: <cache dir>/<version>/<sha256>/honeytail"""
+import contextlib
+import errno
+import fcntl
+import hashlib
+import os
+import stat
+
+SYSTEM_CACHE_DIR = "/var/cache/honeytail"
+USER_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "honeytail")
+
+# written next to a cached binary once its hash has been checked: the hash,
+# size and mtime it had
+VERIFIED_MARKER = "verified"
+
+
+def sha256_file(path):
+    hash = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(65536), b""):
+            hash.update(chunk)
+    return hash.hexdigest()
+
+
+class HoneytailCache(object):
+    def __init__(self, seed_dir=None):
+        # a pre-seeded (possibly read-only) directory comes first, then the
+        # system-wide cache, then the per-user one
+        self.dirs = [d for d in (seed_dir, SYSTEM_CACHE_DIR, USER_CACHE_DIR) if d]
+
+    def entry_dir(self, cache_dir, version, checksum):
+        return os.path.join(cache_dir, version, checksum)
+
+    def lookup(self, version, checksum, name="honeytail"):
+        """returns the path to a cached binary matching version and checksum,
+        or None.  A binary is hashed the first time it's used from the cache,
+        and every time if someone else could have changed it since."""
+        for cache_dir in self.dirs:
+            entry = self.entry_dir(cache_dir, version, checksum)
+            path = os.path.join(entry, name)
+            if not os.path.isfile(path):
+                continue
+            if self._is_verified(entry, path, checksum):
+                return path
+            if sha256_file(path) == checksum:
+                self._mark_verified(entry, path, checksum)
+                return path
+        return None
+
+    def writable_dir(self, version, checksum):
+        """returns the first cache entry directory we're able to write to,
+        creating it if need be, or None if there isn't one"""
+        for cache_dir in self.dirs:
+            entry = self.entry_dir(cache_dir, version, checksum)
+            try:
+                os.makedirs(entry)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    continue
+            if os.access(entry, os.W_OK):
+                return entry
+        return None
+
+    @contextlib.contextmanager
+    def lock(self, entry):
+        """holds an exclusive lock on a cache entry, so concurrent installers
+        wait for one download rather than all fetching the same file"""
+        with open(entry + ".lock", "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def mark_verified(self, path, checksum):
+        self._mark_verified(os.path.dirname(path), path, checksum)
+
+    def _is_verified(self, entry, path, checksum):
+        """whether the marker vouches for path.  Size and mtime are easy to
+        fake, so the marker only counts if nobody but us (or root) could have
+        rewritten the binary or the marker."""
+        marker = os.path.join(entry, VERIFIED_MARKER)
+        try:
+            if not (_trusted(entry) and _trusted(path) and _trusted(marker)):
+                return False
+            with open(marker) as fh:
+                return fh.read().strip() == self._fingerprint(path, checksum)
+        except (IOError, OSError):
+            return False
+
+    def _mark_verified(self, entry, path, checksum):
+        try:
+            with open(os.path.join(entry, VERIFIED_MARKER), "w") as fh:
+                fh.write(self._fingerprint(path, checksum))
+        except (IOError, OSError):
+            # read-only cache; we'll just verify it again next time
+            pass
+
+    def _fingerprint(self, path, checksum):
+        st = os.stat(path)
+        return "{} {} {}".format(checksum, st.st_size, int(st.st_mtime))
+
+
+def _trusted(path):
+    """whether only the current user or root could have written path"""
+    st = os.stat(path)
+    return st.st_uid in (0, os.getuid()) and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
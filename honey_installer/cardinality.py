@@ -0,0 +1,130 @@
+"""estimates how many distinct values each field of a log's events takes,
+and picks fields to key honeytail's dynamic sampling on"""
+import hashlib
+import json
+import math
+import struct
+
+# 2^HLL_PRECISION registers; about 3% standard error
+HLL_PRECISION = 10
+
+# fields with more distinct values than this are mostly ids, times or sizes,
+# and would leave every key too rare to sample
+MAX_KEY_CARDINALITY = 500
+# the most distinct keys the chosen fields may make between them, so the
+# dynamic sampler sees each key often enough to learn its rate
+MAX_KEY_SPACE = 1000
+MAX_KEYS = 2
+# a sampling key has to be on nearly every event
+MIN_PRESENCE = 0.9
+
+# flags honeytail needs in order to produce some candidate fields, which the
+# sample is parsed with when they're candidates
+FIELD_FLAGS = {
+    "request_shape": ("--request_shape", "request"),
+    "request_path": ("--request_shape", "request"),
+}
+
+
+class HyperLogLog(object):
+    """a fixed-size sketch of the distinct values added to it"""
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    def add(self, value):
+        if isinstance(value, unicode):
+            value = value.encode("utf-8")
+        hashed, = struct.unpack(">Q", hashlib.sha1(value).digest()[:8])
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        # position of the first set bit in what's left of the hash
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(b"\x00")
+        if estimate <= 2.5 * self.size and zeros:
+            # few values yet; linear counting is more accurate
+            estimate = self.size * math.log(float(self.size) / zeros)
+        return int(round(estimate))
+
+
+class FieldStats(object):
+    def __init__(self):
+        self.sketch = HyperLogLog()
+        self.present = 0
+
+    @property
+    def cardinality(self):
+        return self.sketch.count()
+
+
+def parse_debug_events(output):
+    """returns the events' fields from honeytail --debug_stdout output"""
+    events = []
+    for line in output.splitlines():
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(event, dict):
+            continue
+        data = event.get("data")
+        events.append(data if isinstance(data, dict) else event)
+    return events
+
+
+def field_cardinalities(events):
+    """returns {field: FieldStats} over events"""
+    fields = {}
+    for event in events:
+        for field, value in event.iteritems():
+            if field not in fields:
+                fields[field] = FieldStats()
+            stats = fields[field]
+            stats.present += 1
+            if not isinstance(value, basestring):
+                value = json.dumps(value, sort_keys=True)
+            stats.sketch.add(value)
+    return fields
+
+
+def choose_sampling_keys(fields, event_count, candidates=()):
+    """picks up to MAX_KEYS fields to key dynamic sampling on: the given
+    candidates first, in order, then whichever other fields have the fewest
+    distinct values.  Each key has to be on nearly every event and split
+    the events up at least a little."""
+    usable = {}
+    for field, stats in fields.iteritems():
+        cardinality = stats.cardinality
+        if stats.present >= MIN_PRESENCE * event_count and 2 <= cardinality <= MAX_KEY_CARDINALITY:
+            usable[field] = cardinality
+
+    ordered = [f for f in candidates if f in usable]
+    ordered += sorted((f for f in usable if f not in ordered), key=lambda f: (usable[f], f))
+
+    keys = []
+    space = 1
+    for field in ordered:
+        if space * usable[field] > MAX_KEY_SPACE:
+            continue
+        keys.append(field)
+        space *= usable[field]
+        if len(keys) == MAX_KEYS:
+            break
+    return keys
+
+
+def key_flags(keys, parse_flags=()):
+    """the honeytail flags for dynamic sampling on keys, picked from events
+    parsed with parse_flags.  Those flags can add fields that aren't
+    otherwise there (request shaping adds request_method, request_pathshape
+    and more), so any key might need them, and they go along too."""
+    if not keys:
+        return []
+    return list(parse_flags) + [("--dynsampling", key) for key in keys]
@@ -0,0 +1,96 @@
+"""records how far each piece of a backfill has got, so an interrupted
+backfill can be resumed instead of started over"""
+import json
+import os
+import threading
+import time
+
+# seconds between saves while a backfill is running
+CHECKPOINT_INTERVAL = 5
+# each honeytail in a checkpointed backfill gets at most this much of the log,
+# so progress can be saved each time one finishes
+PIECE_SIZE = 64 * 1024 * 1024
+
+
+class Checkpoint(object):
+    """the byte ranges of one log file being backfilled, and how much of each
+    honeytail has finished with.  A checkpoint only applies to the file it was
+    taken of: the same device and inode, at least as big as it was then."""
+    def __init__(self, path, st, segments=None):
+        self.path = path
+        self.device = st.st_dev
+        self.inode = st.st_ino
+        # [start, end, position] for each piece
+        self.segments = segments or []
+        self.lock = threading.Lock()
+        self.last_save = 0
+
+    @classmethod
+    def load(cls, path, st):
+        """returns the saved checkpoint at path if it's for the file st
+        describes, otherwise None"""
+        try:
+            with open(path) as fh:
+                data = json.load(fh)
+        except (IOError, ValueError):
+            return None
+        if data.get("device") != st.st_dev or data.get("inode") != st.st_ino or data.get("size", 0) > st.st_size:
+            return None
+        return cls(path, st, data.get("segments"))
+
+    @property
+    def end(self):
+        return max([end for start, end, position in self.segments] or [0])
+
+    @property
+    def total(self):
+        return sum(end - start for start, end, position in self.segments)
+
+    @property
+    def done(self):
+        return sum(position - start for start, end, position in self.segments)
+
+    def remaining(self):
+        """the unfinished parts of each piece.  Positions are only ever set
+        where a honeytail finished, so they're on record boundaries."""
+        return [(position, end) for start, end, position in self.segments if position < end]
+
+    def begin(self, segments):
+        with self.lock:
+            self.segments = [[start, end, start] for start, end in segments]
+            self._save()
+
+    def set(self, index, position):
+        with self.lock:
+            self.segments[index][2] = position
+            if time.time() - self.last_save >= CHECKPOINT_INTERVAL:
+                self._save()
+
+    def finish(self, index):
+        with self.lock:
+            self.segments[index][2] = self.segments[index][1]
+            self._save()
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        self.last_save = time.time()
+        data = {"device": self.device, "inode": self.inode, "size": self.end, "segments": self.segments}
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as fh:
+                json.dump(data, fh)
+            os.rename(tmp, self.path)
+        except (IOError, OSError):
+            # without a checkpoint an interrupted backfill just starts over
+            pass
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
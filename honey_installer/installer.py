@@ -2,18 +2,33 @@ import click
 from distutils.version import StrictVersion
 import emoji
 import hashlib
+import json
 import logging
 import os
 import platform
 import re
 import requests
+import shlex
 import shutil
 import stat
 import subprocess
 import sys
+import threading
+import time
 import urllib
 
+from backfill import (RECORD_START, can_open_log, find_rotated_logs, is_compressed, run_files, run_pool, split_segments,
+                      run_segments, take_snapshot, write_tail_state)
+from cache import HoneytailCache
+from cardinality import (FIELD_FLAGS, choose_sampling_keys, field_cardinalities, key_flags, parse_debug_events)
+from checkpoint import (Checkpoint, PIECE_SIZE)
 from honeytail_version import (HONEYTAIL_VERSION, HONEYTAIL_CHECKSUM)
+from probe import (Calibration, DEFAULT_BYTES_PER_SEC, format_duration, net_bytes_per_sec, probe_log, sample_log)
+from progress import (ThroughputBar, read_offset)
+from supervisor import (ResourceLimits, Supervisor, forward_signals)
+from timestamps import (find_offset_since, parse_since)
+from tracing import TRACER
+from volume import (SAMPLE_ABOVE, SENDING_FLAGS, analyze_volume, peak_rate, tune_flags)
 
 def get_version():
     try:
@@ -35,6 +50,19 @@ HONEYTAIL_URL = {
 
 TEAM_URL = "https://api.honeycomb.io/1/team_slug"
 
+DOWNLOAD_CHUNK_SIZE = 65536
+DOWNLOAD_RETRIES = 5
+# seconds to wait before the first retry; doubled for each one after that
+DOWNLOAD_BACKOFF = 1
+# seconds to wait for the server to connect or send more data
+DOWNLOAD_TIMEOUT = 30
+
+# seconds between checks on how far a backfill has got
+PROGRESS_INTERVAL = 0.5
+
+# where we keep state between runs on this host
+STATE_DIR = os.path.expanduser("~/.honey_installer")
+
 # this env hack is because pyinstallers creates its own LD_LIBRARY_PATH
 # which, when the script is run on a different linux distro, fails to load
 # some libraries. This unsets it and gets around that problem.
@@ -48,18 +76,65 @@ def replace_subprocess_env(**kwargs):
     kwargs['env'] = env
     return kwargs
 
-def Popen(args, **kwargs):
+class TracedPopen(subprocess.Popen):
+    """a Popen that reports to the tracer once the child has been reaped"""
+    def __init__(self, args, **kwargs):
+        self._trace_args = args
+        self._trace_token = TRACER.start_process(args)
+        self._traced = False
+        super(TracedPopen, self).__init__(args, **kwargs)
+
+    def _trace_exit(self):
+        if not self._traced:
+            self._traced = True
+            TRACER.end_process(self._trace_args, self._trace_token, self.returncode)
+
+    def poll(self):
+        returncode = super(TracedPopen, self).poll()
+        if returncode is not None:
+            self._trace_exit()
+        return returncode
+
+    def wait(self):
+        returncode = super(TracedPopen, self).wait()
+        self._trace_exit()
+        return returncode
+
+class SpawnError(Exception):
+    """a command couldn't be started.  A SystemExit in a ThreadPool worker
+    hangs the pool, so threads raise this instead, and start() exits with it
+    on the main thread."""
+
+def spawn(args, **kwargs):
+    """like Popen, but raises SpawnError rather than exiting, for threads"""
     try:
-        kwargs = replace_subprocess_env(**kwargs)
-        p = subprocess.Popen(args, **kwargs)
+        return TracedPopen(args, **replace_subprocess_env(**kwargs))
     except OSError as e:
-        click.echo("Failed to run {}: {}".format(args, e))
+        raise SpawnError("Failed to run {}: {}".format(args, e))
+
+def Popen(args, **kwargs):
+    try:
+        return spawn(args, **kwargs)
+    except SpawnError as e:
+        click.echo(str(e))
         sys.exit(1)
-    return p
+
+def call(args, **kwargs):
+    return Popen(args, **kwargs).wait()
 
 def check_output(args, **kwargs):
     kwargs = replace_subprocess_env(**kwargs)
-    return subprocess.check_output(args, **kwargs)
+    token = TRACER.start_process(args)
+    returncode = None
+    try:
+        output = subprocess.check_output(args, **kwargs)
+        returncode = 0
+        return output
+    except subprocess.CalledProcessError as e:
+        returncode = e.returncode
+        raise
+    finally:
+        TRACER.end_process(args, token, returncode)
 
 def get_choice(choices, prompt):
     while True:
@@ -72,25 +147,127 @@ def get_choice(choices, prompt):
 
         click.echo("invalid choice, sorry.")
 
+def _parse_since_option(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return parse_since(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+def honeytail_options(f):
+    """adds the command line options shared by every installer to a click command"""
+    f = click.option("--backfill-workers", help="Number of honeytail processes to backfill with in parallel", default=1, type=click.IntRange(1, 64))(f)
+    f = click.option("--tune/--no-tune", help="Pick honeytail's batching and concurrency from the log's traffic, and offer to sample very busy logs", default=False)(f)
+    f = click.option("--sample-target", help="With --tune, offer to sample logs busier than this many events per second down to about that", default=SAMPLE_ABOVE, type=click.IntRange(1))(f)
+    f = click.option("--supervise/--no-supervise", help="Run honeytail without a shell, restarting it if it exits", default=False)(f)
+    f = click.option("--honeytail-max-memory", help="With --supervise, limit honeytail's memory to this many MB (needs cgroup v2)", type=click.IntRange(1))(f)
+    f = click.option("--honeytail-max-cpu", help="With --supervise, limit honeytail to this percent of one CPU", type=click.IntRange(1))(f)
+    f = click.option("--trace", "trace_file", help="Write a JSON trace of how long each step took to this file", type=click.Path(dir_okay=False))(f)
+    f = click.option("--honeytail-cache", help="Directory of pre-downloaded honeytail binaries, laid out as <version>/<sha256>/honeytail", envvar="HONEYTAIL_CACHE_DIR", type=click.Path(file_okay=False))(f)
+    f = click.option("--probe/--no-probe", help="Time honeytail on a sample of the log, to check it parses it and estimate how long a backfill takes", default=True)(f)
+    f = click.option("--backfill-since", help="Only backfill events logged since this time (eg 6h, 2d or 2016-10-01T12:00:00)", callback=_parse_since_option)(f)
+    return f
+
 sizeK = 1024
 sizeM = 1024 * sizeK
 sizeG = 1024 * sizeM
 
-def estimate_ingest_time(file_size, take_or_be):
-    # these are totally pulled out of thin air and may be *way* off
-    estimates = [
-        (5 * sizeG, " several hours"),
-        (1 * sizeG, " a couple hours"),
-        (500 * sizeM, " an hour"),
-        (1 * sizeM, " several minutes"),
-    ]
-    for est in estimates:
-        if file_size > est[0]:
-            return "may " + take_or_be + est[1]
-    return "may " + take_or_be + " a couple minutes"
+def estimate_ingest_time(file_size, take_or_be, bytes_per_sec=DEFAULT_BYTES_PER_SEC):
+    return "may " + take_or_be + " " + format_duration(float(file_size) / bytes_per_sec)
+
+class DownloadProgress(object):
+    """how much of a download we have, the running sha256 of it, and the
+    ETag or Last-Modified of the file it's part of.  That validator is saved
+    beside the partial download, so a later run only resumes the same file."""
+    def __init__(self, url, path):
+        self.url = url
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.hash = hashlib.sha256()
+        self.validator = None
+
+    def update(self, chunk):
+        self.offset += len(chunk)
+        self.hash.update(chunk)
+
+    def load(self):
+        """the validator saved for a partial download of our url, or None"""
+        try:
+            with open(self.path) as fh:
+                saved = json.load(fh)
+        except (IOError, ValueError):
+            return None
+        if saved.get("url") != self.url:
+            return None
+        return saved.get("validator")
+
+    def start(self, headers):
+        """starts over on a fresh response with the given headers"""
+        self.reset()
+        etag = headers.get("ETag")
+        # If-Range only takes strong ETags
+        if etag and not etag.startswith("W/"):
+            self.validator = etag
+        else:
+            self.validator = headers.get("Last-Modified")
+        with open(self.path, "w") as fh:
+            json.dump({"url": self.url, "validator": self.validator}, fh)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class BackgroundStep(threading.Thread):
+    """runs func on its own thread.  What it prints through echo() is held
+    until wait(), so it doesn't land in the middle of a prompt.  wait()
+    returns its result, or re-raises whatever it raised (including
+    SystemExit) in the calling thread."""
+    def __init__(self, func):
+        super(BackgroundStep, self).__init__()
+        self.daemon = True
+        self.func = func
+        self.result = None
+        self.exc_info = None
+        # [(message, styles)] for click.secho
+        self.output = []
+
+    def run(self):
+        try:
+            self.result = self.func()
+        except BaseException:
+            self.exc_info = sys.exc_info()
+
+    def wait(self):
+        # join with a timeout so ^C still reaches the main thread
+        while self.is_alive():
+            self.join(0.1)
+        for message, styles in self.output:
+            click.secho(message, **styles)
+        self.output = []
+        if self.exc_info:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+def echo(message=None, **styles):
+    """click.secho, except on a BackgroundStep, which holds on to the output
+    until it's waited for"""
+    thread = threading.current_thread()
+    if isinstance(thread, BackgroundStep):
+        thread.output.append((message, styles))
+    else:
+        click.secho(message, **styles)
 
 class HoneyInstaller(object):
-    def __init__(self, installer_name, installer_version, parser_module, parser_extra_flags, writekey, dataset, default_dataset, honeytail_loc, debug):
+    def __init__(self, installer_name, installer_version, parser_module, parser_extra_flags, writekey, dataset, default_dataset, honeytail_loc, debug,
+                 backfill_workers=1, backfill_since=None, probe=True, honeytail_cache=None, trace_file=None,
+                 supervise=False, honeytail_max_memory=None, honeytail_max_cpu=None, tune=False,
+                 sample_target=SAMPLE_ABOVE):
         self.installer_name = installer_name
         self.installer_version = installer_version
         self.parser_module = parser_module
@@ -100,30 +277,59 @@ class HoneyInstaller(object):
         self.default_dataset = default_dataset
         self.honeytail_loc = honeytail_loc
         self.debug = debug
+        self.backfill_workers = backfill_workers
+        self.backfill_since = backfill_since
+        self.backfill_start = None
+        # where the backfill of the live log stops and the tail takes over
+        self.snapshot = None
+        self.probe_honeytail = probe
+        self.probe = None
+        # the records the probe sampled, for checking honeytail parses them
+        self.probe_samples = None
+        self.calibration = Calibration(os.path.join(STATE_DIR, "calibration.json"))
+        self.honeytail_cache = HoneytailCache(honeytail_cache)
+        self.honeytail_fetch = None
+        self.trace_file = trace_file
+        self.supervise = supervise
+        self.honeytail_max_memory = honeytail_max_memory
+        self.honeytail_max_cpu = honeytail_max_cpu
+        self.limits = None
+        self.tune = tune
+        self.sample_target = sample_target
+        # [(flag, value)] picked for the log's traffic, added to every command
+        self.tuning = []
+        # log file: VolumeStats, so each log is only scanned once
+        self.volume_stats = {}
+        # a session per thread, since they aren't thread safe
+        self.sessions = threading.local()
+
+    @property
+    def session(self):
+        """this thread's requests session, so its requests reuse connections"""
+        session = getattr(self.sessions, "session", None)
+        if session is None:
+            session = self.sessions.session = requests.Session()
+            session.headers["User-Agent"] = self.get_user_agent()
+        return session
 
     def success(self, msg):
-        click.secho(emoji.emojize(":heavy_check_mark: " + msg), fg="green")
+        echo(emoji.emojize(":heavy_check_mark: " + msg), fg="green")
 
     def warn(self, msg):
-        click.secho(msg, fg="yellow")
+        echo(msg, fg="yellow")
 
     def error(self, msg):
-        click.secho(msg, fg="red")
+        echo(msg, fg="red")
 
     def check_honeytail(self):
         """make sure we have a usable honeytail.  will use the user-supplied
-        executable if its version is >= HONEYTAIL_VERSION.  Otherwise, fetches
-        a new one."""
+        executable if its version is >= HONEYTAIL_VERSION.  Otherwise, starts
+        fetching a new one in the background; wait_for_honeytail() finishes up."""
         if not os.path.isfile(self.honeytail_loc):
-            if self.honeytail_loc == "honeytail":
-                # the default location
-                click.echo("Downloading honeytail version {}.".format(HONEYTAIL_VERSION))
-            else:
+            if self.honeytail_loc != "honeytail":
                 # the user specified a location, so let's tell them we couldn't find it there
                 click.echo("Couldn't find honeytail at {}.".format(self.honeytail_loc))
-                click.echo("Downloading honeytail version {} to ./honeytail.".format(HONEYTAIL_VERSION))
-
-            self.honeytail_loc = self.fetch_honeytail()
+            self.start_honeytail_fetch()
             return
 
         existing_version, existing_newer = self.check_honeytail_version()
@@ -134,12 +340,29 @@ class HoneyInstaller(object):
 
         if self.honeytail_loc != "honeytail":
             click.echo("Honeytail version at {} is too old ({}).".format(self.honeytail_loc, existing_version))
-            click.echo("Downloading new version ({}) to ./honeytail.".format(HONEYTAIL_VERSION))
         else:
             click.echo("Honeytail version is too old ({}).".format(existing_version))
-            click.echo("Downloading new version of honeytail ({})".format(HONEYTAIL_VERSION))
 
-        self.honeytail_loc = self.fetch_honeytail()
+        self.start_honeytail_fetch()
+
+
+    def start_honeytail_fetch(self):
+        """fetches honeytail on a background thread, so the download overlaps
+        with the prompts and probes in the steps that follow"""
+        self.honeytail_fetch = BackgroundStep(lambda: self.fetch_honeytail(quiet=True))
+        self.honeytail_fetch.start()
+
+
+    def wait_for_honeytail(self):
+        """waits for a background honeytail fetch, if there is one"""
+        if not self.honeytail_fetch:
+            return
+        if self.honeytail_fetch.is_alive():
+            click.echo("Waiting for the honeytail download to finish...")
+        self.honeytail_loc = self.honeytail_fetch.wait()
+        self.honeytail_fetch = None
+        self.success("honeytail version {} is ready at {}".format(HONEYTAIL_VERSION, self.honeytail_loc))
+        click.echo()
 
 
     def check_honeytail_version(self):
@@ -157,7 +380,7 @@ class HoneyInstaller(object):
         except OSError:
             return "unknown", False
 
-    def fetch_honeytail(self):
+    def fetch_honeytail(self, quiet=False):
         if not HONEYTAIL_URL:
             self.error("""\
 Sorry, {installer_name} auto configuration is not supported for {platform}.
@@ -165,61 +388,152 @@ Please see the docs or ask for further assistance.
 https://honeycomb.io/docs/send-data/agent/""".format(installer_name=self.installer_name, platform=platform.system()))
             sys.exit(1)
 
-        return self.fetch_file("honeytail", HONEYTAIL_URL, HONEYTAIL_CHECKSUM, ensure_exec=True)
-
-    def fetch_file(self, name, url, checksum=None, ensure_exec=False):
-        """downloads the file from url and saves to ./name, optionally checking against
-           a sha256 hash and making executable"""
-        dest = "./" + name
+        if not HONEYTAIL_CHECKSUM:
+            # without a checksum there's nothing to key the cache on
+            echo("Downloading honeytail version {} to ./honeytail.".format(HONEYTAIL_VERSION))
+            return self.fetch_file("honeytail", HONEYTAIL_URL, HONEYTAIL_CHECKSUM, ensure_exec=True, quiet=quiet)
+
+        cached = self.honeytail_cache.lookup(HONEYTAIL_VERSION, HONEYTAIL_CHECKSUM)
+        if cached:
+            echo("Using cached honeytail version {} at {}".format(HONEYTAIL_VERSION, cached))
+            return cached
+
+        entry = self.honeytail_cache.writable_dir(HONEYTAIL_VERSION, HONEYTAIL_CHECKSUM)
+        if not entry:
+            echo("Downloading honeytail version {} to ./honeytail.".format(HONEYTAIL_VERSION))
+            return self.fetch_file("honeytail", HONEYTAIL_URL, HONEYTAIL_CHECKSUM, ensure_exec=True, quiet=quiet)
+
+        with self.honeytail_cache.lock(entry):
+            # another installer may have fetched it while we waited for the lock
+            cached = self.honeytail_cache.lookup(HONEYTAIL_VERSION, HONEYTAIL_CHECKSUM)
+            if cached:
+                echo("Using cached honeytail version {} at {}".format(HONEYTAIL_VERSION, cached))
+                return cached
+            echo("Downloading honeytail version {} to {}.".format(HONEYTAIL_VERSION, entry))
+            dest = self.fetch_file("honeytail", HONEYTAIL_URL, HONEYTAIL_CHECKSUM, ensure_exec=True, dest_dir=entry, quiet=quiet)
+            self.honeytail_cache.mark_verified(dest, HONEYTAIL_CHECKSUM)
+            return dest
+
+    def fetch_file(self, name, url, checksum=None, ensure_exec=False, dest_dir=".", quiet=False):
+        """downloads the file from url and saves to dest_dir/name, optionally checking against
+           a sha256 hash and making executable.  The hash is computed as the
+           bytes arrive, and interrupted downloads are resumed with Range requests.
+           quiet skips the progress bar, for downloads running in the background."""
+        dest = os.path.join(dest_dir, name)
         dest_tmp = dest + "-tmp"
 
-        with open(dest_tmp, "wb") as fb:
-            headers = {"User-Agent": self.get_user_agent()}
-            resp = requests.get(url, stream=True, headers=headers)
-            if resp.status_code != 200:
-                self.error("There was an error downloading {}. Please try again or let us know what happened.".format(name))
-                if self.debug:
-                    click.secho("response status code = {}".format(resp.status_code), bold=True)
-                try:
-                    os.remove(dest_tmp)
-                except OSError:
-                    pass
-                sys.exit(1)
-
-            resp.raw.decode_content = True
-            chunk_size=65536
-            with click.progressbar(length=int(resp.headers['Content-length']), show_percent=True, width=50) as bar:
-                for chunk in resp.iter_content(chunk_size):
-                    fb.write(chunk)
-                    bar.update(len(chunk))
-
-        if checksum:
-            hash = hashlib.sha256()
+        # pick up where an earlier, interrupted run left off, if it was
+        # fetching the same file
+        progress = DownloadProgress(url, dest_tmp + ".json")
+        validator = progress.load()
+        if validator and os.path.isfile(dest_tmp):
+            progress.validator = validator
             with open(dest_tmp, "rb") as fh:
-                while True:
-                    chunk = fh.read(4096)
-                    if not chunk:
-                        break
-                    hash.update(chunk)
+                for chunk in iter(lambda: fh.read(DOWNLOAD_CHUNK_SIZE), b""):
+                    progress.update(chunk)
+
+        attempt = 0
+        while True:
+            try:
+                with TRACER.span("download " + name, "download", url=url, resumed_from=progress.offset) as span:
+                    self._download(name, url, dest_tmp, progress, quiet)
+                    span["bytes"] = progress.offset
+                break
+            except (requests.exceptions.RequestException, IOError) as e:
+                attempt += 1
+                if attempt > DOWNLOAD_RETRIES:
+                    self.error("There was an error downloading {}. Please try again or let us know what happened.".format(name))
+                    if self.debug:
+                        echo("error = {}".format(e), bold=True)
+                    sys.exit(1)
+                delay = DOWNLOAD_BACKOFF * 2 ** (attempt - 1)
+                if not quiet:
+                    echo()
+                self.warn("Downloading {} was interrupted ({}), retrying in {}s...".format(name, e, delay))
+                time.sleep(delay)
 
+        if checksum:
+            hash = progress.hash
             if hash.hexdigest() != checksum:
                 self.error("The hash of the downloaded file didn't match the one on record.")
                 self.error("Please try again or ask for further assistance.")
                 logging.error("Expecting : {} but received {}".format(checksum, hash.hexdigest()))
                 shutil.move(dest_tmp, dest+"-badchecksum")
+                progress.remove()
                 sys.exit(1)
-            self.success("Download verified")
+            if not quiet:
+                self.success("Download verified")
 
         shutil.move(dest_tmp, dest)
+        progress.remove()
 
         if ensure_exec:
             os.chmod(dest, stat.S_IRWXU | stat.S_IXGRP | stat.S_IXOTH | stat.S_IRGRP | stat.S_IROTH)
 
-        click.echo()
+        if not quiet:
+            echo()
 
         return dest
 
 
+    def _download(self, name, url, dest_tmp, progress, quiet=False):
+        """fetches url into dest_tmp, continuing from where progress says we
+        got to if the server supports it and the file hasn't changed since.
+        Raises IOError or a RequestException for anything worth retrying."""
+        headers = {}
+        if progress.offset:
+            headers["Range"] = "bytes={}-".format(progress.offset)
+            # the server sends the whole file instead if it's changed
+            headers["If-Range"] = progress.validator
+        resp = self.session.get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+
+        if resp.status_code == 416:
+            # what we have doesn't fit the file on the server; start over
+            resp.close()
+            os.remove(dest_tmp)
+            progress.remove()
+            progress.reset()
+            raise IOError("partial download of {} is stale".format(name))
+        if resp.status_code >= 500:
+            resp.close()
+            raise IOError("server responded with status {}".format(resp.status_code))
+        if resp.status_code not in (200, 206):
+            self.error("There was an error downloading {}. Please try again or let us know what happened.".format(name))
+            if self.debug:
+                echo("response status code = {}".format(resp.status_code), bold=True)
+            try:
+                os.remove(dest_tmp)
+            except OSError:
+                pass
+            progress.remove()
+            sys.exit(1)
+
+        if resp.status_code == 200:
+            # the whole file, either because we asked for it, or because the
+            # server ignored our Range header or the file has changed
+            progress.start(resp.headers)
+
+        length = resp.headers.get("Content-length")
+        total = progress.offset + int(length) if length else None
+
+        with open(dest_tmp, "ab" if progress.offset else "wb") as fb:
+            resp.raw.decode_content = True
+            if total is None or quiet:
+                for chunk in resp.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    fb.write(chunk)
+                    progress.update(chunk)
+            else:
+                with click.progressbar(length=total, show_percent=True, width=50) as bar:
+                    bar.update(progress.offset)
+                    for chunk in resp.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        fb.write(chunk)
+                        progress.update(chunk)
+                        bar.update(len(chunk))
+
+        if total is not None and progress.offset < total:
+            raise IOError("connection closed after {} of {} bytes".format(progress.offset, total))
+
+
     def get_user_agent(self):
         return "{installer_name}-installer/{installer_version}".format(installer_name=self.installer_name, installer_version=self.installer_version)
 
@@ -227,9 +541,8 @@ https://honeycomb.io/docs/send-data/agent/""".format(installer_name=self.install
     def get_team_slug(self):
         """calls out to Honeycomb to turn the writekey into the slug necessary to
         form the URL straight in to the dataset in the UI"""
-        headers = {"X-Honeycomb-Team": self.writekey,
-                   "User-Agent": self.get_user_agent()}
-        resp = requests.get(TEAM_URL, headers=headers)
+        headers = {"X-Honeycomb-Team": self.writekey}
+        resp = self.session.get(TEAM_URL, headers=headers)
         if resp.status_code != 200:
             self.error("There was an error resolving your Team Name. Please verify your write key and try again, or let us know what happened.")
             self.error("\t" + resp.text)
@@ -257,6 +570,15 @@ https://honeycomb.io/docs/send-data/agent/""".format(installer_name=self.install
 
     def prompt_for_run_mode(self):
         file_size = os.stat(self.log_file).st_size
+        if self.backfill_since is not None:
+            file_size -= self.get_backfill_start()
+
+        self.probe = self.probe_log_file()
+        # the probe runs honeytail the way the backfill would
+        self.pre_backfill_hook()
+        self.check_probe_parses()
+        if self.tune:
+            self.tuning = self.tune_honeytail()
 
         click.echo("""
 Honeytail is ready to start sending data.
@@ -265,11 +587,20 @@ By default, honeytail only parses new log lines (like `tail -f`).
 It can also backfill existing logs, which can get you started with more data in the query tools faster.
 """)
 
-        estimate = estimate_ingest_time(file_size, "be")
+        estimate = self.estimate_ingest_time(file_size, "be", self.backfill_workers)
         if estimate != "":
-            click.echo("{log_file} size is {file_size} bytes,".format(log_file=self.log_file, file_size=file_size))
+            if self.backfill_since is not None:
+                click.echo("{log_file} has {file_size} bytes logged since {since},".format(
+                    log_file=self.log_file, file_size=file_size, since=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.backfill_since))))
+            else:
+                click.echo("{log_file} size is {file_size} bytes,".format(log_file=self.log_file, file_size=file_size))
+            if self.probe.bytes_per_event:
+                click.echo("or roughly {events} events of {size:.0f} bytes each,".format(
+                    events=int(file_size / self.probe.bytes_per_event), size=self.probe.bytes_per_event))
             click.echo("so if you decide to backfill, it {estimate} before honeytail".format(estimate=estimate))
             click.echo("is sending real-time data.")
+            if self.get_bytes_per_sec() is None:
+                click.echo("(That's an uncalibrated default; we haven't been able to time honeytail on this host yet.)")
             click.echo()
 
         click.echo("How would you like to start the data flowing to honeycomb?")
@@ -282,6 +613,152 @@ It can also backfill existing logs, which can get you started with more data in
         click.echo()
         return choice, file_size
 
+    def probe_log_file(self):
+        """samples the head, middle and tail of the log to measure its events"""
+        with TRACER.span("sample " + self.log_file, "probe"):
+            probe, self.probe_samples = probe_log(self.log_file, RECORD_START.get(self.parser_module))
+        return probe
+
+    def _time_honeytail(self, command, data):
+        """runs command on data, returning (seconds taken, Popen, stdout, stderr)"""
+        began = time.time()
+        p = Popen(command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = p.communicate(data)
+        return time.time() - began, p, out, err
+
+    def check_probe_parses(self):
+        """unless --no-probe was given, runs honeytail over the probe's samples
+        to check it parses the events we counted, and times it.  Its startup
+        is timed on no input and taken off, so what's left is how fast it
+        parses; that goes into the calibration for the estimates."""
+        probe = self.probe
+        if not self.probe_honeytail or not probe or not probe.sample_events:
+            return
+
+        # --debug_stdout prints events instead of sending them
+        command = " ".join(self.get_backfill_lines("-")) + " --debug_stdout"
+        with TRACER.span("check parsing " + self.log_file, "probe"):
+            startup, p, out, err = self._time_honeytail(command, b"")
+            if p.returncode == 0:
+                elapsed, p, out, err = self._time_honeytail(command, b"".join(self.probe_samples))
+        if p.returncode != 0:
+            if self.debug:
+                self.warn("running honeytail on a sample of {} failed, exit status {}:".format(self.log_file, p.returncode))
+                self.warn(err)
+            return
+
+        probe.honeytail_bytes_per_sec = net_bytes_per_sec(probe.sample_bytes, elapsed, startup)
+        if probe.honeytail_bytes_per_sec:
+            self.calibration.record(self.parser_module, probe.honeytail_bytes_per_sec)
+        probe.honeytail_events = len(out.splitlines())
+        if probe.honeytail_events < probe.sample_events * 0.9:
+            self.warn("honeytail only parsed {} of the {} events we sampled from {}.".format(
+                probe.honeytail_events, probe.sample_events, self.log_file))
+            self.warn("Some events may be skipped, so please double check the log format.")
+        if self.debug:
+            click.echo("sampled {} bytes, {} events ({}); honeytail took {:.2f}s to start and {:.2f}s in all".format(
+                probe.sample_bytes, probe.sample_events,
+                ", ".join("{:.0f} events/MB".format(d) for d in probe.densities),
+                startup, elapsed))
+
+
+    def tune_honeytail(self):
+        """measures the log's events per second and returns the honeytail
+        flags to handle them with"""
+        stats = self.get_volume_stats(self.log_file)
+        if stats is None:
+            return []
+        flags = tune_flags(stats)
+        click.echo("{log_file} averages {mean:.1f} events/s, and {p99} events/s in its busiest 1% of seconds (peak {peak}).".format(
+            log_file=self.log_file, mean=stats.mean, p99=stats.p99, peak=stats.peak))
+        if peak_rate(stats) > self.sample_target:
+            sampled = tune_flags(stats, self.sample_target)
+            self.warn("That's more than {} events/s. Sampling would send only about 1 in {} events and drop the rest.".format(
+                self.sample_target, dict(sampled)["--samplerate"]))
+            if click.confirm("Would you like honeytail to sample this log?", default=False):
+                flags = sampled + self.recommend_sampling_keys()
+        click.echo("Based on that, honeytail will run with " + " ".join("{}={}".format(f, v) for f, v in flags))
+        if self.debug:
+            click.echo("scanned {} bytes, {} events over {} seconds; burstiness {:.1f}".format(
+                stats.bytes_scanned, stats.events, stats.seconds, stats.burstiness))
+        return flags
+
+
+    def get_volume_stats(self, log_file):
+        """the VolumeStats for the end of log_file, or None if its timestamps
+        couldn't be read"""
+        if log_file not in self.volume_stats:
+            with TRACER.span("analyze volume " + log_file, "probe"):
+                self.volume_stats[log_file] = analyze_volume(log_file, self.parser_module, RECORD_START.get(self.parser_module))
+        return self.volume_stats[log_file]
+
+
+    def get_sampling_candidates(self):
+        """fields that make good dynamic sampling keys for this kind of log,
+        best first"""
+        return []
+
+
+    def recommend_sampling_keys(self):
+        """runs honeytail over a sample of the log, sketches how many distinct
+        values each field has, and returns the flags to sample dynamically on
+        the fields best suited to it, or [] if none are"""
+        candidates = self.get_sampling_candidates()
+        extra = []
+        for field in candidates:
+            if field in FIELD_FLAGS and FIELD_FLAGS[field] not in extra:
+                extra.append(FIELD_FLAGS[field])
+
+        self.pre_backfill_hook()
+        # --debug_stdout prints events instead of sending them.  self.tuning
+        # isn't set yet, so nothing is sampled away.
+        command = " ".join(self.get_backfill_lines("-") + ["{}={}".format(f, v) for f, v in extra]) + " --debug_stdout"
+        with TRACER.span("field cardinality " + self.log_file, "probe"):
+            samples = sample_log(self.log_file, RECORD_START.get(self.parser_module))
+            p = Popen(command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            out, err = p.communicate(b"".join(samples))
+            events = parse_debug_events(out)
+            fields = field_cardinalities(events)
+        if p.returncode != 0 or not events:
+            if self.debug:
+                self.warn("parsing a sample of {} failed, exit status {}:".format(self.log_file, p.returncode))
+                self.warn(err)
+            return []
+
+        if self.debug:
+            for field in sorted(fields, key=lambda f: fields[f].cardinality):
+                click.echo("  {}: ~{} distinct values in {} of {} events".format(
+                    field, fields[field].cardinality, fields[field].present, len(events)))
+        keys = choose_sampling_keys(fields, len(events), candidates)
+        if not keys:
+            return []
+        click.echo("Events will be sampled dynamically on {}, so rare values are kept and common ones sampled harder.".format(
+            " and ".join(keys)))
+        return key_flags(keys, extra)
+
+
+    def get_tuning_line(self, backfill=False):
+        """the tuned flags as a command line, or None.  Backfills are bulk
+        loads, so they don't get the flags for keeping up with a live log."""
+        flags = [(f, v) for f, v in self.tuning if not backfill or f not in SENDING_FLAGS]
+        if not flags:
+            return None
+        return " ".join("{}={}".format(f, v) for f, v in flags)
+
+
+    def get_bytes_per_sec(self):
+        """honeytail's throughput on this host, as the probe and earlier
+        backfills measured it, or None if nothing has"""
+        return self.calibration.bytes_per_sec(self.parser_module)
+
+
+    def estimate_ingest_time(self, file_size, take_or_be, workers=1):
+        """estimates how long honeytail will take over file_size bytes, using
+        the throughput measured on this host if we have it"""
+        bytes_per_sec = self.get_bytes_per_sec() or DEFAULT_BYTES_PER_SEC
+        return estimate_ingest_time(file_size, take_or_be, bytes_per_sec * workers)
+
+
     def prompt_for_log_file(self):
         log_file = click.prompt("Please enter the path to your {} log file".format(self.installer_name))
         click.echo()
@@ -299,36 +776,117 @@ It can also backfill existing logs, which can get you started with more data in
         click.secho("    {}".format(lines[-1]), bold=True)
 
 
-    def _format_line(self, line, honeytail_cmd, log_file):
+    def _format_line(self, line, honeytail_cmd, log_file, parser_extra_flags=None, parser_module=None):
+        if parser_extra_flags is None:
+            parser_extra_flags = self.parser_extra_flags
         return line.format(honeytail_cmd=honeytail_cmd,
-                           parser_module=self.parser_module,
-                           parser_extra_flags=self.parser_extra_flags,
+                           parser_module=parser_module or self.parser_module,
+                           parser_extra_flags=parser_extra_flags,
                            writekey=self.writekey,
                            dataset=self.dataset,
                            log_file=log_file)
 
 
-    def get_tail_lines(self, log_file):
+    def get_tail_lines(self, log_file, statefile=None, parser_extra_flags=None, parser_module=None):
+        """log_file can also be a list of files parsed the same way, for one
+        honeytail to tail them all"""
         honeytail_cmd = os.path.abspath(self.honeytail_loc)
+        log_files = [log_file] if isinstance(log_file, basestring) else log_file
 
-        return map(lambda l: self._format_line(l, honeytail_cmd, log_file), [
+        lines = map(lambda l: self._format_line(l, honeytail_cmd, log_files[0], parser_extra_flags, parser_module), [
             "{honeytail_cmd}",
             """--parser="{parser_module}" {parser_extra_flags}""",
             """--writekey="{writekey}" --dataset="{dataset}" """,
-            """--file="{log_file}" """
         ])
+        lines += ["""--file="{}" """.format(path) for path in log_files]
+        tuning = self.get_tuning_line()
+        if tuning:
+            lines.insert(2, tuning)
+        if statefile:
+            lines.append("""--tail.read_from=last --tail.statefile="{}" """.format(statefile))
+        return lines
 
 
-    def get_backfill_lines(self, log_file):
+    def get_state_path(self, kind, log_file, ext):
+        """where we keep kind of state about log_file between runs"""
+        name = os.path.abspath(log_file).strip("/").replace("/", "_")
+        return os.path.join(STATE_DIR, kind, name + ext)
+
+
+    def get_tail_statefile(self, log_file):
+        """where the tail of log_file keeps its honeytail state"""
+        return self.get_state_path("tail", log_file, ".state")
+
+
+    def get_tail_groups(self):
+        """[(parser_module, parser_extra_flags, [log_file])]: the files to
+        tail, one honeytail per group"""
+        return [(self.parser_module, self.parser_extra_flags, [self.log_file])]
+
+
+    def get_checkpoint(self):
+        """returns the Checkpoint to record the log file's backfill in: an
+        earlier, interrupted one if the user wants to resume it, otherwise a
+        new one"""
+        path = self.get_state_path("backfill", self.log_file, ".json")
+        st = os.stat(self.log_file)
+        checkpoint = Checkpoint.load(path, st)
+        if checkpoint and checkpoint.done < checkpoint.total:
+            click.echo("An earlier backfill of {log_file} stopped after {:.1f} of {:.1f} MB.".format(
+                float(checkpoint.done) / sizeM, float(checkpoint.total) / sizeM, log_file=self.log_file))
+            if click.confirm("Would you like to resume it?", default=True):
+                return checkpoint
+        return Checkpoint(path, st)
+
+
+    def get_backfill_lines(self, log_file, parser_extra_flags=None, parser_module=None):
         honeytail_cmd = os.path.abspath(self.honeytail_loc)
 
-        return map(lambda l: self._format_line(l, honeytail_cmd, log_file), [
+        lines = map(lambda l: self._format_line(l, honeytail_cmd, log_file, parser_extra_flags, parser_module), [
             "{honeytail_cmd}",
             """--parser="{parser_module}" {parser_extra_flags}""",
             "--backfill",
             """--writekey="{writekey}" --dataset="{dataset}" """,
             """--file="{log_file}" """
         ])
+        tuning = self.get_tuning_line(backfill=True)
+        if tuning:
+            lines.insert(2, tuning)
+        return lines
+
+
+    def get_limits(self):
+        """the ResourceLimits supervised honeytails run under"""
+        if self.limits is None:
+            self.limits = ResourceLimits(self.honeytail_max_memory and self.honeytail_max_memory * sizeM,
+                                         self.honeytail_max_cpu)
+            if self.limits.method == "nice":
+                if self.honeytail_max_cpu:
+                    self.warn("cgroups aren't available, so honeytail will run at a lower priority instead of with a CPU limit.")
+                if self.honeytail_max_memory:
+                    self.warn("cgroups aren't available, so honeytail's memory can't be limited.")
+        return self.limits
+
+
+    def run_honeytail(self, command, restart=False):
+        """runs a honeytail command to completion and returns its exit status.
+        With --supervise it runs without a shell, within the resource limits,
+        and (if restart is set) is restarted whenever it exits unexpectedly."""
+        if not self.supervise:
+            return spawn(command, shell=True).wait()
+        return self.get_supervisor(command, restart).run()
+
+
+    def get_supervisor(self, command, restart=False):
+        return Supervisor(shlex.split(command), self.get_limits(), restart=restart, popen=spawn, log=self.warn)
+
+
+    def spawn_honeytail(self, command, **kwargs):
+        """starts a honeytail command and returns its Popen.  Backfills call
+        this from pool threads, so it raises SpawnError rather than exiting."""
+        if not self.supervise:
+            return spawn(command, shell=True, **kwargs)
+        return spawn(shlex.split(command), preexec_fn=self.get_limits().preexec, **kwargs)
 
 
     def backfill(self, file_size):
@@ -336,6 +894,18 @@ It can also backfill existing logs, which can get you started with more data in
 
         self.pre_backfill_hook()
 
+        start = self.get_backfill_start()
+        # backfill exactly up to the snapshot, whatever gets written meanwhile
+        # is the tail's
+        end = self.snapshot.offset if self.snapshot else None
+        checkpoint = self.get_checkpoint()
+        # a log too big to comfortably start over on is backfilled in pieces,
+        # so an interrupted backfill can resume from the last one finished
+        if checkpoint.segments or end is not None or self.backfill_workers > 1 or start > 0 or file_size > PIECE_SIZE:
+            self.segmented_backfill(start, end, checkpoint)
+            self.backfill_rotated()
+            return
+
         backfill_lines = self.get_backfill_lines(self.log_file)
 
         backfill_command = " ".join(backfill_lines)
@@ -345,46 +915,361 @@ It can also backfill existing logs, which can get you started with more data in
 
         click.echo("Backfilling by running the following command:")
         self.print_lines(backfill_lines)
-
-        click.echo("""
-Feel free to run the above command after replacing the --file argument with other,
-rotated log files in order to backfill more data. You can run the command at any time.""")
         click.echo()
 
-        estimate = estimate_ingest_time(file_size, "take")
+        estimate = self.estimate_ingest_time(file_size, "take")
         click.secho("Backfilling from {log_file} - {estimate}".format(log_file=self.log_file, estimate=estimate))
-        subprocess.call(backfill_command, shell=True)
+        began = time.time()
+        if self.watch_backfill(backfill_command) == 0:
+            self.record_throughput(file_size, time.time() - began)
         self.success("Done backfilling from {log_file}".format(log_file=self.log_file))
         click.echo()
 
+        self.backfill_rotated()
+
+
+    def watch_backfill(self, command):
+        """runs a honeytail backfill of the log file, drawing a progress bar
+        from how far it has read into the file (per /proc/<pid>/fdinfo).
+        Returns its exit status."""
+        length = os.stat(self.log_file).st_size
+        p = self.spawn_honeytail(command)
+        try:
+            with self.get_progress_bar(length) as bar:
+                while p.poll() is None:
+                    offset = read_offset(p.pid, self.log_file)
+                    if offset is not None:
+                        bar.set(offset)
+                    time.sleep(PROGRESS_INTERVAL)
+                if p.returncode == 0:
+                    bar.set(length)
+        except KeyboardInterrupt:
+            # honeytail is in our process group, so it got the ^C too
+            p.wait()
+            raise
+        return p.returncode
+
+
+    def get_progress_bar(self, length, start=0):
+        """the bar backfills show their progress, throughput and ETA on,
+        starting at start bytes done (by an earlier run)"""
+        return ThroughputBar(length, self.probe.bytes_per_event if self.probe else None, start=start)
+
+
+    def get_backfill_start(self):
+        """returns the byte offset of the log file to start backfilling from:
+        0, or the first record logged since --backfill-since"""
+        if self.backfill_start is None:
+            self.backfill_start = 0
+            if self.backfill_since is not None:
+                self.backfill_start = find_offset_since(self.log_file, self.backfill_since, self.parser_module,
+                                                        RECORD_START.get(self.parser_module))
+        return self.backfill_start
+
+
+    def segmented_backfill(self, start=0, end=None, checkpoint=None):
+        """splits the log from start onwards (up to end, if given) into pieces on
+        record boundaries and backfills them with several honeytail processes at
+        once, each reading its piece on stdin.  Progress is recorded in
+        checkpoint, and if it holds an earlier backfill's, that is resumed."""
+        backfill_lines = self.get_backfill_lines("-")
+
+        backfill_command = " ".join(backfill_lines)
+
+        if self.debug:
+            backfill_command += " --debug"
+
+        record_start = RECORD_START.get(self.parser_module)
+        resuming = checkpoint is not None and bool(checkpoint.segments)
+        completed = 0
+        if resuming:
+            completed = checkpoint.done
+            # and what's been logged since the earlier backfill, up to the
+            # snapshot if there is one, otherwise to the end of the file
+            segments = checkpoint.remaining() + split_segments(
+                self.log_file, self.backfill_workers, record_start, checkpoint.end, end)
+        else:
+            segments = split_segments(self.log_file, self.backfill_workers, record_start, start, end)
+        # resumed segments aren't contiguous, so add them up
+        file_size = sum(e - s for s, e in segments)
+        if not segments:
+            if checkpoint:
+                checkpoint.remove()
+            self.warn("Nothing in {log_file} to backfill.".format(log_file=self.log_file))
+            return
+        if checkpoint:
+            checkpoint.begin(segments)
+
+        if resuming:
+            click.echo("Resuming the backfill of {log_file} with {:.1f} MB left to go.".format(
+                float(file_size) / sizeM, log_file=self.log_file))
+        elif start > 0:
+            click.echo("Skipping the first {} bytes of {log_file}, which were logged before {since}.".format(
+                start, log_file=self.log_file, since=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.backfill_since))))
+
+        if len(segments) > 1:
+            click.echo("Backfilling {log_file} in {count} pieces, piping each one into the following command:".format(
+                log_file=self.log_file, count=len(segments)))
+        else:
+            click.echo("Backfilling {log_file} by piping it into the following command:".format(log_file=self.log_file))
+        self.print_lines(backfill_lines)
+        click.echo()
+
+        workers = min(self.backfill_workers, len(segments))
+        estimate = self.estimate_ingest_time(file_size, "take", workers)
+        click.secho("Backfilling from {log_file} with {workers} worker{s} - {estimate}".format(
+            log_file=self.log_file, workers=workers, s="s" if workers > 1 else "", estimate=estimate))
+
+        def spawn(index, start, end):
+            return self.spawn_honeytail(backfill_command, stdin=subprocess.PIPE)
+
+        # the pieces are piped in, and pipes have no read position to watch,
+        # so the bar goes by what's been written into them
+        bar = self.get_progress_bar(completed + file_size, completed)
+
+        def done(result):
+            if result.returncode != 0:
+                bar.echo(click.style("  piece {}/{} (bytes {}-{}) failed: honeytail exited with status {}".format(
+                    result.index+1, len(segments), result.start, result.end, result.returncode), fg="yellow"))
+            else:
+                bar.echo("  piece {}/{} done: {:.1f} MB in {:.1f}s".format(
+                    result.index+1, len(segments), float(result.written) / sizeM, result.elapsed))
+
+        began = time.time()
+        try:
+            with bar:
+                results = run_segments(self.log_file, segments, spawn, self.backfill_workers, on_done=done,
+                                       progress=bar.add, checkpoint=checkpoint, record_start=record_start,
+                                       piece_size=PIECE_SIZE if checkpoint else None)
+        except (KeyboardInterrupt, SpawnError):
+            if checkpoint:
+                checkpoint.save()
+                self.warn("Backfill interrupted; run the installer again to pick up where it left off.")
+            raise
+        elapsed = max(time.time() - began, 0.001)
+
+        total = sum(r.written for r in results)
+        click.echo("Backfilled {:.1f} MB in {:.1f}s ({:.1f} MB/s)".format(
+            float(total) / sizeM, elapsed, float(total) / sizeM / elapsed))
+
+        failed = [r for r in results if r.returncode != 0 or r.written != r.end - r.start]
+        if not failed:
+            self.record_throughput(total // workers, elapsed)
+        if failed:
+            self.error("{} of {} pieces of {} did not backfill completely.".format(len(failed), len(results), self.log_file))
+            self.error("You can run the installer again to resume the backfill, or backfill those byte ranges yourself with the above command.")
+        else:
+            if checkpoint:
+                checkpoint.remove()
+            self.success("Done backfilling from {log_file}".format(log_file=self.log_file))
+        click.echo()
+
+
+    def record_throughput(self, size, elapsed):
+        """feeds a completed backfill's per-worker throughput into the
+        calibration; small runs are dominated by startup, so skip those"""
+        if size >= 10 * sizeM and elapsed > 0:
+            self.calibration.record(self.parser_module, size / elapsed)
+
+
+    def backfill_rotated(self):
+        """finds rotated copies of the log file and offers to backfill them too,
+        streaming compressed ones through a decompressor into honeytail"""
+        rotated = find_rotated_logs(self.log_file)
+        if self.snapshot:
+            # if the live log was rotated while we backfilled it, the rest of
+            # it is handed over with the tail
+            rotated = [path for path in rotated if not self.snapshot.matches(os.stat(path))]
+        starts = {}
+        if self.backfill_since is not None:
+            # anything last written before the window has nothing we want
+            rotated = [path for path in rotated if os.path.getmtime(path) >= self.backfill_since]
+            # and in the rest, skip what was logged before it
+            record_start = RECORD_START.get(self.parser_module)
+            for path in [path for path in rotated if not is_compressed(path)]:
+                starts[path] = find_offset_since(path, self.backfill_since, self.parser_module, record_start)
+            rotated = [path for path in rotated if starts.get(path, 0) < os.stat(path).st_size]
+            compressed = [path for path in rotated if is_compressed(path)]
+            if compressed:
+                self.warn("We can't skip to --backfill-since in compressed logs, so {} will be backfilled in full.".format(
+                    ", ".join(compressed)))
+        unreadable = [path for path in rotated if not can_open_log(path)]
+        if unreadable:
+            self.warn("Skipping {} rotated log{} we have no xz to decompress: {}".format(
+                len(unreadable), "s" if len(unreadable) > 1 else "", ", ".join(unreadable)))
+            rotated = [path for path in rotated if path not in unreadable]
+        if not rotated:
+            return
+
+        click.echo("We also found these rotated copies of {log_file}, oldest first:".format(log_file=self.log_file))
+        total_size = 0
+        for path in rotated:
+            size = os.stat(path).st_size - starts.get(path, 0)
+            total_size += size
+            click.echo("    {} ({:.1f} MB)".format(path, float(size) / sizeM))
+        click.echo()
+        if not click.confirm("Would you like to backfill them as well?", default=True):
+            click.echo("""
+Feel free to run the above command at any time after replacing the --file argument
+with one of the rotated log files. For compressed files, use --file=- and pipe in
+the output of zcat, bzcat or xzcat.""")
+            click.echo()
+            return
+
+        backfill_command = " ".join(self.get_backfill_lines("-"))
+
+        if self.debug:
+            backfill_command += " --debug"
+
+        workers = min(self.backfill_workers, len(rotated))
+        estimate = self.estimate_ingest_time(total_size, "take", workers)
+        click.secho("Backfilling {count} rotated logs with {workers} worker{s} - {estimate}".format(
+            count=len(rotated), workers=workers, s="s" if workers > 1 else "", estimate=estimate))
+
+        def spawn(index, path):
+            return self.spawn_honeytail(backfill_command, stdin=subprocess.PIPE)
+
+        def done(result):
+            if result.error:
+                self.warn("  {} failed: {}".format(result.path, result.error))
+            elif result.returncode != 0:
+                self.warn("  {} failed: honeytail exited with status {}".format(result.path, result.returncode))
+            else:
+                click.echo("  {} done: {:.1f} MB in {:.1f}s".format(
+                    result.path, float(result.written) / sizeM, result.elapsed))
+
+        began = time.time()
+        # a worker thread can't sys.exit like Popen does, so let it raise
+        popen = lambda args, **kwargs: TracedPopen(args, **replace_subprocess_env(**kwargs))
+        results = run_files(rotated, spawn, self.backfill_workers, on_done=done, popen=popen, starts=starts)
+        elapsed = max(time.time() - began, 0.001)
+
+        total = sum(r.written for r in results)
+        click.echo("Backfilled {:.1f} MB of rotated logs in {:.1f}s ({:.1f} MB/s)".format(
+            float(total) / sizeM, elapsed, float(total) / sizeM / elapsed))
+
+        failed = [r for r in results if r.error or r.returncode != 0]
+        if failed:
+            self.error("{} of {} rotated logs did not backfill completely.".format(len(failed), len(results)))
+        else:
+            self.success("Done backfilling rotated logs")
+        click.echo()
+
 
     def tail(self, after_backfill):
         """run honeytail and send new events from log.  after_backfill is true if this step was done after calling the backfill() method"""
 
         self.pre_tail_hook(after_backfill)
 
-        tail_lines = self.get_tail_lines(self.log_file)
+        groups = self.get_tail_groups()
+        commands = []
+        for parser_module, parser_extra_flags, log_files in groups:
+            statefile = None
+            if after_backfill and self.snapshot:
+                statefile = self.get_handoff_statefile(log_files)
 
-        command = " ".join(tail_lines)
-
-        if self.debug:
-            command += " --debug"
+            tail_lines = self.get_tail_lines(log_files, statefile, parser_extra_flags, parser_module)
+            command = " ".join(tail_lines)
+            if self.debug:
+                command += " --debug"
+            commands.append((tail_lines, command))
 
+        s = "s" if len(commands) > 1 else ""
         if after_backfill:
-            msg = "Switching to real-time events by running the following command"
+            msg = "Switching to real-time events by running the following command" + s
         else:
-            msg = "Sending real-time events by running the following command"
+            msg = "Sending real-time events by running the following command" + s
 
         click.echo(msg)
-        self.print_lines(tail_lines)
+        for tail_lines, command in commands:
+            self.print_lines(tail_lines)
 
         click.echo("""
-You can interrupt the installer at any point and run the above honeytail command yourself,
-or add it to system startup scripts.
-""")
+You can interrupt the installer at any point and run the above honeytail command{s} yourself,
+or add {them} to system startup scripts.
+""".format(s=s, them="them" if s else "it"))
+
+        log_count = sum(len(group[-1]) for group in groups)
+        if log_count > 1:
+            click.secho("Sending new data from {} logs with {} honeytail{s}".format(log_count, len(commands), s=s))
+        else:
+            click.secho("Sending new data from {log_file}".format(log_file=groups[0][-1][0]))
+
+        if len(commands) == 1:
+            self.run_honeytail(commands[0][1], restart=True)
+            return
+
+        if not self.supervise:
+            run_pool(lambda command: self.run_honeytail(command, restart=True),
+                     [command for tail_lines, command in commands], len(commands))
+            return
+
+        # signal handlers can only be installed from the main thread, so do it
+        # once here for all the supervisors
+        supervisors = [self.get_supervisor(command, restart=True) for tail_lines, command in commands]
+        with forward_signals(supervisors):
+            run_pool(lambda supervisor: supervisor.supervise(), supervisors, len(supervisors))
 
-        click.secho("Sending new data from {log_file}".format(log_file=self.log_file))
-        subprocess.call(command, shell=True)
+
+    def get_handoff_statefile(self, log_files):
+        """the state file for the tail of log_files, seeded to start where the
+        backfill snapshot ended, or None if the snapshot isn't of any of them"""
+        if self.log_file not in log_files:
+            return None
+        statefile = self.get_tail_statefile(self.log_file)
+        if len(log_files) > 1:
+            # with several files, honeytail wants a directory to
+            # keep a state file per file in
+            statefile = os.path.splitext(statefile)[0]
+            self.hand_off_snapshot(os.path.join(statefile, os.path.basename(self.log_file) + ".leash.state"))
+        else:
+            self.hand_off_snapshot(statefile)
+        return statefile
+
+
+    def take_snapshots(self):
+        """notes where the live log ends, for the backfill to stop and the
+        tail to start at"""
+        self.snapshot = take_snapshot(self.log_file, RECORD_START.get(self.parser_module))
+
+
+    def hand_off_snapshot(self, statefile):
+        """seeds the tail's state file so it starts where the backfill
+        snapshot ended.  If the log was rotated since, the rest of the old
+        file is backfilled first and the tail starts at the top of the new one."""
+        st = os.stat(self.log_file)
+        if self.snapshot.matches(st):
+            write_tail_state(statefile, self.snapshot.inode, self.snapshot.offset)
+            return
+
+        self.warn("{log_file} was rotated during the backfill.".format(log_file=self.log_file))
+        for path in find_rotated_logs(self.log_file):
+            if self.snapshot.matches(os.stat(path)):
+                self.backfill_remainder(path)
+                break
+        else:
+            self.warn("We couldn't find where it was rotated to, so events logged to it after the backfill may be missing.")
+        write_tail_state(statefile, st.st_ino, 0)
+
+
+    def backfill_remainder(self, path):
+        """backfills what was written to path, the rotated live log, after
+        the snapshot was taken"""
+        end = os.stat(path).st_size
+        if end <= self.snapshot.offset:
+            return
+        backfill_command = " ".join(self.get_backfill_lines("-"))
+        if self.debug:
+            backfill_command += " --debug"
+
+        click.echo("Backfilling the last {} bytes of {path}".format(end - self.snapshot.offset, path=path))
+
+        def spawn(index, start, end):
+            return self.spawn_honeytail(backfill_command, stdin=subprocess.PIPE)
+
+        results = run_segments(path, [(self.snapshot.offset, end)], spawn, 1)
+        if results[0].returncode != 0 or results[0].written != end - self.snapshot.offset:
+            self.error("Bytes {}-{} of {} did not backfill completely.".format(self.snapshot.offset, end, path))
 
 
     def show_backfill_command(self):
@@ -393,9 +1278,15 @@ or add it to system startup scripts.
         self.print_lines(backfill_lines)
 
     def show_tail_command(self):
-        tail_lines = self.get_tail_lines(self.log_file)
-        click.echo("To tail and send real-time events from {}, run this command:".format(self.log_file))
-        self.print_lines(tail_lines)
+        groups = self.get_tail_groups()
+        if len(groups) == 1 and len(groups[0][-1]) == 1:
+            click.echo("To tail and send real-time events from {}, run this command:".format(groups[0][-1][0]))
+        else:
+            click.echo("To tail and send real-time events from all {} logs, run {}:".format(
+                sum(len(group[-1]) for group in groups),
+                "these commands" if len(groups) > 1 else "this command"))
+        for parser_module, parser_extra_flags, log_files in groups:
+            self.print_lines(self.get_tail_lines(log_files, parser_extra_flags=parser_extra_flags, parser_module=parser_module))
 
     def show_commands(self):
         """prints out the commands for backfilling and tailing"""
@@ -440,6 +1331,8 @@ or add it to system startup scripts.
         self.success("Using log file at {log_file}".format(log_file=self.log_file))
 
     def backfill_and_tail(self):
+        self.wait_for_honeytail()
+
         mode, file_size = self.prompt_for_run_mode()
 
         if mode == SHOW_COMMANDS:
@@ -454,6 +1347,7 @@ a query against your new {installer_name} data:
 """.format(installer_name=self.installer_name, team_slug=self.team_slug, dataset=urllib.quote(self.dataset.lower())))
 
         if mode == BACKFILL_AND_TAIL:
+            self.take_snapshots()
             self.backfill(file_size)
             self.tail(after_backfill=True)
         elif mode == ONLY_BACKFILL:
@@ -481,8 +1375,18 @@ a query against your new {installer_name} data:
         ]
 
 
-        for i in xrange(0, len(steps)):
-            self.output_step(i+1, len(steps), steps[i][0])
-            steps[i][1]()
+        try:
+            for i in xrange(0, len(steps)):
+                self.output_step(i+1, len(steps), steps[i][0])
+                with TRACER.span(steps[i][0]):
+                    steps[i][1]()
+        except SpawnError as e:
+            self.error(str(e))
+            sys.exit(1)
+        finally:
+            if self.limits:
+                self.limits.close()
+            if self.trace_file:
+                TRACER.write(self.trace_file, installer=self.installer_name, version=self.installer_version)
 
         click.echo(emoji.emojize(":sparkles: Done."))
@@ -0,0 +1,142 @@
+"""samples a log file to measure its events, and keeps a per-host record of
+how fast honeytail gets through them so backfill estimates improve over time"""
+import json
+import os
+
+from backfill import (RecordCounter, find_record_boundary)
+
+SAMPLE_SIZE = 1024 * 1024
+
+# used until we've timed honeytail on this host; a rough figure for a
+# single honeytail on a single core
+DEFAULT_BYTES_PER_SEC = 5 * 1024 * 1024
+
+# how much weight a new measurement gets against the stored calibration
+CALIBRATION_WEIGHT = 0.5
+
+# parsing a sample faster than this is too close to noise in honeytail's
+# startup to time
+MIN_PARSE_TIME = 0.05
+
+
+def sample_log(path, record_start=None, sample_size=SAMPLE_SIZE):
+    """reads up to sample_size bytes of whole records from the head, middle
+    and tail of path.  Returns a list of the samples (fewer if the file is
+    small enough that they'd overlap)."""
+    with open(path, "rb") as fh:
+        fh.seek(0, 2)
+        size = fh.tell()
+        if size <= 3 * sample_size:
+            fh.seek(0)
+            return [fh.read()]
+
+        samples = []
+        for offset in (0, (size - sample_size) // 2, size - sample_size):
+            start = find_record_boundary(fh, offset, record_start)
+            end = find_record_boundary(fh, min(start + sample_size, size), record_start)
+            fh.seek(start)
+            samples.append(fh.read(end - start))
+        return samples
+
+
+def count_events(data, record_start=None):
+    counter = RecordCounter(record_start)
+    for line in data.splitlines():
+        counter.add(line)
+    return counter.records
+
+
+class LogProbe(object):
+    """what sampling a log file told us about it"""
+    def __init__(self, file_size, sample_bytes, sample_events, densities):
+        self.file_size = file_size
+        self.sample_bytes = sample_bytes
+        self.sample_events = sample_events
+        # events per MB in each of the sampled regions
+        self.densities = densities
+        # filled in if honeytail was timed on the sample
+        self.honeytail_bytes_per_sec = None
+        self.honeytail_events = None
+
+    @property
+    def bytes_per_event(self):
+        if not self.sample_events:
+            return None
+        return float(self.sample_bytes) / self.sample_events
+
+    @property
+    def projected_events(self):
+        if not self.sample_events:
+            return 0
+        return int(self.file_size / self.bytes_per_event)
+
+
+def probe_log(path, record_start=None, sample_size=SAMPLE_SIZE):
+    """samples path and returns a LogProbe along with the samples themselves"""
+    samples = sample_log(path, record_start, sample_size)
+    densities = []
+    sample_bytes = sample_events = 0
+    for sample in samples:
+        events = count_events(sample, record_start)
+        sample_bytes += len(sample)
+        sample_events += events
+        if sample:
+            densities.append(events * 1024.0 * 1024.0 / len(sample))
+    return LogProbe(os.stat(path).st_size, sample_bytes, sample_events, densities), samples
+
+
+def net_bytes_per_sec(sample_bytes, elapsed, startup):
+    """honeytail's throughput over sample_bytes that took elapsed seconds,
+    less the startup seconds it took on no input at all, or None if the
+    parsing itself was too quick to tell from the startup"""
+    parse_time = elapsed - startup
+    if parse_time < MIN_PARSE_TIME:
+        return None
+    return sample_bytes / parse_time
+
+
+class Calibration(object):
+    """honeytail throughput measured on this host, per parser, stored as json"""
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as fh:
+                self.data = json.load(fh)
+        except (IOError, ValueError):
+            self.data = {}
+
+    def bytes_per_sec(self, parser_module):
+        entry = self.data.get(parser_module)
+        if not entry:
+            return None
+        return entry["bytes_per_sec"]
+
+    def record(self, parser_module, bytes_per_sec):
+        """blends a new measurement into the stored one and saves it"""
+        entry = self.data.get(parser_module)
+        if entry:
+            bytes_per_sec = (1 - CALIBRATION_WEIGHT) * entry["bytes_per_sec"] + CALIBRATION_WEIGHT * bytes_per_sec
+            entry = {"bytes_per_sec": bytes_per_sec, "measurements": entry.get("measurements", 0) + 1}
+        else:
+            entry = {"bytes_per_sec": bytes_per_sec, "measurements": 1}
+        self.data[parser_module] = entry
+        try:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as fh:
+                json.dump(self.data, fh)
+            os.rename(tmp, self.path)
+        except (IOError, OSError):
+            # calibration is only an optimization; carry on without it
+            pass
+
+
+def format_duration(seconds):
+    if seconds < 90:
+        return "under a couple minutes"
+    if seconds < 90 * 60:
+        return "about {} minutes".format(int(round(seconds / 60.0)))
+    if seconds < 36 * 3600:
+        return "about {:.1f} hours".format(seconds / 3600.0)
+    return "about {:.1f} days".format(seconds / 86400.0)
@@ -0,0 +1,153 @@
+"""progress reporting for backfills: how far honeytail has read, and how fast"""
+import os
+import threading
+import time
+
+import click
+
+sizeM = 1024 * 1024
+
+# when the bar is hidden, each redraw is a whole line of output
+LOG_INTERVAL = 10
+
+
+def child_pids(pid):
+    """returns the pids of pid's direct children"""
+    try:
+        with open("/proc/{0}/task/{0}/children".format(pid)) as fh:
+            return [int(p) for p in fh.read().split()]
+    except IOError:
+        pass
+    # older kernels don't have the children file; look for our pid as a parent
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/{}/stat".format(entry)) as fh:
+                # the command name is in parens and may contain spaces
+                ppid = int(fh.read().rsplit(")", 1)[1].split()[1])
+        except (IOError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+def read_offset(pid, path):
+    """returns how far pid, or one of its children (eg under a shell), has
+    read into path according to /proc/<pid>/fdinfo, or None if it doesn't
+    have path open"""
+    target = os.path.realpath(path)
+    pending = [pid]
+    while pending:
+        p = pending.pop(0)
+        fd_dir = "/proc/{}/fd".format(p)
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                if os.readlink(os.path.join(fd_dir, fd)) != target:
+                    continue
+                with open("/proc/{}/fdinfo/{}".format(p, fd)) as fh:
+                    for line in fh:
+                        if line.startswith("pos:"):
+                            return int(line.split()[1])
+            except (IOError, OSError, ValueError):
+                continue
+        pending.extend(child_pids(p))
+    return None
+
+
+def format_eta(seconds):
+    seconds = int(seconds)
+    return "{:02d}:{:02d}:{:02d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class ThroughputBar(object):
+    """a click progressbar labelled with MB/s, events/s and an ETA, which
+    several threads can update at once.  Redraws at most every interval
+    seconds, or every LOG_INTERVAL seconds when output isn't a terminal.
+    A resumed backfill's bar starts at start, the bytes done before, which
+    don't count towards the rate."""
+    def __init__(self, length, bytes_per_event=None, interval=0.5, start=0):
+        self.length = length
+        self.bytes_per_event = bytes_per_event
+        self.interval = interval
+        self.start = start
+        self.lock = threading.Lock()
+        self.done = start
+        self.pending = 0
+        self.began = None
+        self.last_render = 0
+        self.bar = None
+
+    def __enter__(self):
+        self.began = time.time()
+        # the ETA is in our label, from the rate over the whole run rather
+        # than click's average of the last few updates
+        self.bar = click.progressbar(length=self.length, show_eta=False, show_percent=True, width=36)
+        self.bar.__enter__()
+        self.bar.update(self.start)
+        if self.bar.is_hidden:
+            self.interval = max(self.interval, LOG_INTERVAL)
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self._flush()
+        return self.bar.__exit__(*exc_info)
+
+    def add(self, count):
+        with self.lock:
+            self.pending += count
+            if time.time() - self.last_render >= self.interval:
+                self._flush()
+
+    def set(self, position):
+        """moves the bar to an absolute position"""
+        with self.lock:
+            self.pending = position - self.done
+            if time.time() - self.last_render >= self.interval:
+                self._flush()
+
+    def echo(self, msg):
+        """prints msg on its own line without leaving a half-drawn bar behind"""
+        with self.lock:
+            if not self.bar.is_hidden:
+                click.echo("\r\033[K", nl=False)
+            click.echo(msg)
+            if not self.bar.is_hidden:
+                self.bar.render_progress()
+
+    def rate(self, position, elapsed):
+        """bytes a second, having got to position in elapsed seconds"""
+        return (position - self.start) / max(elapsed, 0.001)
+
+    def eta(self, position, elapsed):
+        """seconds left at the rate so far, or None until there is one"""
+        rate = self.rate(position, elapsed)
+        if not rate:
+            return None
+        return max(self.length - position, 0) / rate
+
+    def label(self, position, elapsed, percent=False):
+        rate = self.rate(position, elapsed)
+        label = "{:.1f} MB/s".format(rate / sizeM)
+        if self.bytes_per_event:
+            label += ", {:.0f} events/s".format(rate / self.bytes_per_event)
+        eta = self.eta(position, elapsed)
+        if eta is not None:
+            label += ", ETA " + format_eta(eta)
+        if percent:
+            label = "{:.0f}% done, {}".format(100.0 * position / max(self.length, 1), label)
+        return label
+
+    def _flush(self):
+        self.last_render = time.time()
+        self.bar.label = self.label(self.done + self.pending, self.last_render - self.began, self.bar.is_hidden)
+        pending, self.pending = self.pending, 0
+        self.done += pending
+        self.bar.update(pending)
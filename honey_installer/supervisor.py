@@ -0,0 +1,162 @@
+"""runs honeytail without a shell, restarting it if it dies and keeping it
+inside cpu and memory limits so it doesn't compete with the database"""
+import contextlib
+import os
+import signal
+import subprocess
+import time
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+# cpu.max period, in microseconds
+CGROUP_CPU_PERIOD = 100000
+# niceness used to approximate a cpu limit when cgroups aren't available
+FALLBACK_NICE = 10
+
+# restart backoff, in seconds
+BACKOFF_INITIAL = 1
+BACKOFF_MAX = 60
+# a child that ran at least this long was healthy, so the backoff starts over
+HEALTHY_RUNTIME = 60
+
+FORWARDED_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGHUP)
+STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+
+class ResourceLimits(object):
+    """cpu (percent of one core) and memory (bytes) limits for a child,
+    enforced with a cgroup v2 group when we can create one.  Otherwise the
+    cpu limit is approximated with nice(2) and memory isn't limited: the Go
+    runtime reserves far more address space than it uses, so RLIMIT_DATA or
+    RLIMIT_AS would make honeytail fail at startup rather than cap it."""
+    def __init__(self, memory_limit=None, cpu_limit=None):
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.cgroup = None
+        if memory_limit or cpu_limit:
+            self.cgroup = self._make_cgroup()
+
+    @property
+    def method(self):
+        if not self.memory_limit and not self.cpu_limit:
+            return None
+        return "cgroup" if self.cgroup else "nice"
+
+    def _make_cgroup(self):
+        if not os.path.isfile(os.path.join(CGROUP_ROOT, "cgroup.controllers")):
+            return None
+        path = os.path.join(CGROUP_ROOT, "honeytail-{}".format(os.getpid()))
+        try:
+            if not os.path.isdir(path):
+                os.mkdir(path)
+            if self.memory_limit:
+                with open(os.path.join(path, "memory.max"), "w") as fh:
+                    fh.write(str(self.memory_limit))
+            if self.cpu_limit:
+                with open(os.path.join(path, "cpu.max"), "w") as fh:
+                    fh.write("{} {}".format(int(CGROUP_CPU_PERIOD * self.cpu_limit / 100.0), CGROUP_CPU_PERIOD))
+        except (IOError, OSError):
+            self._remove_cgroup(path)
+            return None
+        return path
+
+    def _remove_cgroup(self, path):
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+    def preexec(self):
+        """runs in the child between fork and exec.  Anything raised here
+        would fail the spawn, so if joining the cgroup fails the child falls
+        back to nice."""
+        if self.cgroup:
+            try:
+                with open(os.path.join(self.cgroup, "cgroup.procs"), "w") as fh:
+                    fh.write(str(os.getpid()))
+                return
+            except (IOError, OSError):
+                pass
+        if self.cpu_limit:
+            os.nice(FALLBACK_NICE)
+
+    def close(self):
+        if self.cgroup:
+            self._remove_cgroup(self.cgroup)
+            self.cgroup = None
+
+
+@contextlib.contextmanager
+def forward_signals(supervisors):
+    """passes INT/TERM/HUP on to the children of each of supervisors while
+    the body runs.  Only the main thread can install signal handlers, so
+    supervisors run on other threads need this done for them."""
+    def _forward(signum, frame):
+        for supervisor in supervisors:
+            supervisor.forward(signum)
+
+    previous = dict((s, signal.signal(s, _forward)) for s in FORWARDED_SIGNALS)
+    try:
+        yield
+    finally:
+        for s, handler in previous.items():
+            signal.signal(s, handler)
+
+
+class Supervisor(object):
+    """runs argv, forwarding INT/TERM/HUP to it.  With restart=True, a child
+    that exits without being asked to is restarted with exponential backoff.
+    run() must be called on the main thread; to supervise from another,
+    call supervise() inside forward_signals()."""
+    def __init__(self, argv, limits=None, restart=True, popen=subprocess.Popen, log=None, **kwargs):
+        self.argv = argv
+        self.limits = limits or ResourceLimits()
+        self.restart = restart
+        self.popen = popen
+        self.log = log or (lambda msg: None)
+        self.kwargs = kwargs
+        self.child = None
+        self.stopping = False
+        self.restarts = 0
+
+    def _preexec(self):
+        # our own process group, so a ^C at the terminal reaches only us and
+        # we decide how to pass it on
+        os.setpgrp()
+        self.limits.preexec()
+
+    def forward(self, signum):
+        if signum in STOP_SIGNALS:
+            self.stopping = True
+        if self.child and self.child.returncode is None:
+            try:
+                os.kill(self.child.pid, signum)
+            except OSError:
+                pass
+
+    def run(self):
+        """returns the exit status of the last child"""
+        with forward_signals([self]):
+            return self.supervise()
+
+    def supervise(self):
+        """runs the child until it's done, without installing any signal
+        handlers.  Returns the exit status of the last child."""
+        backoff = BACKOFF_INITIAL
+        while True:
+            began = time.time()
+            self.child = self.popen(self.argv, preexec_fn=self._preexec, **self.kwargs)
+            returncode = self.child.wait()
+            runtime = time.time() - began
+
+            if self.stopping or not self.restart:
+                return returncode
+
+            if runtime >= HEALTHY_RUNTIME:
+                backoff = BACKOFF_INITIAL
+            self.restarts += 1
+            self.log("honeytail exited with status {} after {:.0f}s; restarting in {}s (restart #{})".format(
+                returncode, runtime, backoff, self.restarts))
+            time.sleep(backoff)
+            if self.stopping:
+                return returncode
+            backoff = min(backoff * 2, BACKOFF_MAX)
@@ -0,0 +1,174 @@
+"""parses the timestamps out of nginx, mysql and mongo log lines, and finds
+where in a log file a given time starts"""
+import calendar
+import re
+import time
+
+MONTHS = dict((m, i+1) for i, m in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]))
+
+# 2016-10-01T12:00:00.123+0000, 2016-10-01T12:00:00+00:00, 2016-10-01T12:00:00.123456Z
+ISO8601 = re.compile(r"(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(\.\d+)?(Z|[+-]\d{2}:?\d{2})?")
+# nginx $time_local: 01/Oct/2016:12:00:00 -0700
+TIME_LOCAL = re.compile(r"(\d{2})/([A-Z][a-z]{2})/(\d{4}):(\d{2}):(\d{2}):(\d{2}) ([+-]\d{4})")
+# mysql < 5.7: "# Time: 161001 12:00:00", 5.7+: "# Time: 2016-10-01T12:00:00.123456Z"
+MYSQL_TIME = re.compile(r"^# Time: (\d{2})(\d{2})(\d{2}) +(\d{1,2}):(\d{2}):(\d{2})")
+MYSQL_SET_TIMESTAMP = re.compile(r"^SET timestamp=(\d+);")
+# mongo 2.4: "Sat Oct  1 12:00:00.123"
+MONGO_CTIME = re.compile(r"^[A-Z][a-z]{2} ([A-Z][a-z]{2}) +(\d+) (\d{2}):(\d{2}):(\d{2})")
+
+SINCE_DURATION = re.compile(r"^(\d+(?:\.\d+)?)\s*([smhd])$")
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+PROBE_WINDOW = 64 * 1024
+
+
+def _tz_offset(tz):
+    """turns Z, +0530 or -07:00 into seconds east of UTC"""
+    if not tz or tz == "Z":
+        return 0
+    tz = tz.replace(":", "")
+    offset = int(tz[1:3]) * 3600 + int(tz[3:5]) * 60
+    return -offset if tz[0] == "-" else offset
+
+
+def _utc(year, month, day, hour, minute, second):
+    return calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0))
+
+
+def _local(year, month, day, hour, minute, second):
+    return time.mktime((year, month, day, hour, minute, second, 0, 0, -1))
+
+
+def _parse_iso(match):
+    year, month, day, hour, minute, second = [int(g) for g in match.groups()[:6]]
+    if match.group(8) is None:
+        # no zone given, so the log is in the server's local time
+        return _local(year, month, day, hour, minute, second)
+    return _utc(year, month, day, hour, minute, second) - _tz_offset(match.group(8))
+
+
+def parse_nginx_timestamp(line):
+    match = TIME_LOCAL.search(line)
+    if match:
+        day, month, year, hour, minute, second, tz = match.groups()
+        if month not in MONTHS:
+            return None
+        return _utc(int(year), MONTHS[month], int(day), int(hour), int(minute), int(second)) - _tz_offset(tz)
+    match = ISO8601.search(line)
+    if match:
+        return _parse_iso(match)
+    return None
+
+
+def parse_mysql_timestamp(line):
+    match = MYSQL_SET_TIMESTAMP.match(line)
+    if match:
+        return float(match.group(1))
+    if not line.startswith("# Time: "):
+        return None
+    match = MYSQL_TIME.match(line)
+    if match:
+        year, month, day, hour, minute, second = [int(g) for g in match.groups()]
+        return _local(2000 + year, month, day, hour, minute, second)
+    match = ISO8601.match(line, len("# Time: "))
+    if match:
+        return _parse_iso(match)
+    return None
+
+
+def parse_mongo_timestamp(line):
+    match = ISO8601.match(line)
+    if match:
+        return _parse_iso(match)
+    match = MONGO_CTIME.match(line)
+    if match and match.group(1) in MONTHS:
+        # 2.4 logs leave out the year; assume it's this one
+        month, day, hour, minute, second = match.groups()
+        return _local(time.localtime().tm_year, MONTHS[month], int(day), int(hour), int(minute), int(second))
+    return None
+
+
+TIMESTAMP_PARSERS = {
+    "nginx": parse_nginx_timestamp,
+    "mysql": parse_mysql_timestamp,
+    "mongo": parse_mongo_timestamp,
+    # nginx's escape=json logs, with a $time_local or $time_iso8601 field
+    "json": parse_nginx_timestamp,
+}
+
+
+def parse_since(value, now=None):
+    """turns a --backfill-since value (a duration like 6h/30m/2d, or an ISO
+    8601 time) into a unix timestamp.  Raises ValueError if it's neither."""
+    value = value.strip()
+    match = SINCE_DURATION.match(value)
+    if match:
+        if now is None:
+            now = time.time()
+        return now - float(match.group(1)) * DURATION_UNITS[match.group(2)]
+    match = ISO8601.match(value)
+    if match and match.end() == len(value):
+        return _parse_iso(match)
+    try:
+        return _local(*[int(p) for p in value.split("-")] + [0, 0, 0])
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("expected a duration like 6h, 30m or 2d, or a time like 2016-10-01T12:00:00")
+
+
+def _first_timestamp(fh, offset, end, parse_timestamp):
+    """returns (timestamp, line_offset, next_line_offset) for the first line at or
+    after offset (skipping a partial line) that has a timestamp, or (None, end, end)"""
+    fh.seek(max(0, offset - 1))
+    if offset > 0 and fh.read(1) != b"\n":
+        fh.readline()
+    while True:
+        pos = fh.tell()
+        if pos >= end:
+            return None, end, end
+        line = fh.readline()
+        if not line:
+            return None, end, end
+        ts = parse_timestamp(line)
+        if ts is not None:
+            return ts, pos, fh.tell()
+
+
+def find_offset_since(path, since, parser_module, record_start=None):
+    """bisects path for the first record logged at or after the unix time
+    since, assuming the log is in time order.  Returns the byte offset that
+    record starts at, or the file size if every record is older."""
+    parse_timestamp = TIMESTAMP_PARSERS[parser_module]
+    with open(path, "rb") as fh:
+        fh.seek(0, 2)
+        size = fh.tell()
+
+        lo, hi = 0, size
+        while hi - lo > PROBE_WINDOW:
+            mid = (lo + hi) // 2
+            ts, pos, next_pos = _first_timestamp(fh, mid, hi, parse_timestamp)
+            if ts is not None and ts < since:
+                lo = next_pos
+            else:
+                hi = mid
+
+        # lo is now at most one window before the answer; scan forward,
+        # remembering where the current record started
+        fh.seek(max(0, lo - 1))
+        if lo > 0 and fh.read(1) != b"\n":
+            fh.readline()
+        record_pos = fh.tell()
+        in_header = False
+        while True:
+            pos = fh.tell()
+            line = fh.readline()
+            if not line:
+                return size
+            matched = record_start is None or record_start.match(line) is not None
+            if matched and not in_header:
+                record_pos = pos
+            # the rest of a header run belongs to the record its first line started
+            in_header = matched and record_start is not None and record_start.header_run
+            ts = parse_timestamp(line)
+            if ts is not None and ts >= since:
+                return record_pos
@@ -0,0 +1,103 @@
+"""records how long each part of an installer run takes, so slow steps can
+be found across a fleet by aggregating the --trace output"""
+import contextlib
+import json
+import platform
+import re
+import resource
+import threading
+import time
+
+# keep credentials out of traces.  A quoted value runs to its closing quote,
+# spaces and all.
+SECRET_ARG = re.compile(r"""(--(?:password|writekey|mysql\.pass)[= ])("[^"]*"?|'[^']*'?|[^"'\s]+)""")
+
+
+def redact(args):
+    if not isinstance(args, basestring):
+        args = " ".join(args)
+    return SECRET_ARG.sub(r"\1<redacted>", args)
+
+
+def _read_bytes():
+    """bytes this process has read via read(2) and friends so far, or None
+    where /proc isn't available"""
+    try:
+        with open("/proc/self/io") as fh:
+            for line in fh:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+
+def process_totals():
+    """CPU seconds used and bytes read by this process and its reaped
+    children so far.  These are shared by every thread, so they're reported
+    for the whole run rather than per span."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "cpu_user": round(own.ru_utime + children.ru_utime, 6),
+        "cpu_sys": round(own.ru_stime + children.ru_stime, 6),
+        "bytes_read": _read_bytes(),
+    }
+
+
+class Tracer(object):
+    def __init__(self):
+        self.started = time.time()
+        self.spans = []
+        self.children = 0
+        self.lock = threading.Lock()
+
+    def _record(self, name, kind, began, attrs):
+        span = {
+            "name": name,
+            "kind": kind,
+            "thread": threading.current_thread().name,
+            "start": round(began - self.started, 6),
+            "wall": round(time.time() - began, 6),
+        }
+        span.update(attrs)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    @contextlib.contextmanager
+    def span(self, name, kind="step", **attrs):
+        """times the body of a with statement.  Extra keyword arguments end
+        up in the span, and the yielded dict can be filled in as it runs."""
+        began = time.time()
+        extra = dict(attrs)
+        try:
+            yield extra
+        finally:
+            self._record(name, kind, began, extra)
+
+    def start_process(self, args):
+        """notes a child process starting; returns a token for end_process"""
+        with self.lock:
+            self.children += 1
+        return time.time()
+
+    def end_process(self, args, token, returncode):
+        self._record(redact(args), "subprocess", token, {"returncode": returncode})
+
+    def write(self, path, **attrs):
+        trace = {
+            "host": platform.node(),
+            "platform": platform.system().lower(),
+            "started": self.started,
+            "wall": round(time.time() - self.started, 6),
+            "children": self.children,
+            "process": process_totals(),
+            "spans": sorted(self.spans, key=lambda s: s["start"]),
+        }
+        trace.update(attrs)
+        with open(path, "w") as fh:
+            json.dump(trace, fh, indent=2, sort_keys=True)
+
+
+TRACER = Tracer()
@@ -0,0 +1,181 @@
+"""measures how much traffic a log file records per second, from its own
+timestamps, and picks honeytail's sending flags to suit"""
+import math
+import mmap
+import os
+
+from backfill import RecordCounter
+from timestamps import TIMESTAMP_PARSERS
+
+# how much of the end of the log to look at; recent traffic is what the tail
+# will have to keep up with
+SCAN_BYTES = 64 * 1024 * 1024
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# honeytail's defaults, for reference: --poolsize=80 --send_frequency_ms=100
+# --send_batch_size=50 --samplerate=1
+MIN_POOLSIZE = 4
+MAX_POOLSIZE = 200
+MIN_BATCH_SIZE = 50
+MAX_BATCH_SIZE = 1000
+# batches a connection can be expected to send each second, allowing for
+# half a second of round trip and upload for a full batch
+BATCHES_PER_CONNECTION = 2
+# above this many events per second, offer to sample
+SAMPLE_ABOVE = 10000
+
+# the flags that only matter for keeping up with a live log
+SENDING_FLAGS = ("--poolsize", "--send_frequency_ms", "--send_batch_size")
+
+
+class VolumeStats(object):
+    """events per second over the part of a log we scanned"""
+    def __init__(self, events, bytes_scanned, counts):
+        self.events = events
+        self.bytes_scanned = bytes_scanned
+        # events logged in each second that had any
+        self.counts = counts
+        if counts:
+            self.first = min(counts)
+            self.seconds = max(counts) - self.first + 1
+        else:
+            self.first = None
+            self.seconds = 0
+
+    @property
+    def mean(self):
+        if not self.seconds:
+            return 0.0
+        return float(self.events) / self.seconds
+
+    def percentile(self, pct):
+        """the per-second event count pct% of seconds are at or below,
+        counting the seconds nothing was logged in"""
+        if not self.seconds:
+            return 0
+        nonzero = sorted(self.counts.itervalues())
+        zeros = self.seconds - len(nonzero)
+        rank = int(math.ceil(pct / 100.0 * self.seconds)) - 1
+        if rank < zeros:
+            return 0
+        return nonzero[min(rank - zeros, len(nonzero) - 1)]
+
+    @property
+    def p99(self):
+        return self.percentile(99)
+
+    @property
+    def peak(self):
+        return max(self.counts.itervalues()) if self.counts else 0
+
+    @property
+    def burstiness(self):
+        """how far above the average the busy seconds go"""
+        if not self.mean:
+            return 0.0
+        return self.p99 / self.mean
+
+    @property
+    def bytes_per_event(self):
+        if not self.events:
+            return None
+        return float(self.bytes_scanned) / self.events
+
+
+def _chunks(mm, start, end, chunk_size):
+    """yields the lines of mm[start:end] a chunk at a time, each chunk ending
+    on a newline"""
+    pos = start
+    while pos < end:
+        stop = min(pos + chunk_size, end)
+        if stop < end:
+            newline = mm.rfind(b"\n", pos, stop)
+            if newline >= 0:
+                stop = newline + 1
+        yield mm[pos:stop].splitlines()
+        pos = stop
+
+
+def analyze_volume(path, parser_module, record_start=None, scan_bytes=SCAN_BYTES, chunk_size=CHUNK_SIZE):
+    """scans the last scan_bytes of path and returns a VolumeStats, or None
+    if the file is empty or has no timestamps we understand"""
+    parse_timestamp = TIMESTAMP_PARSERS.get(parser_module)
+    if parse_timestamp is None:
+        return None
+    size = os.stat(path).st_size
+    if not size:
+        return None
+
+    counts = {}
+    events = 0
+    # records seen since the last timestamp; mysql only logs "# Time:" when
+    # the second changes, so they get the next timestamp found
+    pending = 0
+    last = None
+    counter = RecordCounter(record_start)
+    with open(path, "rb") as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = max(0, size - scan_bytes)
+            if start:
+                start = mm.find(b"\n", start) + 1 or size
+            for lines in _chunks(mm, start, size, chunk_size):
+                for line in lines:
+                    if counter.add(line):
+                        pending += 1
+                    ts = parse_timestamp(line)
+                    if ts is not None:
+                        last = int(ts)
+                        if pending:
+                            counts[last] = counts.get(last, 0) + pending
+                            events += pending
+                            pending = 0
+        finally:
+            mm.close()
+
+    if last is None:
+        return None
+    if pending:
+        counts[last] = counts.get(last, 0) + pending
+        events += pending
+    return VolumeStats(events, size - start, counts)
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def peak_rate(stats):
+    """the events per second honeytail should be sized for: the 99th
+    percentile second rather than the average"""
+    return max(stats.p99, stats.mean, 1)
+
+
+def tune_flags(stats, target=None):
+    """returns [(flag, value)] for honeytail suited to stats' traffic, and if
+    target is given, sampled down to about target events per second"""
+    rate = peak_rate(stats)
+
+    samplerate = 1
+    if target is not None and rate > target:
+        samplerate = int(math.ceil(float(rate) / target))
+    rate = float(rate) / samplerate
+
+    # quiet hosts gain little from sending every 100ms; wait a bit longer and
+    # send fuller batches
+    if rate < 50:
+        frequency_ms = 500
+    else:
+        frequency_ms = 100
+
+    # enough room for two intervals' worth of events per batch
+    batch_size = int(_clamp(2 * rate * frequency_ms / 1000.0, MIN_BATCH_SIZE, MAX_BATCH_SIZE))
+    # and enough connections to send them with twice the headroom
+    poolsize = int(_clamp(math.ceil(2 * rate / batch_size / BATCHES_PER_CONNECTION), MIN_POOLSIZE, MAX_POOLSIZE))
+
+    return [
+        ("--poolsize", poolsize),
+        ("--send_frequency_ms", frequency_ms),
+        ("--send_batch_size", batch_size),
+        ("--samplerate", samplerate),
+    ]
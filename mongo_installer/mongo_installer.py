@@ -11,7 +11,7 @@ import yaml
 
 sys.path.append(os.path.abspath(os.path.join(os.path.basename(__file__), "..")))
 
-from honey_installer import (HoneyInstaller, get_choice, get_version, Popen)
+from honey_installer import (HoneyInstaller, get_choice, get_version, honeytail_options, Popen, TRACER)
 
 INSTALLER_NAME = "mongo"
 INSTALLER_VERSION = get_version() + "-" + platform.system().lower()
@@ -58,7 +58,8 @@ def _find_log_file():
             # try and parse yaml. If we can, we'll use it.
             with open(config_file, 'r') as stream:
                 try:
-                    cf = yaml.load(stream)
+                    with TRACER.span("parse " + config_file, "parse"):
+                        cf = yaml.load(stream)
                     logpath = cf["systemLog"]["path"]
                     # if we make it here, we've found ourselves a path
                     break
@@ -84,8 +85,8 @@ def _find_log_file():
 
 
 class MongoInstaller(HoneyInstaller):
-    def __init__(self, writekey, dataset, honeytail, debug, log_filename):
-        super(MongoInstaller, self).__init__(INSTALLER_NAME, INSTALLER_VERSION, PARSER_MODULE, "--mongo.log_partials", writekey, dataset, DEFAULT_DATASET, honeytail, debug)
+    def __init__(self, writekey, dataset, honeytail, debug, log_filename, **kwargs):
+        super(MongoInstaller, self).__init__(INSTALLER_NAME, INSTALLER_VERSION, PARSER_MODULE, "--mongo.log_partials", writekey, dataset, DEFAULT_DATASET, honeytail, debug, **kwargs)
         self.log_filename = log_filename
 
 
@@ -264,10 +265,11 @@ that you upgrade mongo.
 @click.option("--file", "-f", "log_filename", help="Mongo Log File")
 @click.option("--honeytail", help="Honeytail location", default="honeytail")
 @click.option("--debug/--no-debug", help="Turn Debug mode on", default=False)
+@honeytail_options
 @click.version_option(INSTALLER_VERSION)
-def start(writekey, dataset, log_filename, honeytail, debug):
+def start(writekey, dataset, log_filename, honeytail, debug, **options):
 
-    installer = MongoInstaller(writekey, dataset, honeytail, debug, log_filename)
+    installer = MongoInstaller(writekey, dataset, honeytail, debug, log_filename, **options)
     installer.start()
 
 if __name__ == "__main__":
@@ -8,7 +8,7 @@ import sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.basename(__file__), "..")))
 
-from honey_installer import (HoneyInstaller, get_choice, get_version, Popen)
+from honey_installer import (HoneyInstaller, get_choice, get_version, honeytail_options, Popen, call)
 
 INSTALLER_NAME = "MySQL"
 INSTALLER_VERSION = get_version() + "-" + platform.system().lower()
@@ -44,11 +44,11 @@ def _find_log_file(username, password):
 
 
 class MysqlInstaller(HoneyInstaller):
-    def __init__(self, writekey, dataset, honeytail, debug, log_filename, username, password):
+    def __init__(self, writekey, dataset, honeytail, debug, log_filename, username, password, **kwargs):
         super(MysqlInstaller, self).__init__(INSTALLER_NAME, INSTALLER_VERSION,
                                              PARSER_MODULE,
                                              "", # we'll fill this in in the pre_*_hooks below
-                                             writekey, dataset, DEFAULT_DATASET, honeytail, debug)
+                                             writekey, dataset, DEFAULT_DATASET, honeytail, debug, **kwargs)
         self.log_filename = log_filename
         self.username = username
         self.password = password
@@ -161,15 +161,15 @@ If you agree, we'll run:
 """)
             if click.confirm("Should we set the slow query log (Y) or skip it and continue (n)?", default=True):
                 failed = False
-                res = subprocess.call(_auth_mysql_cmd(MYSQL + ["-e", "SET @@global.slow_query_log = 'ON'"], username, password))
+                res = call(_auth_mysql_cmd(MYSQL + ["-e", "SET @@global.slow_query_log = 'ON'"], username, password))
                 if res != 0:
                     failed = True
                     click.echo("Failed to enable the slow query log.")
-                res = subprocess.call(_auth_mysql_cmd(MYSQL + ["-e", "SET @@global.long_query_time = 0"], username, password))
+                res = call(_auth_mysql_cmd(MYSQL + ["-e", "SET @@global.long_query_time = 0"], username, password))
                 if res != 0:
                     failed = True
                     click.echo("Failed to set long_query_time to 0.")
-                res = subprocess.call(_auth_mysql_cmd(MYSQL + ["-e", "SET @@global.log_output = 'FILE'"], username, password))
+                res = call(_auth_mysql_cmd(MYSQL + ["-e", "SET @@global.log_output = 'FILE'"], username, password))
                 if res != 0:
                     failed = True
                     click.echo("Failed to set log_output to FILE.")
@@ -218,6 +218,9 @@ honeytail might not pick up new queries flowing through your MySQL instance.
     def find_log_file(self):
         return _find_log_file(self.username, self.password)
 
+    def get_sampling_candidates(self):
+        return ["normalized_query", "tables", "user"]
+
     def pre_backfill_hook(self):
         extra_flags = ""
         if self.username != "":
@@ -248,10 +251,11 @@ In order to backfill later, use the following command:""")
 @click.option("--username", help="mysql username", default="root")
 @click.option("--password", help="mysql password", default="")
 @click.option("--debug/--no-debug", help="Turn Debug mode on", default=False)
+@honeytail_options
 @click.version_option(INSTALLER_VERSION)
-def start(writekey, dataset, log_filename, honeytail, username, password, debug):
+def start(writekey, dataset, log_filename, honeytail, username, password, debug, **options):
 
-    installer = MysqlInstaller(writekey, dataset, honeytail, debug, log_filename, username, password)
+    installer = MysqlInstaller(writekey, dataset, honeytail, debug, log_filename, username, password, **options)
     installer.start()
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+"""reads the parameters of nginx access_log directives, and works out how
+much buffering suits how fast a log is written"""
+import re
+
+SIZE = re.compile(r"^(\d+)([kKmM]?)$")
+TIME = re.compile(r"(\d+)(ms|[smhd]?)")
+TIME_UNITS = {"ms": 0.001, "": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# nginx buffers gzipped logs this much when buffer= isn't given
+GZIP_BUFFER = 64 * 1024
+
+# below this many writes a second, unbuffered logging costs next to nothing
+MIN_WRITES_PER_SEC = 50
+# with a buffer, aim for at most this many writes a second at peak
+TARGET_WRITES_PER_SEC = 10
+MIN_BUFFER = 8 * 1024
+MAX_BUFFER = 256 * 1024
+# how long nginx may hold on to events before honeytail sees them
+RECOMMENDED_FLUSH = 1
+MAX_FLUSH = 10
+
+
+def parse_size(value):
+    """an nginx size (eg 32k, 1m) in bytes, or None"""
+    match = SIZE.match(value or "")
+    if not match:
+        return None
+    return int(match.group(1)) * {"": 1, "k": 1024, "m": 1024 * 1024}[match.group(2).lower()]
+
+
+def parse_time(value):
+    """an nginx time (eg 5s, 1m30s, 500ms) in seconds, or None"""
+    if not value:
+        return None
+    seconds = 0.0
+    pos = 0
+    while pos < len(value):
+        match = TIME.match(value, pos)
+        if not match:
+            return None
+        seconds += int(match.group(1)) * TIME_UNITS[match.group(2)]
+        pos = match.end()
+    return seconds
+
+
+def format_size(size):
+    if size % (1024 * 1024) == 0:
+        return "{}m".format(size // (1024 * 1024))
+    return "{}k".format(size // 1024)
+
+
+class AccessLog(object):
+    """an access_log directive's path, log_format name and parameters"""
+    def __init__(self, path, format_name="combined", params=None):
+        self.path = path
+        self.format_name = format_name
+        self.params = params or {}
+
+    @classmethod
+    def parse(cls, args):
+        parts = args.split()
+        access_log = cls(parts[0].strip("'\"") if parts else "")
+        for part in parts[1:]:
+            name, sep, value = part.partition("=")
+            if sep or name == "gzip":
+                access_log.params[name] = value
+            else:
+                access_log.format_name = part
+        return access_log
+
+    @property
+    def gzip(self):
+        return "gzip" in self.params
+
+    @property
+    def buffer(self):
+        """the buffer size in bytes, or None if writes aren't buffered"""
+        size = parse_size(self.params.get("buffer"))
+        if size is None and self.gzip:
+            size = GZIP_BUFFER
+        return size
+
+    @property
+    def flush(self):
+        """seconds before buffered writes are flushed anyway, or None"""
+        return parse_time(self.params.get("flush"))
+
+    def writes_per_sec(self, events_per_sec, bytes_per_event):
+        """roughly how many write calls nginx makes a second"""
+        if not self.buffer:
+            return events_per_sec
+        writes = float(events_per_sec) * bytes_per_event / self.buffer
+        if self.flush:
+            writes = max(writes, min(events_per_sec, 1 / self.flush))
+        return writes
+
+    def latency(self, events_per_sec, bytes_per_event):
+        """the longest an event waits in the buffer, in seconds"""
+        if not self.buffer:
+            return 0
+        fill = float(self.buffer) / max(events_per_sec * bytes_per_event, 1)
+        return min(fill, self.flush) if self.flush else fill
+
+
+def recommend_buffering(peak_events_per_sec, bytes_per_event):
+    """the (buffer, flush) that keeps nginx to a few writes a second at peak
+    while honeytail sees events within RECOMMENDED_FLUSH seconds, or None if
+    the log is written too slowly to need buffering"""
+    if peak_events_per_sec < MIN_WRITES_PER_SEC:
+        return None
+    size = MIN_BUFFER
+    while size < MAX_BUFFER and size * TARGET_WRITES_PER_SEC < peak_events_per_sec * bytes_per_event:
+        size *= 2
+    return size, RECOMMENDED_FLUSH
@@ -0,0 +1,74 @@
+"""an index of the directives in a parsed nginx config, built in a single
+pass over the tree, so lookups by directive or log_format name don't have to
+walk it again"""
+
+# nginx predefines this format; configs can use it without defining it
+COMBINED_FORMAT = 'combined \'$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent "$http_referer" "$http_user_agent"\''
+
+
+class Directive(object):
+    """one directive: its name, the raw text of its arguments, the blocks
+    it's in (outermost first, each as [header, children]) and its file"""
+    __slots__ = ("name", "args", "item", "blocks", "source")
+
+    def __init__(self, name, args, item, blocks, source):
+        self.name = name
+        self.args = args
+        self.item = item
+        self.blocks = blocks
+        self.source = source
+
+    @property
+    def context(self):
+        """eg "http > server > location /api" """
+        return " > ".join(" ".join(block[0]) for block in self.blocks)
+
+
+class ConfigIndex(object):
+    def __init__(self, tree):
+        self.tree = tree
+        # name: [Directive], in config order
+        self.directives = {}
+        # log_format name: Directive
+        self.log_formats = {}
+        self._build(tree)
+
+    def _build(self, tree):
+        # an explicit stack rather than recursion, however deep the nesting
+        stack = [(iter(tree), ())]
+        while stack:
+            items, blocks = stack[-1]
+            item = next(items, None)
+            if item is None:
+                stack.pop()
+                continue
+            if not isinstance(item, list) or not item:
+                # the loose strings of a spliced-in if or set statement
+                continue
+            if isinstance(item[0], list):
+                stack.append((iter(item[1]), blocks + (item,)))
+                continue
+            self._add(Directive(item[0], item[1] if len(item) > 1 else "", item, blocks, getattr(item, "source", None)))
+
+    def _add(self, directive):
+        self.directives.setdefault(directive.name, []).append(directive)
+        if directive.name == "log_format":
+            parts = directive.args.split(None, 1)
+            # the first definition of a name is the one nginx uses
+            if parts and parts[0] not in self.log_formats:
+                self.log_formats[parts[0]] = directive
+
+    def find(self, name):
+        return self.directives.get(name, [])
+
+    def access_logs(self):
+        """the access_log directives that aren't turned off"""
+        return [d for d in self.find("access_log") if d.args.split()[:1] != ["off"]]
+
+    def log_format(self, name):
+        """the log_format directive defining name, or None.  combined is
+        always defined."""
+        directive = self.log_formats.get(name)
+        if directive is None and name == "combined":
+            directive = Directive("log_format", COMBINED_FORMAT, ["log_format", COMBINED_FORMAT], (), None)
+        return directive
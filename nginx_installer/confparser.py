@@ -0,0 +1,141 @@
+"""a single-pass tokenizer and recursive descent parser for nginx configs.
+
+It produces the same tree as NginxParser(source).as_list():
+
+    directive:  ['listen', '80']      (the raw text of the arguments)
+    block:      [['location', '~', '/x'], [directive, block, ...]]
+    if:         'if', '($cond) ', followed by the if's contents, spliced into
+                the enclosing block, unless the condition is one word
+
+but takes linear time, copes with quoted strings containing ; { and }, and
+reads blocks with any number of arguments (map, split_clients, ...), where
+the pyparsing grammar gives up part way through the file.
+"""
+import re
+
+
+class NginxConfigError(ValueError):
+    pass
+
+
+_QUOTED = r""""(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'"""
+TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>\#[^\n]*)
+  | (?P<punct>[{};])
+  | (?P<word>(?:%(q)s|\\.|[^\s{};"'\\\#])(?:%(q)s|\\.|[^\s{};"'\\])*)
+""" % {"q": _QUOTED}, re.VERBOSE | re.DOTALL)
+
+# location modifiers, which the pyparsing grammar allows before a block's argument
+MODIFIERS = ("=", "~*", "~", "^~")
+
+
+class _Token(object):
+    __slots__ = ("kind", "text", "start", "end")
+
+    def __init__(self, kind, text, start, end):
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.end = end
+
+
+def tokenize(source):
+    """yields the _Tokens of source other than whitespace; punctuation has
+    itself as its kind"""
+    pos = 0
+    end = len(source)
+    match = TOKEN.match
+    while pos < end:
+        m = match(source, pos)
+        if m is None:
+            raise NginxConfigError("line {}: unterminated quote".format(source.count("\n", 0, pos) + 1))
+        kind = m.lastgroup
+        if kind != "space":
+            text = m.group()
+            yield _Token(text if kind == "punct" else kind, text, pos, m.end())
+        pos = m.end()
+
+
+class _Parser(object):
+    def __init__(self, source):
+        self.source = source
+        self.tokens = tokenize(source)
+
+    def error(self, token, msg):
+        pos = token.start if token else len(self.source)
+        raise NginxConfigError("line {}: {}".format(self.source.count("\n", 0, pos) + 1, msg))
+
+    def next(self, comments=False):
+        for token in self.tokens:
+            if comments or token.kind != "comment":
+                return token
+        return None
+
+    def parse_block(self, top=False):
+        items = []
+        while True:
+            token = self.next()
+            if token is None:
+                if not top:
+                    self.error(None, "unexpected end of file, expecting \"}\"")
+                return items
+            if token.kind == "}":
+                if top:
+                    self.error(token, "unexpected \"}\"")
+                return items
+            if token.kind != "word":
+                self.error(token, "unexpected \"{}\"".format(token.kind))
+            self.parse_statement(token, items)
+
+    def parse_statement(self, name, items):
+        args = []
+        # where the arguments' raw text starts: after the whitespace
+        # following the name, comments and all
+        first = None
+        while True:
+            token = self.next(comments=True)
+            if token is None:
+                self.error(None, "unexpected end of file, expecting \";\" or \"}\"")
+            if token.kind not in ("word", "comment"):
+                break
+            if first is None:
+                first = token.start
+            if token.kind == "word":
+                args.append(token)
+
+        raw = self.source[first:token.start] if first is not None else ""
+        if token.kind == ";":
+            if name.text == "set" and any("{" in a.text or "}" in a.text for a in args):
+                # the grammar only takes these as a flat set statement
+                items.extend([name.text, raw])
+            elif raw:
+                items.append([name.text, raw])
+            else:
+                items.append([name.text])
+        elif token.kind == "{":
+            children = self.parse_block()
+            if name.text == "if" and not self.is_simple_header(name, args):
+                items.extend([name.text, raw])
+                items.extend(children)
+            else:
+                items.append([[name.text] + [a.text for a in args], children])
+        else:
+            self.error(token, "unexpected \"}\", expecting \";\"")
+
+    def is_simple_header(self, name, args):
+        """whether the grammar's block rule (a name, maybe a modifier, maybe
+        one argument) would have matched this header"""
+        if not args:
+            return True
+        if args[0].start == name.end or len(args) > 2:
+            return False
+        if len(args) == 2 and args[0].text not in MODIFIERS:
+            return False
+        return "," not in args[-1].text
+
+
+def loads(source):
+    """parses an nginx config into the tree NginxParser.as_list() returns.
+    Raises NginxConfigError if it isn't syntactically valid."""
+    return _Parser(source).parse_block(top=True)
@@ -0,0 +1,90 @@
+"""measures how many bytes each variable of an access log contributes to its
+events, and which of them could be dropped or scrubbed"""
+import math
+import re
+
+# values honeytail's --scrub_field replaces a field with are sha256 hex digests
+HASH_BYTES = 64
+
+# variables that are credentials whenever they're set
+SECRET_VARIABLES = re.compile(r"^(http_authorization|http_cookie|cookie_\w+|http_x_api_key|http_x_auth_token)$")
+# query parameters that usually carry session tokens or keys
+SECRET_PARAM = re.compile(r"[?&][^=&\s]*(token|session|sessid|sid|auth|key|secret|passw(or)?d|signature|sig)[^=&\s]*=[^&\s\"]+",
+                          re.IGNORECASE)
+
+# a variable averaging this many bytes or more is worth a look
+LARGE_FIELD = 64
+# and if its values carry less than this fraction of their size in
+# information (the entropy of how often each value occurs), it's mostly
+# repetition
+LOW_INFORMATION = 0.05
+# too useful to suggest dropping, however big or repetitive
+KEEP_VARIABLES = set(["request", "request_uri", "uri", "status", "host", "server_name", "time_local", "time_iso8601"])
+
+
+class FieldSize(object):
+    def __init__(self, name):
+        self.name = name
+        self.bytes = 0
+        self.present = 0
+        self.counts = {}
+        self.secrets = 0
+
+    def add(self, value):
+        self.present += 1
+        self.bytes += len(value)
+        self.counts[value] = self.counts.get(value, 0) + 1
+        if SECRET_PARAM.search(value):
+            self.secrets += 1
+
+    @property
+    def mean_bytes(self):
+        return float(self.bytes) / self.present if self.present else 0.0
+
+    @property
+    def entropy_bytes(self):
+        """bits of information per value, in bytes"""
+        bits = 0.0
+        for count in self.counts.itervalues():
+            p = float(count) / self.present
+            bits -= p * math.log(p, 2)
+        return bits / 8
+
+
+def measure_fields(lines, regex, variables):
+    """splits lines with a compiled log_format and returns ({variable:
+    FieldSize}, lines matched, bytes in the lines matched)"""
+    fields = dict((v, FieldSize(v)) for v in variables)
+    matched = total = 0
+    for line in lines:
+        line = line.rstrip("\r\n")
+        match = regex.match(line)
+        if not match:
+            continue
+        matched += 1
+        total += len(line)
+        for variable, value in match.groupdict().iteritems():
+            if value is not None and value != "-" and value != "":
+                fields[variable].add(value)
+    return fields, matched, total
+
+
+def recommend_field_flags(fields, matched):
+    """returns [(flag, field, reason, bytes saved)] for the fields worth
+    dropping or scrubbing, largest saving first"""
+    recs = []
+    for name, field in fields.iteritems():
+        if not field.present:
+            continue
+        if SECRET_VARIABLES.match(name) or field.secrets:
+            reason = "holds credentials" if SECRET_VARIABLES.match(name) else \
+                     "has session tokens or keys in {} of {} values".format(field.secrets, field.present)
+            recs.append(("--scrub_field", name, reason, max(0, field.bytes - HASH_BYTES * field.present)))
+        elif name in KEEP_VARIABLES:
+            continue
+        elif len(field.counts) == 1 and field.present == matched:
+            recs.append(("--drop_field", name, "is always {!r}".format(field.counts.keys()[0]), field.bytes))
+        elif field.mean_bytes >= LARGE_FIELD and field.entropy_bytes < LOW_INFORMATION * field.mean_bytes:
+            recs.append(("--drop_field", name, "averages {:.0f} bytes but only {} distinct values".format(
+                field.mean_bytes, len(field.counts)), field.bytes))
+    return sorted(recs, key=lambda r: -r[3])
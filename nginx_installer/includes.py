@@ -0,0 +1,113 @@
+"""resolves the include directives in an nginx config, reading and parsing
+each included file once and splicing them into one tree"""
+import glob
+import os
+
+
+class SourceList(list):
+    """a directive or block from the tree, remembering the file it's from"""
+    def __init__(self, items, source):
+        super(SourceList, self).__init__(items)
+        self.source = source
+
+
+def tag_source(tree, source):
+    """returns a copy of tree with every list in it a SourceList from source"""
+    return SourceList([tag_source(item, source) if isinstance(item, list) else item for item in tree], source)
+
+
+def is_include(item):
+    return isinstance(item, list) and len(item) == 2 and item[0] == "include" and isinstance(item[1], basestring)
+
+
+def include_paths(pattern, prefix):
+    """the files an include's argument names, in the order nginx reads them"""
+    pattern = pattern.strip().strip("'\"")
+    if not os.path.isabs(pattern):
+        pattern = os.path.join(prefix, pattern)
+    if glob.has_magic(pattern):
+        return sorted(glob.glob(pattern))
+    return [pattern]
+
+
+def _find_includes(tree):
+    for item in tree:
+        if is_include(item):
+            yield item[1]
+        elif isinstance(item, list):
+            for pattern in _find_includes(item):
+                yield pattern
+
+
+class IncludeResolver(object):
+    """loads an nginx config and everything it includes.  parse(source, path)
+    turns a file's contents into a tree; prefix is what relative include
+    paths are relative to, by default the main config's directory."""
+    def __init__(self, parse, prefix=None, warn=None):
+        self.parse = parse
+        self.prefix = prefix
+        self.warn = warn or (lambda msg: None)
+        # realpath: tree, or None if it couldn't be read
+        self.trees = {}
+
+    def load(self, conf_loc):
+        """returns the tree for conf_loc with its includes spliced in.  Errors
+        reading conf_loc itself propagate."""
+        if self.prefix is None:
+            self.prefix = os.path.dirname(os.path.abspath(conf_loc))
+        self.trees[os.path.realpath(conf_loc)] = self._read(conf_loc, required=True)
+
+        # read the files each round of includes names until there are no new
+        # ones.  Parsing is CPU bound, so threads wouldn't speed this up.
+        pending = self._new_includes([conf_loc])
+        while pending:
+            for path in pending:
+                self.trees[os.path.realpath(path)] = self._read(path)
+            pending = self._new_includes(pending)
+
+        return self._splice(conf_loc, [])
+
+    def _read(self, path, required=False):
+        try:
+            with open(path) as fh:
+                source = fh.read()
+        except IOError as e:
+            if required:
+                raise
+            self.warn("couldn't read {}, included from the nginx config: {}".format(path, e.strerror))
+            return None
+        return tag_source(self.parse(source, path), path)
+
+    def _new_includes(self, paths):
+        new = []
+        for path in paths:
+            tree = self.trees.get(os.path.realpath(path))
+            for pattern in _find_includes(tree or []):
+                for include in include_paths(pattern, self.prefix):
+                    real = os.path.realpath(include)
+                    if real not in self.trees and include not in new:
+                        self.trees[real] = None
+                        new.append(include)
+        return new
+
+    def _splice(self, path, stack):
+        real = os.path.realpath(path)
+        if real in stack:
+            self.warn("skipping an include cycle in the nginx config: {}".format(" -> ".join(stack + [real])))
+            return SourceList([], path)
+        tree = self.trees.get(real)
+        if tree is None:
+            return SourceList([], path)
+        return self._expand(tree, stack + [real])
+
+    def _expand(self, tree, stack):
+        expanded = SourceList([], tree.source)
+        for item in tree:
+            if is_include(item):
+                for include in include_paths(item[1], self.prefix):
+                    expanded.extend(self._splice(include, stack))
+            elif isinstance(item, list):
+                expanded.append(self._expand(item, stack))
+            else:
+                expanded.append(item)
+        return expanded
@@ -0,0 +1,202 @@
+"""turns an nginx log_format into a regex for splitting access log lines into
+their variables, the way honeytail's nginx parser does, checks how well a
+log's lines match one, and writes JSON equivalents of them"""
+import json
+import re
+import time
+
+# $name or ${name}
+VARIABLE = re.compile(r"\$(?:\{(\w+)\}|(\w+))")
+
+# how much of the end of the log to check a format against
+RECENT_BYTES = 1024 * 1024
+# failing lines to keep as examples
+MAX_FAILURES = 3
+
+# variables that are always numbers, so needn't be quoted in JSON
+NUMERIC_VARIABLES = set(["status", "body_bytes_sent", "bytes_sent", "request_length", "request_time",
+                         "connection", "connection_requests", "msec"])
+TIME_VARIABLES = set(["time_local", "time_iso8601"])
+REQUEST_PARTS = ["request_method", "request_uri", "server_protocol"]
+# variables whose values can have spaces in them (header values, lists of
+# upstreams), so need quotes around them for lines to split up again
+QUOTED_PREFIXES = ("http_", "sent_http_", "cookie_", "arg_", "upstream_")
+
+# log_format value: (regex, variables)
+_compiled = {}
+
+
+def format_string(log_format):
+    """returns the format string of a log_format directive's value (eg
+    main '$remote_addr - ' '"$request"'), without its name, escape= parameter
+    or quoting"""
+    pieces = []
+    i = 0
+    value = log_format.strip()
+    # skip the name
+    while i < len(value) and not value[i].isspace():
+        i += 1
+    while i < len(value):
+        c = value[i]
+        if c.isspace():
+            i += 1
+        elif c in "'\"":
+            end = i + 1
+            while end < len(value) and value[end] != c:
+                end += 2 if value[end] == "\\" else 1
+            pieces.append(value[i+1:end].replace("\\" + c, c))
+            i = end + 1
+        else:
+            end = i
+            while end < len(value) and not value[end].isspace():
+                end += 1
+            if not value.startswith("escape=", i):
+                pieces.append(value[i:end])
+            i = end
+    return "".join(pieces)
+
+
+def tokenize(fmt):
+    """splits a format string into [(literal, variable)], the variable being
+    None after the last literal"""
+    tokens = []
+    pos = 0
+    for match in VARIABLE.finditer(fmt):
+        tokens.append((fmt[pos:match.start()], match.group(1) or match.group(2)))
+        pos = match.end()
+    if pos < len(fmt):
+        tokens.append((fmt[pos:], None))
+    return tokens
+
+
+def compile_log_format(fmt):
+    """returns (regex, variables) for a format string.  Each variable matches
+    up to the first character of the literal after it, so it's as forgiving
+    as honeytail is of values containing spaces."""
+    tokens = tokenize(fmt)
+    pattern = ["^"]
+    variables = []
+    for i, (literal, variable) in enumerate(tokens):
+        pattern.append(re.escape(literal))
+        if variable is None:
+            continue
+        following = tokens[i+1][0] if i + 1 < len(tokens) else ""
+        value = "[^{}]*".format(re.escape(following[0])) if following else ".*"
+        if variable in variables:
+            pattern.append("(?:{})".format(value))
+        else:
+            pattern.append("(?P<{}>{})".format(variable, value))
+            variables.append(variable)
+    pattern.append("$")
+    return re.compile("".join(pattern)), variables
+
+
+def compile_directive(value):
+    """compile_log_format for a log_format directive's value, compiling each
+    distinct format only once"""
+    if value not in _compiled:
+        _compiled[value] = compile_log_format(format_string(value))
+    return _compiled[value]
+
+
+def recent_lines(path, max_bytes=RECENT_BYTES):
+    """the whole lines in the last max_bytes of path"""
+    with open(path, "rb") as fh:
+        fh.seek(0, 2)
+        size = fh.tell()
+        fh.seek(max(0, size - max_bytes))
+        data = fh.read()
+    lines = data.splitlines()
+    if size > max_bytes and lines:
+        # the first one is probably only part of a line
+        lines = lines[1:]
+    return lines
+
+
+class MatchResult(object):
+    def __init__(self, matched, total, elapsed, failures):
+        self.matched = matched
+        self.total = total
+        self.elapsed = elapsed
+        self.failures = failures
+
+    @property
+    def rate(self):
+        return float(self.matched) / self.total if self.total else 0.0
+
+    @property
+    def lines_per_sec(self):
+        return self.total / max(self.elapsed, 0.000001)
+
+
+def match_lines(regex, lines):
+    """runs regex over lines and returns a MatchResult"""
+    match = regex.match
+    failures = []
+    matched = 0
+    began = time.time()
+    for line in lines:
+        if match(line):
+            matched += 1
+        elif len(failures) < MAX_FAILURES:
+            failures.append(line)
+    return MatchResult(matched, len(lines), time.time() - began, failures)
+
+
+def json_log_format(name, variables):
+    """the lines of the value of a log_format directive called name that
+    writes variables as one JSON object per line"""
+    fields = []
+    keys = set()
+    for variable in variables:
+        key = variable
+        if variable in TIME_VARIABLES:
+            # the JSON parser finds the timestamp in a field called time
+            key, variable = "time", "time_iso8601"
+        if key in keys:
+            continue
+        keys.add(key)
+        if variable in NUMERIC_VARIABLES:
+            fields.append('"{}":${}'.format(key, variable))
+        else:
+            fields.append('"{}":"${}"'.format(key, variable))
+        if variable == "request":
+            # the nginx parser splits these out of $request; the JSON one won't
+            for part in REQUEST_PARTS:
+                if part not in variables and part not in keys:
+                    keys.add(part)
+                    fields.append('"{}":"${}"'.format(part, part))
+    lines = ["{} escape=json '{{'".format(name)]
+    lines.extend("'{}{}'".format(field, "," if i < len(fields) - 1 else "") for i, field in enumerate(fields))
+    lines.append("'}';")
+    return lines
+
+
+def json_lines(regex, lines):
+    """the lines regex matches, written as JSON objects the way an
+    escape=json log_format would write them"""
+    match = regex.match
+    converted = []
+    for line in lines:
+        m = match(line)
+        if m:
+            converted.append(json.dumps(m.groupdict()))
+    return converted
+
+
+def quote_variable(variable):
+    """$variable, in double quotes if its value can have spaces in it"""
+    variable = variable.strip('"').lstrip("$")
+    if variable.startswith(QUOTED_PREFIXES):
+        return '"${}"'.format(variable)
+    return "${}".format(variable)
+
+
+def extend_log_format(value, variables):
+    """a log_format directive's value, with variables added to the end of its
+    format, written as one quoted string"""
+    parts = value.split()
+    params = [part for part in parts[1:] if part.startswith("escape=")][:1]
+    fmt = " ".join([format_string(value)] + [quote_variable(v) for v in variables])
+    quote = "'" if fmt.count("'") <= fmt.count('"') else '"'
+    return " ".join(parts[:1] + params + [quote + fmt.replace(quote, "\\" + quote) + quote])
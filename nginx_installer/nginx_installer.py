@@ -1,18 +1,31 @@
 #!/usr/bin/env python
 
 import subprocess
+import confparser
+from accesslog import (AccessLog, MAX_FLUSH, format_size, recommend_buffering)
+from confindex import ConfigIndex
+from fieldsize import (measure_fields, recommend_field_flags)
+from includes import IncludeResolver
+from logformat import (compile_directive, extend_log_format, json_lines, json_log_format, match_lines, quote_variable,
+                       recent_lines)
+from nginxbuild import (NginxBuild, find_nginx, load_build, parse_build, save_build)
 from nginxparser import NginxParser
+from parsecache import ParseCache
+from pyparsing import ParseException
 
 import click
+import collections
 import os.path
 import platform
 import pprint
+import resource
 import semver
 import sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.basename(__file__), "..")))
 
-from honey_installer import (HoneyInstaller, get_version, check_output)
+from honey_installer import (HoneyInstaller, STATE_DIR, get_choice, get_version, honeytail_options, check_output, sample_log, Popen, TRACER,
+                             take_snapshot, write_tail_state)
 
 INSTALLER_NAME = "nginx"
 INSTALLER_VERSION = get_version() + "-" + platform.system().lower()
@@ -38,6 +51,30 @@ MESSAGES = {
     "$request_id": ("1.11.0", "add a unique ID to every request."),
 }
 
+# directives that mean requests go to backends, or get cached
+UPSTREAM_DIRECTIVES = ("proxy_pass", "fastcgi_pass", "uwsgi_pass", "scgi_pass", "grpc_pass", "memcached_pass")
+CACHE_DIRECTIVES = ("proxy_cache", "fastcgi_cache", "uwsgi_cache", "scgi_cache")
+
+PERFORMANCE_MESSAGES = {
+    # variable: (version, description, directives that make it worth logging, or None),
+    "$upstream_response_time": ("1.0.0", "How long the backend took to respond, to tell slow backends from a slow nginx.", UPSTREAM_DIRECTIVES),
+    "$upstream_connect_time": ("1.9.1", "How long it took to connect to the backend.", UPSTREAM_DIRECTIVES),
+    "$upstream_header_time": ("1.7.10", "How long the backend took to send the first byte of its response.", UPSTREAM_DIRECTIVES),
+    "$upstream_addr": ("1.0.0", "The address of the backend that handled the request, to find the slow one.", UPSTREAM_DIRECTIVES),
+    "$upstream_cache_status": ("1.0.0", "Whether the response came from nginx's cache (HIT, MISS, EXPIRED, ...).", CACHE_DIRECTIVES),
+    "$connection_requests": ("1.1.18", "How many requests have been made over this connection, to see keepalive at work.", None),
+    "$pipe": ("1.3.12", "p if the request was pipelined, otherwise a dot.", None),
+    "$ssl_protocol": ("1.0.0", "The TLS version the client connected with.", ("ssl_certificate",)),
+    "$gzip_ratio": ("1.0.0", "How much gzip shrank the response, to weigh its CPU cost against the bytes it saves.", ("gzip",)),
+}
+
+# below this share of lines matching, we look for a better log_format
+MIN_MATCH_RATE = 0.9
+
+# the log_format we suggest for JSON logs, and the first nginx that can escape them
+JSON_FORMAT_NAME = "honeycomb_json"
+JSON_MIN_VERSION = "1.11.8"
+
 NGINX_WHITELIST_LOCATIONS = [
     "/etc/nginx/nginx.conf",            # ubuntu, apt default
     "/opt/local/nginx/nginx.conf",      # was on one of my servers somewhere.
@@ -47,69 +84,143 @@ NGINX_WHITELIST_LOCATIONS = [
 ]
 
 class NginxInstaller(HoneyInstaller):
-    def __init__(self, writekey, dataset, honeytail, debug, log_filename, nginx_conf, log_format):
+    def __init__(self, writekey, dataset, honeytail, debug, log_filename, nginx_conf, log_format, all_logs=False, **kwargs):
         super(NginxInstaller, self).__init__(INSTALLER_NAME, INSTALLER_VERSION, PARSER_MODULE,
                                              "", # we'll fill this in in pre_*_hook below
-                                             writekey, dataset, DEFAULT_DATASET, honeytail, debug)
+                                             writekey, dataset, DEFAULT_DATASET, honeytail, debug, **kwargs)
         self.log_filename = log_filename
         self.nginx_conf = nginx_conf
         self.log_format = log_format
+        self.all_logs = all_logs
+        # [(nginx_conf, log_format, [log_file])] with --all-logs
+        self.log_groups = None
         self.parser_extra_flags_format = """--nginx.conf="{nginx_conf}" --nginx.format="{log_format}" """
+        # --drop_field and --scrub_field flags, whichever parser is used
+        self.field_flags = ""
+        # the escape=json log to tail with the JSON parser: one the user
+        # added, or the log itself if its format is JSON already
+        self.json_log = None
+        # where the JSON log ended when the text log's snapshot was taken
+        self.json_snapshot = None
+        self.parse_cache = ParseCache(os.path.join(STATE_DIR, "nginx"))
+        self.nginx_build = None
 
     def fixup_and_suggest(self):
         pass
 
     def pre_backfill_hook(self):
-        self.parser_extra_flags = self.parser_extra_flags_format.format(nginx_conf=self.nginx_conf, log_format=self.log_format)
+        self._set_parser()
 
     def pre_tail_hook(self, after_backfill):
-        self.parser_extra_flags = self.parser_extra_flags_format.format(nginx_conf=self.nginx_conf, log_format=self.log_format)
+        self._set_parser()
 
         if not after_backfill:
-            click.echo("""
+            if self.parser_module == "json":
+                click.echo("\nWhen you're ready to backfill, use the following command")
+                self.print_lines(self.get_backfill_lines(self.log_filename))
+            else:
+                click.echo("""
 In order to backfill later, you should
 snag a copy of the nginx config to preserve the current log config.
 Please make a copy:
     cp {} ~/
 
 When you're ready to backfill, use the following command""".format(self.nginx_conf))
-            home_conf = "~/{}".format(os.path.basename(self.nginx_conf))
-            self.print_lines(map(lambda line: line.replace(self.nginx_conf, home_conf), self.get_backfill_lines(self.log_filename)))
+                home_conf = "~/{}".format(os.path.basename(self.nginx_conf))
+                self.print_lines(map(lambda line: line.replace(self.nginx_conf, home_conf), self.get_backfill_lines(self.log_filename)))
             click.echo()
 
     def pre_show_commands_hook(self):
-        self.parser_extra_flags = self.parser_extra_flags_format.format(nginx_conf=self.nginx_conf, log_format=self.log_format)
+        self._set_parser()
+
+    def _set_parser(self):
+        """the log's own format may be JSON already, in which case the
+        backfill and probe use the JSON parser, same as its tail"""
+        if self.json_log and self.json_log == self.log_file:
+            self.parser_module = "json"
+            self.parser_extra_flags = self.field_flags
+        else:
+            self.parser_module = PARSER_MODULE
+            self.parser_extra_flags = self._parser_flags(self.nginx_conf, self.log_format)
+
+    def get_sampling_candidates(self):
+        return ["status", "request_shape", "request_method"]
+
+    def _parser_flags(self, nginx_conf, log_format):
+        return self.parser_extra_flags_format.format(nginx_conf=nginx_conf, log_format=log_format) + self.field_flags
+
+    def get_tail_groups(self):
+        groups = []
+        if self.json_log:
+            groups.append(("json", self.field_flags, [self.json_log]))
+        for nginx_conf, log_format, log_files in self.log_groups or [(self.nginx_conf, self.log_format, [self.log_file])]:
+            if self.json_log:
+                log_files = [f for f in log_files if f != self.log_file]
+            if log_files:
+                groups.append((PARSER_MODULE, self._parser_flags(nginx_conf, log_format), log_files))
+        return groups
+
+    def take_snapshots(self):
+        super(NginxInstaller, self).take_snapshots()
+        if self.json_log and self.json_log != self.log_file:
+            # nginx writes each request to both logs, so the backfill of the
+            # text log up to its snapshot leaves off where the JSON log ends now
+            self.json_snapshot = take_snapshot(self.json_log)
+
+    def get_handoff_statefile(self, log_files):
+        if not self.json_snapshot or self.json_log not in log_files:
+            return super(NginxInstaller, self).get_handoff_statefile(log_files)
+        statefile = self.get_tail_statefile(self.json_log)
+        st = os.stat(self.json_log)
+        if self.json_snapshot.matches(st):
+            write_tail_state(statefile, self.json_snapshot.inode, self.json_snapshot.offset)
+        else:
+            self.warn("{} was rotated during the backfill, so events logged to it meanwhile may be missing.".format(self.json_log))
+            write_tail_state(statefile, st.st_ino, 0)
+        return statefile
 
     def find_log_file(self):
+        build = self._get_nginx_build()
         conf_loc = self._find_nginx_conf(self.nginx_conf)
 
-        found_logs, log_formats = self._parse_nginx(conf_loc, self.debug)
+        index = self._parse_nginx(conf_loc, self.debug)
 
         # We can largely assume good formatting, if nginx accepts it, we should be in good shape.
         if self.log_filename and self.log_format:
             access_log_format = self.log_format
             access_log_name = self.log_filename
         else:
-            access_log_name, access_log_format = self._get_access_log(found_logs, conf_loc, self.log_filename, self.log_format)
+            access_log_name, access_log_format = self._get_access_log(index.access_logs(), conf_loc, self.log_filename, self.log_format)
+
+        access_log = self._find_access_log(index, conf_loc, access_log_name)
+        if access_log and access_log.gzip:
+            self.warn("nginx writes {} gzipped, and honeytail can't tail compressed files.".format(access_log_name))
+            access_log_name, access_log_format = self._choose_uncompressed_log(index, conf_loc, access_log_name, access_log_format)
+            access_log = self._find_access_log(index, conf_loc, access_log_name)
+
+        access_log_format = self._check_log_format(index, access_log_name, access_log_format)
 
         ## Check the log_format and give recommendations
-        click.echo("Getting nginx version...")
-        nginx_version = self._get_nginx_version()
+        nginx_version = build.version
         if not nginx_version:
             self.warn("assuming you're running nginx >= 1.0.0")
             nginx_version = "1.0.0"
 
-        if not log_formats:
-            log_formats.append(["log_format", 'combined \'$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent "$http_referer" "$http_user_agent"\''])
+        if not index.log_formats:
             click.echo("It looks like you're using the default nginx configuration.")
             click.echo("""The defaults are great, but your logs will be even more powerful with more data!
 We'll show you how, after you get a chance to backfill any existing logs.""")
 
-        self._give_log_recs(conf_loc, access_log_format, access_log_name, log_formats, nginx_version)
+        log_format = index.log_format(access_log_format)
+        self._give_log_recs(conf_loc, access_log_format, access_log_name, log_format, nginx_version, build, access_log, index)
 
         # ugly side effects here
         self.log_format = access_log_format
-        self.nginx_conf = conf_loc
+        # honeytail only looks for the log_format in the one file it's given
+        self.nginx_conf = log_format.source or conf_loc
+
+        if self.all_logs:
+            self.log_groups = self._group_access_logs(index, conf_loc, access_log_name, access_log_format)
 
         click.echo()
 
@@ -120,6 +231,10 @@ We'll show you how, after you get a chance to backfill any existing logs.""")
         click.echo()
 
         found = False
+        if not conf_loc and self.nginx_build.known and os.path.isfile(self.nginx_build.conf_path):
+            conf_loc = self.nginx_build.conf_path
+            self.success("Found nginx config at %s" % conf_loc)
+            click.echo()
         if not conf_loc:
             for conf_loc in NGINX_WHITELIST_LOCATIONS:
                 if os.path.isfile(conf_loc):
@@ -147,49 +262,162 @@ We'll show you how, after you get a chance to backfill any existing logs.""")
 
     def _parse_nginx(self, conf_loc, debug):
         self.success("Processing Nginx config: %s" % conf_loc)
+        resolver = IncludeResolver(lambda source, path: self._parse_source(source, path, debug), warn=self.warn)
         try:
-            with open(conf_loc, "r") as fh:
-                parsed = NginxParser(fh.read()).as_list()
-        except OSError:
+            parsed = resolver.load(conf_loc)
+        except (IOError, OSError):
             self.error("We can't read your nginx config with the existing permissions. Please update the permissions or run as sudo and try again.")
             sys.exit(1)
 
-        def _descend(parsed):
-            found_formats = []
-            found_logs = []
-            for item in parsed:
-                if isinstance(item, list):
-                    x, y = _descend(item)
-                    found_formats.extend(x)
-                    found_logs.extend(y)
-
-                if isinstance(item, str):
-                    if item == "log_format":
-                        found_formats.append(parsed)
-                    if item == "access_log" and "off" not in parsed:
-                        found_logs.append(parsed)
-            return found_formats, found_logs
-
-        log_formats, access_logs = _descend(parsed)
+        with TRACER.span("index " + conf_loc, "parse"):
+            index = ConfigIndex(parsed)
 
         if debug:
+            self.success("Read {} nginx config files, {} of them already parsed".format(
+                len([t for t in resolver.trees.itervalues() if t is not None]), self.parse_cache.hits))
             self.success("Found the following log formats and access logs:")
-            pprint.pprint(log_formats)
-            pprint.pprint(access_logs)
+            for directive in index.find("log_format") + index.access_logs():
+                click.echo("  {} ({}, in {}):".format(directive.name, directive.source, directive.context or "main"))
+                pprint.pprint(directive.item)
+
+        return index
+
+
+    def _parse_source(self, source, conf_loc, debug):
+        """parses nginx config source into a tree, falling back to the slower
+        pyparsing grammar if our own parser doesn't accept it.  Trees are
+        cached between runs for as long as the file doesn't change."""
+        with TRACER.span("parse " + conf_loc, "parse", bytes=len(source)) as span:
+            parsed = self.parse_cache.get(conf_loc, source)
+            span["cached"] = parsed is not None
+            if parsed is not None:
+                return parsed
+            try:
+                parsed = confparser.loads(source)
+            except confparser.NginxConfigError as e:
+                if debug:
+                    self.warn("couldn't parse {} ({}); trying again with pyparsing".format(conf_loc, e))
+                try:
+                    parsed = NginxParser(source).as_list()
+                except ParseException as e:
+                    self.warn("couldn't parse {}: {}".format(conf_loc, e))
+                    return []
+            self.parse_cache.put(conf_loc, source, parsed)
+            return parsed
+
+
+    def _config_uses(self, index, directives):
+        """whether any of directives is in the config, and not turned off"""
+        return any(d.args.strip() != "off" for name in directives for d in index.find(name))
+
+
+    def _find_access_log(self, index, conf_loc, log_filename):
+        """the AccessLog writing log_filename, or None if it's not in the config"""
+        real = os.path.realpath(log_filename)
+        for directive in index.access_logs():
+            access_log = AccessLog.parse(directive.args)
+            path = os.path.join(self._log_prefix(conf_loc), access_log.path)
+            if os.path.realpath(path) == real:
+                return access_log
+        return None
+
+
+    def _choose_uncompressed_log(self, index, conf_loc, log_filename, log_format_name):
+        """log_filename is gzipped, so offers the other access logs in the
+        config that honeytail can tail instead, or asks for one.  Returns
+        (log_filename, log_format_name)."""
+        choices = []
+        for directive in index.access_logs():
+            access_log = AccessLog.parse(directive.args)
+            path = access_log.path
+            if path.startswith("syslog:") or "$" in path:
+                continue
+            if not os.path.isabs(path):
+                path = os.path.join(self._log_prefix(conf_loc), path)
+            if access_log.gzip or not os.access(path, os.R_OK) or os.path.realpath(path) == os.path.realpath(log_filename):
+                continue
+            choices.append((path, access_log.format_name))
+
+        if choices:
+            click.echo("\nThese access logs in your nginx config aren't compressed:")
+            choice = get_choice(["{} ({})".format(path, name) for path, name in choices],
+                                "Which would you like to send to honeycomb instead?")
+            return choices[choice - 1]
+
+        click.echo("""
+Remove gzip from its access_log, or add a second, uncompressed access_log
+in the '{}' format for honeytail, and reload nginx (sudo nginx -s reload).
+You can also give its location with the --file option.""".format(log_format_name))
+        while True:
+            log_filename = click.prompt("Uncompressed access log location")
+            if os.path.isfile(log_filename):
+                return os.path.abspath(log_filename), log_format_name
+            self.warn("{} doesn't exist.".format(log_filename))
+
+
+    def _give_buffer_recs(self, access_log, log_filename):
+        """estimates how often nginx writes to the log, and how late its
+        buffering makes events reach honeytail, and suggests buffer and flush
+        settings that keep both down"""
+        stats = self.get_volume_stats(log_filename)
+        if not stats or not stats.events:
+            return
+        bytes_per_event = stats.bytes_per_event
+
+        click.echo("-" * 80)
+        click.echo("{} gets about {:.1f} events a second, and {} in its busiest seconds,".format(log_filename, stats.mean, stats.p99))
+        click.echo("so nginx makes about {:.0f} writes a second to it.".format(access_log.writes_per_sec(stats.p99, bytes_per_event)))
+        latency = access_log.latency(stats.mean, bytes_per_event)
+        if latency:
+            click.echo("Events wait up to {:.1f}s in nginx's buffer before honeytail can see them.".format(latency))
+        if access_log.buffer and not access_log.flush and latency > MAX_FLUSH:
+            self.warn("Without flush=, quiet periods can hold events back for a long time.")
+        elif access_log.flush and access_log.flush > MAX_FLUSH:
+            self.warn("flush={} holds events back for a long time; Honeycomb will show them late.".format(access_log.params["flush"]))
+
+        recommended = recommend_buffering(stats.p99, bytes_per_event)
+        if recommended is None:
+            click.echo("That's few enough writes that buffering isn't needed.")
+            click.echo("-" * 80)
+            return
+        size, flush = recommended
+        if access_log.buffer and access_log.buffer >= size and access_log.flush and access_log.flush <= MAX_FLUSH:
+            self.success("Your access_log buffering looks good.")
+            click.echo("-" * 80)
+            return
+
+        params = dict(access_log.params, buffer=format_size(size), flush="{}s".format(flush))
+        params.pop("gzip", None)
+        buffered = AccessLog(access_log.path, access_log.format_name, params)
+        click.echo("""
+Buffering the log cuts that to about {:.0f} writes a second at peak, with
+events at most {}s late:
+
+    access_log   {}  {} {};
+""".format(buffered.writes_per_sec(stats.p99, bytes_per_event), flush, access_log.path, access_log.format_name,
+           " ".join("{}={}".format(name, value) for name, value in sorted(params.items()))))
+        click.echo("-" * 80)
 
-        return access_logs, log_formats
+
+    def _log_prefix(self, conf_loc):
+        """what relative access_log paths are relative to: nginx's prefix, or
+        failing that, the config's directory"""
+        if self.nginx_build.known:
+            return self.nginx_build.prefix
+        return os.path.dirname(conf_loc)
 
 
     def _get_access_log(self, access_logs, conf_loc, log_filename=None, log_format_name=None):
-        abs_base_path = __file__
+        # a relative --file is relative to where the installer was run from
+        abs_base_path = os.getcwd()
 
         if not log_filename:
             if access_logs:
-                abs_base_path = conf_loc
+                abs_base_path = self._log_prefix(conf_loc)
                 if len(access_logs) > 1:
                     click.echo("\nWe found the following access logs in your nginx config:")
                     for i, log_list in enumerate(access_logs):
-                        click.echo(" [%s] %s" % ((i + 1), log_list[1].split()[0]))
+                        click.echo(" [%s] %s (%s)" % ((i + 1), log_list.args.split()[0], log_list.context or "main"))
                     log_index = click.prompt("Which log would you like to send to honeycomb?", type=int, default=1)
                     try:
                         log_item = access_logs[log_index - 1]
@@ -198,14 +426,13 @@ We'll show you how, after you get a chance to backfill any existing logs.""")
                         sys.exit()
                 else:
                     log_item = access_logs[0]
-                    click.echo("Using log located at {}".format(log_item[1]))
+                    click.echo("Using log located at {}".format(log_item.args))
 
-                log_parts = log_item[1].split()
-                log_filename = log_parts[0]
-                if len(log_parts) > 1:
-                    log_format_name = log_parts[1]
-                else:
-                    log_format_name = "combined"
+                access_log = AccessLog.parse(log_item.args)
+                log_filename = access_log.path
+                log_format_name = access_log.format_name
+                if log_filename[0] != "/":
+                    log_filename = os.path.join(abs_base_path, log_filename)
 
                 if not os.path.isfile(log_filename):
                     self.error("\nArgh! We tried to guess the location for logs for the '{}' format and failed.".format(log_format_name))
@@ -213,7 +440,7 @@ We'll show you how, after you get a chance to backfill any existing logs.""")
                     self.error("Once you find your nginx logs, specify them via --file, and try again.")
                     sys.exit()
             else:
-                log_filename = "/var/log/nginx/access.log"
+                log_filename = self.nginx_build.http_log_path if self.nginx_build.known else "/var/log/nginx/access.log"
                 click.echo("We'll start by using the default log location of {}".format(log_filename))
                 if not os.path.isfile(log_filename):
                     self.error("\nArgh! Looks like they're not at the default location.")
@@ -226,25 +453,24 @@ We'll show you how, after you get a chance to backfill any existing logs.""")
 
         # Turn a relative path into an absolute path
         if log_filename[0] != "/":
-            log_filename = os.path.join(os.path.dirname(abs_base_path), log_filename)
+            log_filename = os.path.join(abs_base_path, log_filename)
 
         if not log_format_name:
             if access_logs:
                 # Attempt to guess the log format.
                 for i, log_list in enumerate(access_logs):
-                    parts = log_list[1].split()
-                    if parts[0] == log_filename and len(parts) > 1:
-                        log_format_name = parts[1]
+                    access_log = AccessLog.parse(log_list.args)
+                    if access_log.path == log_filename:
+                        log_format_name = access_log.format_name
 
                 # Still no? show the found formats and ask
                 if not log_format_name:
                     click.echo("\nWe found the following access logs in your nginx config:")
                     formats = set()
                     for log_list in access_logs:
-                        parts = log_list[1].split()
-                        if len(parts) > 1:
-                            formats.add(parts[1])
-                            click.echo("[%s] %s" % (parts[1], parts[0]))
+                        access_log = AccessLog.parse(log_list.args)
+                        formats.add(access_log.format_name)
+                        click.echo("[%s] %s" % (access_log.format_name, access_log.path))
                     if formats:
                         log_format_name = click.prompt("Which log format would you like to use?", default=list(formats)[0], type=click.Choice(formats))
 
@@ -265,19 +491,112 @@ We'll show you how, after you get a chance to backfill any existing logs.""")
         return log_filename, log_format_name
 
 
-    def _give_log_recs(self, conf_loc, name, log_filename, all_formats, nginx_version):
+    def _group_access_logs(self, index, conf_loc, log_filename, log_format_name):
+        """groups log_filename and every other access log in the config that
+        we can tail by the log_format it's written in, so each group can
+        share a honeytail.  Returns [(nginx_conf, log_format, [log_file])],
+        log_filename's group first."""
+        groups = collections.OrderedDict()
+        seen = set()
+
+        def add(path, name):
+            real = os.path.realpath(path)
+            if real in seen:
+                return
+            seen.add(real)
+            log_format = index.log_format(name)
+            if log_format is None:
+                self.warn("Skipping {}: its log_format '{}' isn't in your nginx config.".format(path, name))
+                return
+            if not os.access(path, os.R_OK):
+                self.warn("Skipping {}: we can't read it.".format(path))
+                return
+            # honeytail names each file's state after its basename, so files
+            # with the same one need separate honeytails
+            key = [log_format.source or conf_loc, name, 0]
+            while os.path.basename(path) in [os.path.basename(f) for f in groups.get(tuple(key), [])]:
+                key[2] += 1
+            groups.setdefault(tuple(key), []).append(path)
+
+        add(log_filename, log_format_name)
+        for directive in index.access_logs():
+            access_log = AccessLog.parse(directive.args)
+            path = access_log.path
+            if path.startswith("syslog:") or "$" in path:
+                if self.debug:
+                    self.warn("Skipping {}: honeytail can only tail files with fixed names.".format(path))
+                continue
+            if access_log.gzip:
+                self.warn("Skipping {}: it's gzipped, and honeytail can't tail compressed files.".format(path))
+                continue
+            if not os.path.isabs(path):
+                path = os.path.join(self._log_prefix(conf_loc), path)
+            add(path, access_log.format_name)
+
+        log_groups = [(nginx_conf, name, log_files) for (nginx_conf, name, n), log_files in groups.items()]
+        log_count = sum(len(log_files) for nginx_conf, name, log_files in log_groups)
+        click.echo("We'll tail {} access log{} with {} honeytail{}:".format(
+            log_count, "s" if log_count > 1 else "", len(log_groups), "s" if len(log_groups) > 1 else ""))
+        for nginx_conf, name, log_files in log_groups:
+            click.echo("    '{}' format: {}".format(name, ", ".join(log_files)))
+        return log_groups
+
+
+    def _check_log_format(self, index, log_filename, name):
+        """matches the end of the log against the log_format called name, and
+        if too many lines don't match, tries the config's other formats.
+        Returns the name of the format to use."""
+        log_format = index.log_format(name)
+        if not log_format:
+            return name
+        try:
+            lines = recent_lines(log_filename)
+        except (IOError, OSError):
+            return name
+        if not lines:
+            return name
+
+        click.echo("Checking {} against the '{}' log format...".format(log_filename, name))
+        regex, variables = compile_directive(log_format.args)
+        with TRACER.span("match " + log_filename, "probe", lines=len(lines)):
+            result = match_lines(regex, lines)
+        click.echo("{} of the last {} lines ({:.1f}%) match, at {:.0f} lines/s.".format(
+            result.matched, result.total, 100 * result.rate, result.lines_per_sec))
+        if result.rate >= MIN_MATCH_RATE:
+            return name
+
+        self.warn("These lines don't match the '{}' format:".format(name))
+        for line in result.failures:
+            self.warn("    " + line)
+
+        best, best_result = name, result
+        others = set(index.log_formats) | set(["combined"])
+        for other in sorted(others - set([name])):
+            regex, variables = compile_directive(index.log_format(other).args)
+            other_result = match_lines(regex, lines)
+            if self.debug:
+                click.echo("  '{}' matches {:.1f}%".format(other, 100 * other_result.rate))
+            if other_result.rate > best_result.rate:
+                best, best_result = other, other_result
+        if best == name:
+            self.warn("None of the log formats in your nginx config match it any better, so honeytail may skip some lines.")
+            return name
+
+        click.echo("The '{}' format matches {:.1f}% of them.".format(best, 100 * best_result.rate))
+        if click.confirm("Would you like to use it instead?", default=True):
+            return best
+        return name
+
+
+    def _give_log_recs(self, conf_loc, name, log_filename, log_format, nginx_version, build, access_log=None, index=None):
         click.echo("-" * 80)
 
-        full_format = None
-        for f in all_formats:
-            if f[1].startswith(name + " "):
-                full_format = f[1]
-                break
-
-        if not full_format:
+        if not log_format:
             self.error("Something went wrong and I can't identify your format.")
             self.error("The program is exiting and we're really unhappy.")
             sys.exit(1)
+        full_format = log_format.args
+        conf_loc = log_format.source or conf_loc
 
         click.echo("""
 Honeycomb works best with lots of fields, and nginx has a great set of
@@ -295,6 +614,11 @@ We'll return a list of variables to add to your log_format line.
             click.echo("Ok, aborting.")
             sys.exit(0)
 
+        regex, logged = compile_directive(full_format)
+
+        def missing(var, version):
+            return var[1:] not in logged and semver.compare(nginx_version, version) >= 0 and build.supports_variable(var)
+
         click.echo("-" * 80)
         click.echo("Your access log is missing the following useful fields:")
 
@@ -302,25 +626,51 @@ We'll return a list of variables to add to your log_format line.
 
         for var, ver_mess in MESSAGES.iteritems():
             version, message = ver_mess
-            if var not in full_format and semver.compare(nginx_version, version) >= 0:
-                if var.startswith("$http_"):
-                    var = "\"{}\"".format(var)
-                click.secho("    {:<26}".format(var), bold=True, nl=False)
+            if missing(var, version):
+                click.secho("    {:<26}".format(quote_variable(var)), bold=True, nl=False)
+                click.echo(": {}".format(message))
+                vars_to_add.append(var)
+
+        performance_vars = list()
+        for var, (version, message, directives) in sorted(PERFORMANCE_MESSAGES.iteritems()):
+            if missing(var, version) and (directives is None or (index and self._config_uses(index, directives))):
+                performance_vars.append((var, message))
+        if performance_vars:
+            click.echo()
+            click.echo("And these will help you find slow requests, and the backends behind them:")
+            for var, message in performance_vars:
+                click.secho("    {:<26}".format(quote_variable(var)), bold=True, nl=False)
                 click.echo(": {}".format(message))
                 vars_to_add.append(var)
+
         click.echo("-" * 80)
         click.secho("Review complete.", bold=True)
-        click.echo("""
+        if "escape=json" in full_format:
+            click.echo("""
+Add them as fields of your JSON log format, in {conf_loc}.
+""".format(conf_loc=conf_loc))
+        else:
+            click.echo("""
 Here's a complete log format that we would use for nginx with Honeycomb:
 
-    log_format   {full_format} {vars_to_add}';
+    log_format   {full_format};
     access_log   {log_filename}  {name};
 """.format(
         name = name,
-        full_format = full_format.rstrip("' "),
-        vars_to_add = " ".join(vars_to_add),
+        full_format = extend_log_format(full_format, vars_to_add),
         log_filename = log_filename))
 
+        if "escape=json" in full_format:
+            # already JSON, so honeytail can use its JSON parser on it as it is
+            self.json_log = log_filename
+        elif semver.compare(nginx_version, JSON_MIN_VERSION) >= 0:
+            self._offer_json_format(conf_loc, name, log_filename, full_format, vars_to_add)
+
+        self._give_size_recs(log_filename, full_format)
+
+        if access_log:
+            self._give_buffer_recs(access_log, log_filename)
+
         click.echo("If you like these changes, go ahead and edit your nginx config (at {}) now.".format(conf_loc))
         click.echo("Please make sure to reload nginx (sudo nginx -s reload) after any changes to the config.")
         if not click.confirm("""\nOnce you're finished making changes and have reloaded nginx,
@@ -328,19 +678,142 @@ hit Enter to continue, 'n' to abort""", default=True):
             click.echo("Ok, aborting.")
             sys.exit(0)
 
+        if self.json_log and not os.path.isfile(self.json_log):
+            self.warn("{} doesn't exist yet, so we'll tail {} instead.".format(self.json_log, log_filename))
+            self.json_log = None
+
+
+    def _offer_json_format(self, conf_loc, name, log_filename, full_format, vars_to_add):
+        """offers a JSON version of the log format, with the recommended
+        variables added, for honeytail to parse without matching every line
+        against the format"""
+        regex, variables = compile_directive(full_format)
+        variables = variables + [var.strip('"').lstrip("$") for var in vars_to_add]
+        root, ext = os.path.splitext(log_filename)
+        json_log = root + ".json" + (ext or ".log")
+
+        click.echo("-" * 80)
+        click.echo("""On busy servers, honeytail can parse JSON logs with much less CPU than it
+takes to match every line against a log_format. Here's the same format as JSON:
+""")
+        format_lines = json_log_format(JSON_FORMAT_NAME, variables)
+        click.echo("    log_format   {}".format(format_lines[0]))
+        for line in format_lines[1:]:
+            click.echo("                 {}".format(line))
+        click.echo("    access_log   {}  {};".format(json_log, JSON_FORMAT_NAME))
+        click.echo()
+
+        self._benchmark_json(conf_loc, name, log_filename, regex)
+        if click.confirm("Would you like to add it, and have honeytail tail {} with its JSON parser?".format(json_log), default=False):
+            self.json_log = json_log
+        click.echo("-" * 80)
+
+
+    def _benchmark_json(self, conf_loc, name, log_filename, regex):
+        """times honeytail parsing a sample of the log, and then the same
+        events written as JSON"""
+        if not self.probe_honeytail:
+            return
+        lines = [line for line in "".join(sample_log(log_filename)).splitlines() if regex.match(line)]
+        if not lines:
+            return
+        self.wait_for_honeytail()
+
+        click.echo("Timing honeytail's parsers on {} lines of {}...".format(len(lines), log_filename))
+        with TRACER.span("benchmark parsers " + log_filename, "probe", lines=len(lines)):
+            text_cpu = self._time_parser(PARSER_MODULE, self._parser_flags(conf_loc, name), lines)
+            json_cpu = self._time_parser("json", self.field_flags, json_lines(regex, lines))
+        if text_cpu is None or json_cpu is None:
+            return
+
+        click.echo("    {:<6} parser: {:9.0f} lines per CPU second".format(PARSER_MODULE, len(lines) / text_cpu))
+        click.echo("    {:<6} parser: {:9.0f} lines per CPU second".format("json", len(lines) / json_cpu))
+        if json_cpu < text_cpu:
+            click.echo("so parsing JSON would use {:.0f}% less CPU.".format(100 * (1 - json_cpu / text_cpu)))
+        else:
+            click.echo("so parsing JSON wouldn't save any CPU here.")
+        click.echo()
+
+
+    def _time_parser(self, parser_module, parser_extra_flags, lines):
+        """the CPU seconds honeytail takes to parse lines, printing the events
+        rather than sending them, or None if it fails"""
+        command = " ".join(self.get_backfill_lines("-", parser_extra_flags, parser_module)) + " --debug_stdout"
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        p = Popen(command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = p.communicate("\n".join(lines) + "\n")
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        if p.returncode != 0:
+            if self.debug:
+                self.warn("timing honeytail's {} parser failed, exit status {}:".format(parser_module, p.returncode))
+                self.warn(err)
+            return None
+        return max((after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime), 0.001)
 
-    def _get_nginx_version(self):
-        '''calls out to nginx -v to get the nginx version number (eg 1.4.2)'''
+
+    def _give_size_recs(self, log_filename, full_format):
+        """measures how many bytes each variable adds to an event, and offers
+        to drop or scrub the ones that cost a lot for what they tell you"""
+        regex, variables = compile_directive(full_format)
+        with TRACER.span("measure fields " + log_filename, "probe"):
+            lines = "".join(sample_log(log_filename)).splitlines()
+            fields, matched, total = measure_fields(lines, regex, variables)
+        if not matched:
+            return
+
+        click.echo("-" * 80)
+        click.echo("Here's how many bytes each field adds to an event, from {} lines of your log:".format(matched))
+        for name in sorted(fields, key=lambda n: -fields[n].bytes):
+            field = fields[name]
+            click.echo("    {:<26}: {:6.1f} bytes ({:.0f}%)".format(name, float(field.bytes) / matched, 100.0 * field.bytes / total))
+
+        recs = recommend_field_flags(fields, matched)
+        if not recs:
+            click.echo("-" * 80)
+            return
+        click.echo()
+        click.echo("These fields cost a lot for what they tell you, or shouldn't be stored as they are:")
+        for flag, name, reason, saved in recs:
+            click.secho("    {}={}".format(flag, name), bold=True, nl=False)
+            click.echo(": {} (saves {:.0f}%)".format(reason, 100.0 * saved / total))
+        click.echo("Together they would make your events about {:.0f}% smaller.".format(100.0 * sum(r[3] for r in recs) / total))
+        if click.confirm("Would you like honeytail to drop and scrub them?", default=False):
+            self.field_flags += " ".join("{}={}".format(flag, name) for flag, name, reason, saved in recs) + " "
+        click.echo("-" * 80)
+
+
+    def _get_nginx_build(self):
+        """runs nginx -V once to find out how nginx was built, remembering the
+        answer for as long as the binary doesn't change"""
+        if self.nginx_build:
+            return self.nginx_build
+        binary = find_nginx()
+        if not binary:
+            self.warn("We couldn't find the nginx binary, so we'll have to guess how it was built.")
+            self.nginx_build = NginxBuild()
+            return self.nginx_build
+
+        cache_path = os.path.join(STATE_DIR, "nginx", "build.json")
+        self.nginx_build = load_build(cache_path, binary)
+        if self.nginx_build:
+            return self.nginx_build
+
+        click.echo("Getting nginx version...")
         try:
-            verstring = check_output(["nginx", "-v"], stderr=subprocess.STDOUT)
-            version = verstring.split()[2]
-            vernum = version.split("/")[1]
-            return vernum
-        except subprocess.CalledProcessError as e:
-            self.warn("error checking nginx version (`{}`), exit status {}".format(e.cmd, e.returncode))
+            output = check_output([binary, "-V"], stderr=subprocess.STDOUT)
+        except (subprocess.CalledProcessError, OSError) as e:
+            self.warn("error running `{} -V`: {}".format(binary, e))
             self.warn("output:")
-            self.warn(e.output)
-            return None
+            self.warn(getattr(e, "output", ""))
+            self.nginx_build = NginxBuild(binary)
+            return self.nginx_build
+
+        self.nginx_build = parse_build(binary, output)
+        save_build(cache_path, binary, self.nginx_build)
+        if self.debug:
+            self.success("nginx {} at {}, config at {}, with {}".format(
+                self.nginx_build.version, binary, self.nginx_build.conf_path, ", ".join(self.nginx_build.modules) or "no optional modules"))
+        return self.nginx_build
 
 @click.command()
 @click.option("--writekey", "-k", help="Your Honeycomb Writekey", default="")
@@ -349,11 +822,13 @@ hit Enter to continue, 'n' to abort""", default=True):
 @click.option("--nginx.conf", "nginx_conf", help="Nginx Config location")
 @click.option("--nginx.format", "nginx_format", help="The name of the log_format from your nginx config that you wish to use with Honeycomb")
 @click.option("--honeytail", help="Honeytail location", default="honeytail")
+@click.option("--all-logs/--one-log", help="Tail every access log in the nginx config, one honeytail per log_format", default=False)
 @click.option("--debug/--no-debug", help="Turn Debug mode on", default=False)
+@honeytail_options
 @click.version_option(INSTALLER_VERSION)
-def start(writekey, dataset, log_filename, nginx_conf, nginx_format, honeytail, debug):
+def start(writekey, dataset, log_filename, nginx_conf, nginx_format, all_logs, honeytail, debug, **options):
 
-    installer = NginxInstaller(writekey, dataset, honeytail, debug, log_filename, nginx_conf, nginx_format)
+    installer = NginxInstaller(writekey, dataset, honeytail, debug, log_filename, nginx_conf, nginx_format, all_logs, **options)
     installer.start()
 
 
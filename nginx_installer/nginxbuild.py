@@ -0,0 +1,169 @@
+"""what nginx -V says about how nginx was built: its version, where it
+looks for its config and logs, and which modules it has"""
+import json
+import os
+import re
+import shlex
+from distutils.spawn import find_executable
+
+# where packages and source builds put the binary, when it isn't on the PATH
+NGINX_BINARIES = [
+    "/usr/sbin/nginx",
+    "/usr/local/sbin/nginx",
+    "/usr/local/nginx/sbin/nginx",
+    "/opt/nginx/sbin/nginx",
+    "/usr/local/bin/nginx",     # OSX, Homebrew
+]
+
+# nginx's own defaults, for builds configured without these
+DEFAULT_PREFIX = "/usr/local/nginx"
+DEFAULT_CONF_PATH = "conf/nginx.conf"
+DEFAULT_HTTP_LOG_PATH = "logs/access.log"
+
+# modules built unless configured --without-<module>; any other module is
+# only there if configured --with-<module>
+DEFAULT_MODULES = set([
+    "http_gzip_module",
+    "http_proxy_module",
+    "http_fastcgi_module",
+    "http_uwsgi_module",
+    "http_scgi_module",
+    "http_grpc_module",
+    "http_upstream_hash_module",
+    "http_upstream_keepalive_module",
+    "http_rewrite_module",
+    "http_map_module",
+    "http_geo_module",
+    "http_referer_module",
+])
+
+# variable prefix: the modules that define it, any of which will do
+VARIABLE_MODULES = [
+    ("$upstream_", ["http_proxy_module", "http_fastcgi_module", "http_uwsgi_module", "http_scgi_module", "http_grpc_module"]),
+    ("$ssl_", ["http_ssl_module"]),
+    ("$gzip_ratio", ["http_gzip_module"]),
+    ("$realip_remote_", ["http_realip_module"]),
+    ("$geoip_", ["http_geoip_module"]),
+    ("$http2", ["http_v2_module"]),
+]
+
+VERSION = re.compile(r"nginx version: \S+/(\d+\.\d+\.\d+)")
+
+
+class NginxBuild(object):
+    def __init__(self, binary=None, version=None, configure_args=None):
+        self.binary = binary
+        self.version = version
+        self.configure_args = configure_args
+        # --name[=value] options, as name: value (or True)
+        self.options = {}
+        try:
+            args = shlex.split(configure_args or "")
+        except ValueError:
+            # unbalanced quotes in someone's --with-cc-opt
+            args = (configure_args or "").split()
+        for arg in args:
+            name, sep, value = arg.lstrip("-").partition("=")
+            self.options[name] = value if sep else True
+
+    @property
+    def known(self):
+        """whether nginx -V told us anything"""
+        return self.configure_args is not None
+
+    @property
+    def prefix(self):
+        return self.options.get("prefix") or DEFAULT_PREFIX
+
+    def _path(self, option, default):
+        path = self.options.get(option) or default
+        return path if os.path.isabs(path) else os.path.join(self.prefix, path)
+
+    @property
+    def conf_path(self):
+        return self._path("conf-path", DEFAULT_CONF_PATH)
+
+    @property
+    def http_log_path(self):
+        return self._path("http-log-path", DEFAULT_HTTP_LOG_PATH)
+
+    def has_module(self, module):
+        """whether module is compiled in or built as a dynamic module.  If we
+        don't know how nginx was built, assume it's a default module."""
+        if not self.known:
+            return module in DEFAULT_MODULES
+        if module in DEFAULT_MODULES:
+            return "without-" + module not in self.options
+        return "with-" + module in self.options
+
+    @property
+    def modules(self):
+        """the optional modules this build has, sorted"""
+        return sorted(name[len("with-"):] for name in self.options
+                      if name.startswith("with-") and name.endswith("_module"))
+
+    def supports_variable(self, variable):
+        """whether the modules defining variable were built.  Variables we
+        don't know the module for come from the core, so are supported, as is
+        everything if we don't know how nginx was built."""
+        if not self.known:
+            return True
+        for prefix, modules in VARIABLE_MODULES:
+            if variable.strip('"').startswith(prefix):
+                return any(self.has_module(module) for module in modules)
+        return True
+
+    def to_json(self):
+        return {"binary": self.binary, "version": self.version, "configure_args": self.configure_args}
+
+
+def parse_build(binary, output):
+    """parses the output of nginx -V into an NginxBuild"""
+    match = VERSION.search(output)
+    configure_args = ""
+    for line in output.splitlines():
+        if line.startswith("configure arguments:"):
+            configure_args = line[len("configure arguments:"):].strip()
+    return NginxBuild(binary, match.group(1) if match else None, configure_args)
+
+
+def find_nginx():
+    """the path of the nginx binary, or None"""
+    binary = find_executable("nginx")
+    if binary:
+        return binary
+    for binary in NGINX_BINARIES:
+        if os.access(binary, os.X_OK):
+            return binary
+    return None
+
+
+def _cache_key(binary):
+    st = os.stat(binary)
+    return [os.path.realpath(binary), int(st.st_mtime), st.st_size]
+
+
+def load_build(cache_path, binary):
+    """the NginxBuild cached for binary, unless it has changed since"""
+    try:
+        with open(cache_path) as fh:
+            cached = json.load(fh)
+        if cached["key"] != _cache_key(binary):
+            return None
+        build = cached["build"]
+        return NginxBuild(build["binary"], build["version"], build["configure_args"])
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_build(cache_path, binary, build):
+    try:
+        if not os.path.isdir(os.path.dirname(cache_path)):
+            os.makedirs(os.path.dirname(cache_path))
+        tmp = cache_path + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump({"key": _cache_key(binary), "build": build.to_json()}, fh)
+        os.rename(tmp, cache_path)
+    except (IOError, OSError):
+        # the cache is only an optimization
+        pass
@@ -0,0 +1,53 @@
+"""keeps the parsed trees of nginx config files on disk between runs, one
+marshal file per config file, so unchanged files needn't be parsed again"""
+import hashlib
+import marshal
+import os
+
+# bump when the shape of the parsed trees changes
+CACHE_VERSION = 1
+
+
+class ParseCache(object):
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, path):
+        return os.path.join(self.cache_dir, hashlib.sha1(os.path.abspath(path)).hexdigest() + ".marshal")
+
+    def _key(self, path, source):
+        st = os.stat(path)
+        return (CACHE_VERSION, os.path.abspath(path), int(st.st_mtime), st.st_size, hashlib.sha1(source).hexdigest())
+
+    def get(self, path, source):
+        """returns the cached tree for path if it was parsed from this same
+        source, otherwise None"""
+        try:
+            key = self._key(path, source)
+            with open(self._entry_path(path), "rb") as fh:
+                cached_key, tree = marshal.load(fh)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            self.misses += 1
+            return None
+        if tuple(cached_key) != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return tree
+
+    def put(self, path, source, tree):
+        try:
+            key = self._key(path, source)
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            entry = self._entry_path(path)
+            # another installer may be writing the same entry
+            tmp = "{}.{}.tmp".format(entry, os.getpid())
+            with open(tmp, "wb") as fh:
+                marshal.dump((key, tree), fh)
+            os.rename(tmp, entry)
+        except (IOError, OSError, ValueError):
+            # the cache is only an optimization
+            pass
@@ -0,0 +1,10 @@
+"""puts the installers' modules on the path, the way the pyinstaller specs
+see them"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("honey_installer", "nginx_installer"):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,91 @@
+import unittest
+
+import context
+from accesslog import (AccessLog, GZIP_BUFFER, MAX_BUFFER, MIN_BUFFER, RECOMMENDED_FLUSH, format_size, parse_size,
+                       parse_time, recommend_buffering)
+
+
+class ParseTest(unittest.TestCase):
+    def test_parse_size(self):
+        self.assertEqual(parse_size("512"), 512)
+        self.assertEqual(parse_size("32k"), 32 * 1024)
+        self.assertEqual(parse_size("1M"), 1024 * 1024)
+        self.assertIsNone(parse_size("1g"))
+        self.assertIsNone(parse_size(""))
+        self.assertIsNone(parse_size(None))
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time("5"), 5)
+        self.assertEqual(parse_time("5s"), 5)
+        self.assertEqual(parse_time("500ms"), 0.5)
+        self.assertEqual(parse_time("1m30s"), 90)
+        self.assertEqual(parse_time("1h"), 3600)
+        self.assertIsNone(parse_time("soon"))
+        self.assertIsNone(parse_time(None))
+
+    def test_format_size(self):
+        self.assertEqual(format_size(64 * 1024), "64k")
+        self.assertEqual(format_size(1024 * 1024), "1m")
+
+
+class AccessLogTest(unittest.TestCase):
+    def test_parse_path_only(self):
+        log = AccessLog.parse("/var/log/nginx/access.log")
+        self.assertEqual(log.path, "/var/log/nginx/access.log")
+        self.assertEqual(log.format_name, "combined")
+        self.assertIsNone(log.buffer)
+        self.assertIsNone(log.flush)
+
+    def test_parse_params(self):
+        log = AccessLog.parse('"/var/log/nginx/access.log" main buffer=32k flush=5s')
+        self.assertEqual(log.path, "/var/log/nginx/access.log")
+        self.assertEqual(log.format_name, "main")
+        self.assertEqual(log.buffer, 32 * 1024)
+        self.assertEqual(log.flush, 5)
+        self.assertFalse(log.gzip)
+
+    def test_gzip_buffers_by_default(self):
+        log = AccessLog.parse("/var/log/nginx/access.log.gz main gzip")
+        self.assertTrue(log.gzip)
+        self.assertEqual(log.buffer, GZIP_BUFFER)
+        log = AccessLog.parse("/var/log/nginx/access.log.gz main gzip=9 buffer=8k")
+        self.assertTrue(log.gzip)
+        self.assertEqual(log.buffer, 8 * 1024)
+
+    def test_unbuffered(self):
+        log = AccessLog.parse("/var/log/nginx/access.log")
+        self.assertEqual(log.writes_per_sec(200, 100), 200)
+        self.assertEqual(log.latency(200, 100), 0)
+
+    def test_buffered(self):
+        log = AccessLog.parse("/var/log/nginx/access.log main buffer=32k")
+        # 200 events of 160 bytes a second fill 32k every second
+        self.assertAlmostEqual(log.writes_per_sec(200, 160), 200 * 160 / 32768.0)
+        self.assertAlmostEqual(log.latency(200, 160), 32768 / (200 * 160.0))
+
+    def test_flush_bounds_latency(self):
+        log = AccessLog.parse("/var/log/nginx/access.log main buffer=64k flush=1s")
+        # slow enough that the flush, not the buffer filling, does the writes
+        self.assertEqual(log.writes_per_sec(10, 100), 1)
+        self.assertEqual(log.latency(10, 100), 1)
+        # but never more writes than there are events
+        self.assertEqual(log.writes_per_sec(0.5, 100), 0.5)
+
+
+class RecommendTest(unittest.TestCase):
+    def test_slow_log_needs_no_buffer(self):
+        self.assertIsNone(recommend_buffering(10, 200))
+
+    def test_buffer_grows_with_traffic(self):
+        small = recommend_buffering(100, 200)
+        large = recommend_buffering(5000, 200)
+        self.assertEqual(small, (MIN_BUFFER, RECOMMENDED_FLUSH))
+        self.assertGreater(large[0], small[0])
+        self.assertEqual(large[1], RECOMMENDED_FLUSH)
+
+    def test_buffer_is_capped(self):
+        self.assertEqual(recommend_buffering(10 ** 6, 1000), (MAX_BUFFER, RECOMMENDED_FLUSH))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import context
+from backfill import (RECORD_START, find_record_boundary, find_rotated_logs, find_snapshot_end, open_log, run_files,
+                      run_pool, split_segments)
+
+NGINX = b"".join(b'127.0.0.1 - - [01/Oct/2016:12:00:%02d +0000] "GET / HTTP/1.1" 200 612\n' % i for i in range(40))
+
+MYSQL_RECORD = (b"# Time: 161001 12:00:00\n"
+                b"# User@Host: root[root] @ localhost []\n"
+                b"# Query_time: 0.000123  Lock_time: 0.000000 Rows_sent: 1  Rows_examined: 1\n"
+                b"SET timestamp=1475323200;\n"
+                b"select 1;\n")
+MYSQL = MYSQL_RECORD * 20
+
+MONGO = b"".join(b"2016-10-01T12:00:%02d.000+0000 I COMMAND  [conn1] command test.foo\n" % i for i in range(40))
+
+
+class BackfillTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, data):
+        path = os.path.join(self.dir, "log")
+        with open(path, "wb") as fh:
+            fh.write(data)
+        return path
+
+    def check_segments(self, data, parser, count):
+        path = self.write(data)
+        segments = split_segments(path, count, RECORD_START[parser])
+        self.assertEqual(segments[0][0], 0)
+        self.assertEqual(segments[-1][1], len(data))
+        for (start, end), (next_start, _) in zip(segments, segments[1:]):
+            self.assertEqual(end, next_start)
+        return segments
+
+    def test_split_lines(self):
+        segments = self.check_segments(NGINX, "nginx", 4)
+        self.assertEqual(len(segments), 4)
+        for start, end in segments:
+            self.assertTrue(start == 0 or NGINX[start - 1:start] == b"\n")
+
+    def test_split_mysql_on_header_runs(self):
+        # every possible split point must land on a "# Time:" line, never on
+        # the "# User@Host:" that follows it
+        for count in range(2, 40):
+            for start, end in self.check_segments(MYSQL, "mysql", count):
+                self.assertEqual(start % len(MYSQL_RECORD), 0)
+
+    def test_split_mysql_without_time(self):
+        record = MYSQL_RECORD.split(b"\n", 1)[1]
+        data = record * 20
+        for start, end in self.check_segments(data, "mysql", 7):
+            self.assertEqual(start % len(record), 0)
+
+    def test_split_mongo_every_line(self):
+        segments = self.check_segments(MONGO, "mongo", 40)
+        self.assertEqual(len(segments), 40)
+
+    def test_boundary_inside_header_run(self):
+        path = self.write(MYSQL)
+        user_host = MYSQL.index(b"# User@Host:")
+        with open(path, "rb") as fh:
+            self.assertEqual(find_record_boundary(fh, user_host, RECORD_START["mysql"]), len(MYSQL_RECORD))
+            self.assertEqual(find_record_boundary(fh, 0, RECORD_START["mysql"]), 0)
+            self.assertEqual(find_record_boundary(fh, len(MYSQL), RECORD_START["mysql"]), len(MYSQL))
+
+    def test_empty_range(self):
+        path = self.write(NGINX)
+        self.assertEqual(split_segments(path, 4, None, 10, 10), [])
+
+    def test_snapshot_end_lines(self):
+        path = self.write(NGINX + b"127.0.0.1 - - [01/Oct")
+        for window in (7, 64 * 1024):
+            self.assertEqual(find_snapshot_end(path, os.path.getsize(path), None, window), len(NGINX))
+        self.assertEqual(find_snapshot_end(path, len(NGINX) - 1, None), NGINX.rindex(b"\n", 0, len(NGINX) - 1) + 1)
+
+    def test_snapshot_end_mongo_last_line(self):
+        path = self.write(MONGO)
+        last = MONGO.rindex(b"\n", 0, len(MONGO) - 1) + 1
+        self.assertEqual(find_snapshot_end(path, len(MONGO), RECORD_START["mongo"]), last)
+
+    def test_snapshot_end_mysql_header_run(self):
+        # the last record starts at its "# Time:", wherever the window falls
+        path = self.write(MYSQL)
+        for window in (5, 40, 64 * 1024):
+            self.assertEqual(find_snapshot_end(path, len(MYSQL), RECORD_START["mysql"], window),
+                             len(MYSQL) - len(MYSQL_RECORD))
+
+    def test_snapshot_end_unaligned(self):
+        path = self.write(b"x" * 100)
+        self.assertEqual(find_snapshot_end(path, 100, None, 16), 0)
+        path = self.write(b"select 1;\n" * 100)
+        self.assertEqual(find_snapshot_end(path, 1000, RECORD_START["mysql"], 16), 0)
+
+    def test_open_log_without_xz(self):
+        def popen(args, **kwargs):
+            raise OSError(2, "No such file or directory")
+        with self.assertRaises(IOError):
+            open_log(os.path.join(self.dir, "log.1.xz"), popen)
+
+    def test_run_pool_keeps_order(self):
+        self.assertEqual(run_pool(lambda n: n * 2, range(10), 3), [n * 2 for n in range(10)])
+
+    def touch(self, name, mtime):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as fh:
+            fh.write(b"x\n")
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_rotated_numbers_oldest_first(self):
+        self.touch("access.log", 2000)
+        newest = self.touch("access.log.1", 1000)
+        oldest = self.touch("access.log.2.gz", 1000)
+        self.touch("access.log.bak", 500)
+        self.assertEqual(find_rotated_logs(os.path.join(self.dir, "access.log")), [oldest, newest])
+
+    def test_rotated_dateext_oldest_first(self):
+        newest = self.touch("access.log-20161002", 1000)
+        oldest = self.touch("access.log-20161001.gz", 1000)
+        self.assertEqual(find_rotated_logs(os.path.join(self.dir, "access.log")), [oldest, newest])
+
+    def test_run_files_from_start(self):
+        path = self.write(NGINX)
+        start = len(NGINX) // 2
+        received = []
+
+        class Honeytail(object):
+            def __init__(self):
+                self.stdin = self
+
+            def write(self, data):
+                received.append(data)
+
+            def close(self):
+                pass
+
+            def wait(self):
+                return 0
+
+        results = run_files([path], lambda index, path: Honeytail(), 1, starts={path: start})
+        self.assertEqual(results[0].written, len(NGINX) - start)
+        self.assertEqual(b"".join(received), NGINX[start:])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import context
+from cache import VERIFIED_MARKER, HoneytailCache
+
+BINARY = b"#!/bin/sh\necho honeytail\n"
+CHECKSUM = hashlib.sha256(BINARY).hexdigest()
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = HoneytailCache(self.dir)
+        self.cache.dirs = [self.dir]
+        self.entry = self.cache.entry_dir(self.dir, "1.0", CHECKSUM)
+        os.makedirs(self.entry)
+        os.chmod(self.entry, 0o755)
+        self.path = os.path.join(self.entry, "honeytail")
+        self.write(BINARY)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, data):
+        with open(self.path, "wb") as fh:
+            fh.write(data)
+        os.chmod(self.path, 0o755)
+
+    def test_lookup_verifies_and_marks(self):
+        self.assertEqual(self.cache.lookup("1.0", CHECKSUM), self.path)
+        with open(os.path.join(self.entry, VERIFIED_MARKER)) as fh:
+            self.assertTrue(fh.read().startswith(CHECKSUM + " "))
+        self.assertIsNone(self.cache.lookup("1.1", CHECKSUM))
+
+    def test_bad_binary(self):
+        self.write(b"#!/bin/sh\necho gotcha\n")
+        self.assertIsNone(self.cache.lookup("1.0", CHECKSUM))
+
+    def test_old_marker_is_ignored(self):
+        st = os.stat(self.path)
+        with open(os.path.join(self.entry, VERIFIED_MARKER), "w") as fh:
+            fh.write("{} {}".format(st.st_size, int(st.st_mtime)))
+        self.write(b"#!/bin/sh\necho gotcha\n"[:len(BINARY)].ljust(len(BINARY)))
+        os.utime(self.path, (st.st_atime, st.st_mtime))
+        self.assertIsNone(self.cache.lookup("1.0", CHECKSUM))
+
+    def test_shared_binary_is_rehashed(self):
+        self.assertEqual(self.cache.lookup("1.0", CHECKSUM), self.path)
+        os.chmod(self.path, 0o777)
+        self.assertFalse(self.cache._is_verified(self.entry, self.path, CHECKSUM))
+        self.assertEqual(self.cache.lookup("1.0", CHECKSUM), self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
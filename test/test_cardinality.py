@@ -0,0 +1,96 @@
+import json
+import unittest
+
+import context
+from cardinality import (MAX_KEY_CARDINALITY, HyperLogLog, choose_sampling_keys, field_cardinalities, key_flags,
+                         parse_debug_events)
+
+SHAPE = ("--request_shape", "request")
+
+
+def events(count, **fields):
+    """count events, with field: function of the event's index"""
+    return [dict((name, value(i)) for name, value in fields.iteritems() if value(i) is not None) for i in range(count)]
+
+
+class HyperLogLogTest(unittest.TestCase):
+    def check(self, distinct, tolerance):
+        sketch = HyperLogLog()
+        for i in range(distinct):
+            sketch.add("value-{}".format(i))
+            # repeats don't count
+            sketch.add("value-{}".format(i))
+        self.assertLessEqual(abs(sketch.count() - distinct), tolerance * distinct)
+
+    def test_small_counts(self):
+        self.check(10, 0.1)
+        self.check(200, 0.05)
+
+    def test_large_counts(self):
+        # about 3% standard error; allow four of them
+        self.check(20000, 0.13)
+        self.check(100000, 0.13)
+
+    def test_unicode(self):
+        sketch = HyperLogLog()
+        sketch.add(u"caf\xe9")
+        sketch.add(u"caf\xe9".encode("utf-8"))
+        self.assertEqual(sketch.count(), 1)
+
+
+class ChooseKeysTest(unittest.TestCase):
+    def choose(self, evs, candidates=()):
+        return choose_sampling_keys(field_cardinalities(evs), len(evs), candidates)
+
+    def test_fewest_values_first(self):
+        evs = events(1000, status=lambda i: i % 5, method=lambda i: i % 3, host=lambda i: i % 50)
+        self.assertEqual(self.choose(evs), ["method", "status"])
+
+    def test_candidates_first(self):
+        evs = events(1000, status=lambda i: i % 5, method=lambda i: i % 3, host=lambda i: i % 50)
+        self.assertEqual(self.choose(evs, ["host"]), ["host", "method"])
+
+    def test_presence_cutoff(self):
+        # on 85% of events: under MIN_PRESENCE
+        evs = events(1000, status=lambda i: i % 5, method=lambda i: i % 3 if i % 20 >= 3 else None)
+        self.assertEqual(self.choose(evs), ["status"])
+
+    def test_cardinality_cutoffs(self):
+        evs = events(2000, id=lambda i: i, constant=lambda i: "x", status=lambda i: i % 5)
+        self.assertEqual(self.choose(evs), ["status"])
+        evs = events(2000, path=lambda i: i % (MAX_KEY_CARDINALITY * 2))
+        self.assertEqual(self.choose(evs), [])
+
+    def test_key_space(self):
+        # 40 * 30 keys between them is too many, so the second key is the
+        # next one that fits
+        evs = events(3000, a=lambda i: i % 40, b=lambda i: i % 30, c=lambda i: i % 20)
+        self.assertEqual(self.choose(evs, ["a", "b", "c"]), ["a", "c"])
+
+
+class KeyFlagsTest(unittest.TestCase):
+    def test_plain_keys(self):
+        self.assertEqual(key_flags(["status"]), [("--dynsampling", "status")])
+
+    def test_keys_keep_parse_flags(self):
+        # request_method only exists because the sample was shaped
+        self.assertEqual(key_flags(["request_method", "status"], [SHAPE]),
+                         [SHAPE, ("--dynsampling", "request_method"), ("--dynsampling", "status")])
+
+    def test_no_keys(self):
+        self.assertEqual(key_flags([], [SHAPE]), [])
+
+
+class ParseDebugEventsTest(unittest.TestCase):
+    def test_events(self):
+        output = "\n".join([
+            "time=... level=info msg=starting",
+            json.dumps({"data": {"status": 200}, "time": "2016-10-01T12:00:00Z"}),
+            json.dumps({"status": 404}),
+            json.dumps([1, 2]),
+        ])
+        self.assertEqual(parse_debug_events(output), [{"status": 200}, {"status": 404}])
+
+
+if __name__ == "__main__":
+    unittest.main()
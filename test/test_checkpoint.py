@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import context
+from backfill import run_segments
+from checkpoint import Checkpoint
+from installer import HoneyInstaller
+
+LINE = b"0123456789abcde\n"
+
+
+class FakeStdin(object):
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    def close(self):
+        pass
+
+
+class FakeHoneytail(object):
+    """stands in for a honeytail reading a piece on stdin"""
+    def __init__(self, returncode):
+        self.stdin = FakeStdin()
+        self.returncode = returncode
+
+    def wait(self):
+        return self.returncode
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.dir, "log")
+        with open(self.log, "wb") as fh:
+            fh.write(LINE * 64)
+        self.size = len(LINE) * 64
+        self.spawned = []
+        self.honeytails = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def checkpoint(self):
+        return Checkpoint(os.path.join(self.dir, "state", "backfill.json"), os.stat(self.log))
+
+    def spawn(self, fail_after=None):
+        def _spawn(index, start, end):
+            failed = fail_after is not None and len(self.spawned) >= fail_after
+            self.spawned.append((start, end))
+            honeytail = FakeHoneytail(1 if failed else 0)
+            self.honeytails.append(honeytail)
+            return honeytail
+        return _spawn
+
+    def test_pieces_are_checkpointed_as_they_finish(self):
+        checkpoint = self.checkpoint()
+        checkpoint.begin([(0, self.size)])
+        results = run_segments(self.log, [(0, self.size)], self.spawn(fail_after=2), 1,
+                               checkpoint=checkpoint, piece_size=self.size // 4)
+        self.assertEqual(results[0].returncode, 1)
+        # the first two pieces finished; the third failed and isn't recorded
+        self.assertEqual(len(self.spawned), 3)
+        self.assertEqual(checkpoint.remaining(), [(self.spawned[2][0], self.size)])
+        for start, end in self.spawned:
+            self.assertEqual(start % len(LINE), 0)
+
+        checkpoint.save()
+        loaded = Checkpoint.load(checkpoint.path, os.stat(self.log))
+        self.assertEqual(loaded.remaining(), checkpoint.remaining())
+        self.assertEqual(loaded.done, self.spawned[2][0])
+
+    def test_finished_segments(self):
+        checkpoint = self.checkpoint()
+        segments = [(0, self.size // 2), (self.size // 2, self.size)]
+        checkpoint.begin(segments)
+        results = run_segments(self.log, segments, self.spawn(), 2, checkpoint=checkpoint, piece_size=100)
+        self.assertEqual([r.written for r in results], [self.size // 2, self.size // 2])
+        self.assertEqual(checkpoint.remaining(), [])
+        self.assertEqual(checkpoint.done, checkpoint.total)
+
+    def test_stale_checkpoint(self):
+        checkpoint = self.checkpoint()
+        checkpoint.begin([(0, self.size * 2)])
+        self.assertIsNone(Checkpoint.load(checkpoint.path, os.stat(self.log)))
+
+    def test_resume_picks_up_what_was_logged_since(self):
+        # an earlier ONLY_BACKFILL run got through half of the first half
+        checkpoint = self.checkpoint()
+        checkpoint.begin([(0, self.size // 2), (self.size // 2, self.size)])
+        checkpoint.set(0, self.size // 4)
+        checkpoint.finish(1)
+        with open(self.log, "ab") as fh:
+            fh.write(LINE * 16)
+
+        installer = HoneyInstaller("test", "0.0", "nginx", "", "key", "test", "Test", "honeytail", False)
+        installer.log_file = self.log
+        spawned = self.spawn()
+        installer.spawn_honeytail = lambda command, **kwargs: spawned(None, None, None)
+        bars = []
+        get_progress_bar = installer.get_progress_bar
+        installer.get_progress_bar = lambda length, start=0: bars.append((length, start)) or get_progress_bar(length, start)
+        installer.segmented_backfill(0, None, Checkpoint.load(checkpoint.path, os.stat(self.log)))
+
+        received = b"".join(honeytail.stdin.data for honeytail in self.honeytails)
+        self.assertEqual(received, LINE * (16 + 16))
+        # the bar counts what the earlier run did as done
+        self.assertEqual(bars, [(self.size + len(LINE) * 16, self.size * 3 // 4)])
+
+
+if __name__ == "__main__":
+    unittest.main()
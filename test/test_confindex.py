@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import context
+import confparser
+from confindex import ConfigIndex
+from includes import IncludeResolver
+
+MAIN = """
+http {
+    log_format main '$remote_addr [$time_local] "$request" $status';
+    access_log /var/log/nginx/access.log main;
+    include conf.d/*.conf;
+}
+"""
+
+SITE = """
+log_format main '$remote_addr';
+log_format api escape=json '{"status":$status}';
+server {
+    server_name api.example.com;
+    access_log /var/log/nginx/api.log api;
+    location /internal {
+        access_log off;
+    }
+    location /v1 {
+        access_log /var/log/nginx/v1.log main buffer=32k;
+    }
+}
+"""
+
+
+class ConfigIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.conf = self.write("nginx.conf", MAIN)
+        self.site = self.write("conf.d/api.conf", SITE)
+        tree = IncludeResolver(lambda source, path: confparser.loads(source)).load(self.conf)
+        self.index = ConfigIndex(tree)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, source):
+        path = os.path.join(self.dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as fh:
+            fh.write(source)
+        return path
+
+    def test_access_logs_across_includes(self):
+        logs = self.index.access_logs()
+        self.assertEqual([d.args.split()[0] for d in logs],
+                         ["/var/log/nginx/access.log", "/var/log/nginx/api.log", "/var/log/nginx/v1.log"])
+        self.assertEqual([d.source for d in logs], [self.conf, self.site, self.site])
+        # access_log off is still a directive, just not a log
+        self.assertEqual(len(self.index.find("access_log")), 4)
+
+    def test_enclosing_blocks(self):
+        main, api, v1 = self.index.access_logs()
+        self.assertEqual(main.context, "http")
+        self.assertEqual(api.context, "http > server")
+        self.assertEqual(v1.context, "http > server > location /v1")
+        self.assertEqual([block[0][0] for block in v1.blocks], ["http", "server", "location"])
+        server_name, = self.index.find("server_name")
+        self.assertEqual(server_name.args, "api.example.com")
+        self.assertIs(server_name.blocks[-1], api.blocks[-1])
+
+    def test_log_format_first_definition_wins(self):
+        main = self.index.log_format("main")
+        self.assertIn("$time_local", main.args)
+        self.assertEqual(main.source, self.conf)
+        api = self.index.log_format("api")
+        self.assertEqual(api.source, self.site)
+        self.assertTrue(api.args.startswith("api escape=json"))
+
+    def test_combined_is_predefined(self):
+        combined = self.index.log_format("combined")
+        self.assertIsNone(combined.source)
+        self.assertIn("$http_user_agent", combined.args)
+        self.assertIsNone(self.index.log_format("missing"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+import context
+import confparser
+from nginxparser import NginxParser
+
+CONF = """
+user www-data;
+worker_processes 4;
+
+http {
+    # the usual
+    log_format main '$remote_addr - $remote_user [$time_local] "$request" '
+                    '$status $body_bytes_sent';
+    access_log /var/log/nginx/access.log main;
+    include /etc/nginx/conf.d/*.conf;
+
+    server {
+        listen 80;
+        location ~ /static {
+            root /srv;
+        }
+        location / {
+            proxy_pass http://backend;
+        }
+    }
+}
+"""
+
+
+class ConfParserTest(unittest.TestCase):
+    def test_same_tree_as_pyparsing(self):
+        self.assertEqual(confparser.loads(CONF), NginxParser(CONF).as_list())
+
+    def test_tree(self):
+        tree = confparser.loads(CONF)
+        self.assertEqual(tree[0], ["user", "www-data"])
+        http = tree[2]
+        self.assertEqual(http[0], ["http"])
+        self.assertEqual(http[1][1], ["access_log", "/var/log/nginx/access.log main"])
+
+    def test_quoted_punctuation(self):
+        tree = confparser.loads("""log_format x '{"a":"$a"}; done';""")
+        self.assertEqual(tree, [["log_format", """x '{"a":"$a"}; done'"""]])
+
+    def test_blocks_with_many_arguments(self):
+        tree = confparser.loads("map $http_host $name { default 0; example.com 1; }")
+        self.assertEqual(tree, [[["map", "$http_host", "$name"], [["default", "0"], ["example.com", "1"]]]])
+
+    def test_errors(self):
+        self.assertRaises(confparser.NginxConfigError, confparser.loads, "http { listen 80;")
+        self.assertRaises(confparser.NginxConfigError, confparser.loads, "listen 80; }")
+        self.assertRaises(confparser.NginxConfigError, confparser.loads, "log_format x 'unterminated;")
+        try:
+            confparser.loads("a b;\nc d }")
+        except confparser.NginxConfigError as e:
+            self.assertIn("line 2", str(e))
+
+
+if __name__ == "__main__":
+    unittest.main()
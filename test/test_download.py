@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from requests.structures import CaseInsensitiveDict
+
+import context
+import installer
+from installer import HoneyInstaller
+
+URL = "https://example.com/honeytail"
+DATA = b"".join(b"%05d\n" % i for i in range(2000))
+CHANGED = DATA.replace(b"0", b"9")
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, body=b"", headers=None, truncate=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = CaseInsensitiveDict(headers or {})
+        if body and "Content-length" not in self.headers:
+            self.headers["Content-length"] = str(len(body))
+        # send only this much of the body, as if the connection dropped
+        self.truncate = truncate
+        self.raw = self
+
+    def iter_content(self, size):
+        body = self.body[:self.truncate] if self.truncate is not None else self.body
+        for i in range(0, len(body), size):
+            yield body[i:i + size]
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, stream=False, headers=None, timeout=None):
+        self.requests.append(dict(headers or {}))
+        return self.responses.pop(0)
+
+
+class DownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.dest_tmp = os.path.join(self.dir, "honeytail-tmp")
+        self.backoff = installer.DOWNLOAD_BACKOFF
+        installer.DOWNLOAD_BACKOFF = 0
+        self.installer = HoneyInstaller("test", "0.0", "nginx", "", "key", "test", "Test", "honeytail", False)
+
+    def tearDown(self):
+        installer.DOWNLOAD_BACKOFF = self.backoff
+        shutil.rmtree(self.dir)
+
+    def serve(self, *responses):
+        self.installer.sessions.session = FakeSession(responses)
+        return self.installer.sessions.session
+
+    def partial(self, data, url=URL, validator='"v1"'):
+        """leaves an earlier run's partial download of url behind"""
+        with open(self.dest_tmp, "wb") as fh:
+            fh.write(data)
+        with open(self.dest_tmp + ".json", "w") as fh:
+            json.dump({"url": url, "validator": validator}, fh)
+
+    def fetch(self, checksum=None):
+        return self.installer.fetch_file("honeytail", URL, checksum or hashlib.sha256(DATA).hexdigest(),
+                                         dest_dir=self.dir, quiet=True)
+
+    def read(self, path):
+        with open(path, "rb") as fh:
+            return fh.read()
+
+    def test_fresh_download(self):
+        session = self.serve(FakeResponse(200, DATA, {"ETag": '"v1"'}))
+        dest = self.fetch()
+        self.assertEqual(self.read(dest), DATA)
+        self.assertNotIn("Range", session.requests[0])
+        self.assertFalse(os.path.exists(self.dest_tmp + ".json"))
+
+    def test_resume_with_206(self):
+        half = len(DATA) // 2
+        self.partial(DATA[:half])
+        session = self.serve(FakeResponse(206, DATA[half:]))
+        dest = self.fetch()
+        self.assertEqual(session.requests[0]["Range"], "bytes={}-".format(half))
+        self.assertEqual(session.requests[0]["If-Range"], '"v1"')
+        self.assertEqual(self.read(dest), DATA)
+
+    def test_changed_file_restarts_with_200(self):
+        self.partial(DATA[:100])
+        self.serve(FakeResponse(200, CHANGED, {"ETag": '"v2"'}))
+        dest = self.fetch(hashlib.sha256(CHANGED).hexdigest())
+        self.assertEqual(self.read(dest), CHANGED)
+
+    def test_416_starts_over(self):
+        self.partial(DATA + b"extra")
+        session = self.serve(FakeResponse(416), FakeResponse(200, DATA, {"ETag": '"v1"'}))
+        dest = self.fetch()
+        self.assertIn("Range", session.requests[0])
+        self.assertNotIn("Range", session.requests[1])
+        self.assertEqual(self.read(dest), DATA)
+
+    def test_other_url_not_resumed(self):
+        self.partial(DATA[:100], url="https://example.com/other")
+        session = self.serve(FakeResponse(200, DATA))
+        self.assertEqual(self.read(self.fetch()), DATA)
+        self.assertNotIn("Range", session.requests[0])
+
+    def test_weak_etag_resumes_on_last_modified(self):
+        session = self.serve(FakeResponse(200, DATA, {"ETag": 'W/"v1"', "Last-Modified": "Sat, 01 Oct 2016 12:00:00 GMT"},
+                                          truncate=100),
+                             FakeResponse(206, DATA[100:]))
+        self.assertEqual(self.read(self.fetch()), DATA)
+        self.assertEqual(session.requests[1]["Range"], "bytes=100-")
+        self.assertEqual(session.requests[1]["If-Range"], "Sat, 01 Oct 2016 12:00:00 GMT")
+
+    def test_checksum_checked_after_resume(self):
+        half = len(DATA) // 2
+        # what we have on disk isn't the start of the file the server sends
+        self.partial(CHANGED[:half])
+        self.serve(FakeResponse(206, DATA[half:]))
+        with self.assertRaises(SystemExit):
+            self.fetch()
+        self.assertTrue(os.path.exists(os.path.join(self.dir, "honeytail-badchecksum")))
+        self.assertFalse(os.path.exists(self.dest_tmp + ".json"))
+
+
+if __name__ == "__main__":
+    unittest.main()
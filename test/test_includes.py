@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import context
+import confparser
+from includes import IncludeResolver
+
+
+class IncludeTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.warnings = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, source):
+        path = os.path.join(self.dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as fh:
+            fh.write(source)
+        return path
+
+    def load(self, path):
+        resolver = IncludeResolver(lambda source, path: confparser.loads(source), warn=self.warnings.append)
+        return resolver.load(path)
+
+    def test_includes_are_spliced_in_order(self):
+        conf = self.write("nginx.conf", "http { include conf.d/*.conf; include missing.conf; }")
+        self.write("conf.d/b.conf", "server { listen 81; }")
+        self.write("conf.d/a.conf", "server { listen 80; include extra.conf; }")
+        self.write("extra.conf", "root /srv;")
+        tree = self.load(conf)
+        servers = tree[0][1]
+        self.assertEqual(servers, [[["server"], [["listen", "80"], ["root", "/srv"]]],
+                                   [["server"], [["listen", "81"]]]])
+        self.assertEqual(servers[0][1][1].source, os.path.join(self.dir, "extra.conf"))
+        self.assertEqual(len(self.warnings), 1)
+
+    def test_cycle(self):
+        conf = self.write("nginx.conf", "include a.conf;")
+        self.write("a.conf", "listen 80; include nginx.conf;")
+        self.assertEqual(self.load(conf), [["listen", "80"]])
+        self.assertIn("cycle", self.warnings[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+
+import context
+from fieldsize import measure_fields, recommend_field_flags
+from logformat import (MAX_FAILURES, compile_directive, compile_log_format, extend_log_format, format_string, match_lines,
+                       quote_variable, tokenize)
+
+COMBINED = """combined '$remote_addr - $remote_user [$time_local] '
+                    '"$request" $status $body_bytes_sent '
+                    '"$http_referer" "$http_user_agent"'"""
+
+LINE = '10.0.0.1 - - [01/Oct/2016:12:00:00 +0000] "GET /a?b=c HTTP/1.1" 200 612 "-" "curl/7.47.0 (x86_64)"'
+
+
+class FormatTest(unittest.TestCase):
+    def test_format_string(self):
+        self.assertEqual(format_string(COMBINED),
+                         '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent '
+                         '"$http_referer" "$http_user_agent"')
+
+    def test_format_string_escapes_and_params(self):
+        self.assertEqual(format_string("""json escape=json '{"a":"$a",' '"b":"${b}x"}'"""), '{"a":"$a","b":"${b}x"}')
+        self.assertEqual(format_string("""main "say \\"$x\\"" bare$y"""), 'say "$x"bare$y')
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("$a - ${b}c"), [("", "a"), (" - ", "b"), ("c", None)])
+
+    def test_compile_splits_fields(self):
+        regex, variables = compile_directive(COMBINED)
+        self.assertEqual(variables, ["remote_addr", "remote_user", "time_local", "request", "status",
+                                     "body_bytes_sent", "http_referer", "http_user_agent"])
+        match = regex.match(LINE)
+        self.assertEqual(match.group("request"), "GET /a?b=c HTTP/1.1")
+        self.assertEqual(match.group("http_user_agent"), "curl/7.47.0 (x86_64)")
+        self.assertIsNone(regex.match("not an access log line"))
+
+    def test_quote_variable(self):
+        # timings are single numbers, but headers and upstream lists can have spaces
+        self.assertEqual(quote_variable("$request_time"), "$request_time")
+        self.assertEqual(quote_variable("request_time"), "$request_time")
+        self.assertEqual(quote_variable("$upstream_response_time"), '"$upstream_response_time"')
+        self.assertEqual(quote_variable('"$http_x_forwarded_for"'), '"$http_x_forwarded_for"')
+
+    def test_extend_log_format(self):
+        self.assertEqual(extend_log_format("""main '$remote_addr "$request"'""", ["$request_time", "$upstream_response_time"]),
+                         """main '$remote_addr "$request" $request_time "$upstream_response_time"'""")
+        # the format's strings are joined into one quoted string
+        self.assertEqual(extend_log_format("plain '$remote_addr ' [$time_local]", ["$request_time"]),
+                         "plain '$remote_addr [$time_local] $request_time'")
+        self.assertEqual(extend_log_format("""main "'$remote_addr'" """, ["$request_time"]),
+                         'main "\'$remote_addr\' $request_time"')
+
+    def test_repeated_variable(self):
+        regex, variables = compile_log_format("$a $a $b")
+        self.assertEqual(variables, ["a", "b"])
+        self.assertEqual(regex.match("1 2 3").group("b"), "3")
+
+
+class FieldSizeTest(unittest.TestCase):
+    def test_recommendations(self):
+        regex, variables = compile_log_format('$remote_addr "$request" $server_name "$http_cookie"')
+        lines = ['10.0.0.{} "GET /{} HTTP/1.1" www "sid=abc{}"'.format(i, i, i) for i in range(20)]
+        lines.append("garbage")
+        fields, matched, total = measure_fields(lines, regex, variables)
+        self.assertEqual(matched, 20)
+        self.assertEqual(fields["remote_addr"].present, 20)
+
+        recs = dict((field, flag) for flag, field, reason, saved in recommend_field_flags(fields, matched))
+        self.assertEqual(recs.get("http_cookie"), "--scrub_field")
+        # always the same, but too useful to drop
+        self.assertNotIn("server_name", recs)
+        self.assertNotIn("request", recs)
+
+
+class MatchLinesTest(unittest.TestCase):
+    def test_match_rate(self):
+        regex, variables = compile_directive(COMBINED)
+        result = match_lines(regex, [LINE] * 8 + ["garbage"] * 2)
+        self.assertEqual((result.matched, result.total), (8, 10))
+        self.assertEqual(result.rate, 0.8)
+        self.assertEqual(result.failures, ["garbage", "garbage"])
+
+    def test_failures_are_capped(self):
+        regex, variables = compile_directive(COMBINED)
+        lines = ["bad line {}".format(i) for i in range(10)]
+        result = match_lines(regex, lines)
+        self.assertEqual(result.matched, 0)
+        self.assertEqual(result.failures, lines[:MAX_FAILURES])
+
+    def test_no_lines(self):
+        regex, variables = compile_directive(COMBINED)
+        self.assertEqual(match_lines(regex, []).rate, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,296 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+import context
+import confparser
+from confindex import ConfigIndex
+from nginx_installer import NginxInstaller
+from nginxbuild import NginxBuild
+
+LINE = b'127.0.0.1 - - [10/Oct/2016:13:55:36 -0700] "GET / HTTP/1.1" 200 612\n'
+JSON_LINE = b'{"time":"2016-10-10T13:55:36-07:00","status":200}\n'
+
+
+class JsonLogTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.dir, "access.log")
+        self.json_log = os.path.join(self.dir, "access.json.log")
+        with open(self.log, "wb") as fh:
+            fh.write(LINE * 10)
+        with open(self.json_log, "wb") as fh:
+            fh.write(JSON_LINE * 3)
+        self.installer = NginxInstaller("key", "nginx", "honeytail", False, self.log, "/etc/nginx/nginx.conf", "combined")
+        self.installer.log_file = self.log
+        self.installer.get_tail_statefile = lambda path: os.path.join(self.dir, os.path.basename(path) + ".state")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read_state(self, statefile):
+        with open(statefile) as fh:
+            return json.load(fh)
+
+    def test_groups_without_json_log(self):
+        groups = self.installer.get_tail_groups()
+        self.assertEqual([(parser, files) for parser, flags, files in groups], [("nginx", [self.log])])
+
+    def test_added_json_log_replaces_text_log(self):
+        self.installer.json_log = self.json_log
+        groups = self.installer.get_tail_groups()
+        self.assertEqual([(parser, files) for parser, flags, files in groups], [("json", [self.json_log])])
+
+    def test_json_format_log_switches_parser(self):
+        self.installer.json_log = self.log
+        groups = self.installer.get_tail_groups()
+        self.assertEqual([(parser, files) for parser, flags, files in groups], [("json", [self.log])])
+
+    def test_json_format_log_commands_all_use_json(self):
+        # the backfill, probe and shown commands parse it as the tail does
+        self.installer.json_log = self.log
+        self.installer.field_flags = "--drop_field=body_bytes_sent "
+        self.installer.pre_backfill_hook()
+        self.assertEqual(self.installer.parser_module, "json")
+        lines = self.installer.get_backfill_lines(self.log)
+        with CliRunner().isolation() as out:
+            self.installer.pre_tail_hook(after_backfill=False)
+            for parser, flags, files in self.installer.get_tail_groups():
+                lines += self.installer.get_tail_lines(files, parser_extra_flags=flags, parser_module=parser)
+            self.installer.show_commands()
+        for output in ["\n".join(lines), out.getvalue()]:
+            self.assertIn('--parser="json" --drop_field=body_bytes_sent', output)
+            self.assertNotIn("--parser=\"nginx\"", output)
+            self.assertNotIn("--nginx.format", output)
+            self.assertNotIn("nginx config", output)
+
+    def test_text_log_commands_use_nginx(self):
+        self.installer.json_log = self.json_log
+        self.installer.pre_backfill_hook()
+        self.assertEqual(self.installer.parser_module, "nginx")
+        self.assertIn('--nginx.format="combined"', "\n".join(self.installer.get_backfill_lines(self.log)))
+
+    def test_json_tail_starts_at_snapshot(self):
+        self.installer.json_log = self.json_log
+        self.installer.take_snapshots()
+        self.assertEqual(self.installer.snapshot.offset, len(LINE) * 10)
+        self.assertEqual(self.installer.json_snapshot.offset, len(JSON_LINE) * 3)
+
+        # logged during the backfill; the tail should pick these up
+        with open(self.json_log, "ab") as fh:
+            fh.write(JSON_LINE * 2)
+        statefile = self.installer.get_handoff_statefile([self.json_log])
+        state = self.read_state(statefile)
+        self.assertEqual(state["INode"], os.stat(self.json_log).st_ino)
+        self.assertEqual(state["Offset"], len(JSON_LINE) * 3)
+
+    def test_json_tail_after_rotation_starts_at_top(self):
+        self.installer.json_log = self.json_log
+        self.installer.take_snapshots()
+        os.rename(self.json_log, self.json_log + ".1")
+        with open(self.json_log, "wb") as fh:
+            fh.write(JSON_LINE)
+        statefile = self.installer.get_handoff_statefile([self.json_log])
+        state = self.read_state(statefile)
+        self.assertEqual(state["INode"], os.stat(self.json_log).st_ino)
+        self.assertEqual(state["Offset"], 0)
+
+    def test_json_format_log_uses_text_snapshot(self):
+        self.installer.json_log = self.log
+        self.installer.take_snapshots()
+        self.assertIsNone(self.installer.json_snapshot)
+        statefile = self.installer.get_handoff_statefile([self.log])
+        self.assertEqual(self.read_state(statefile)["Offset"], len(LINE) * 10)
+
+    def test_no_snapshot_for_other_logs(self):
+        self.installer.take_snapshots()
+        self.assertIsNone(self.installer.get_handoff_statefile([os.path.join(self.dir, "other.log")]))
+
+
+CONF = """
+http {
+    log_format short '[$time_local] $remote_addr';
+    log_format main '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent';
+    access_log /var/log/nginx/access.log short;
+}
+"""
+
+
+class CheckLogFormatTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.dir, "access.log")
+        self.index = ConfigIndex(confparser.loads(CONF))
+        self.installer = NginxInstaller("key", "nginx", "honeytail", False, self.log, None, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def check(self, lines, name, answer=""):
+        with open(self.log, "wb") as fh:
+            fh.write(b"".join(line + b"\n" for line in lines))
+        with CliRunner().isolation(input=answer) as out:
+            chosen = self.installer._check_log_format(self.index, self.log, name)
+        return chosen, out.getvalue()
+
+    def test_format_matches(self):
+        chosen, output = self.check([b"[01/Oct/2016:12:00:00 +0000] 10.0.0.1"] * 10, "short")
+        self.assertEqual(chosen, "short")
+        self.assertIn("10 of the last 10 lines (100.0%) match", output)
+        self.assertNotIn("don't match", output)
+
+    def test_better_format_offered(self):
+        chosen, output = self.check([LINE.rstrip(b"\n")] * 10, "short", "y\n")
+        self.assertEqual(chosen, "main")
+        self.assertIn("0 of the last 10 lines (0.0%) match", output)
+        self.assertIn("The 'main' format matches 100.0% of them.", output)
+        # the lines that didn't match are shown, up to a few of them
+        self.assertEqual(output.count(LINE.rstrip(b"\n")), 3)
+
+    def test_better_format_declined(self):
+        chosen, output = self.check([LINE.rstrip(b"\n")] * 10, "short", "n\n")
+        self.assertEqual(chosen, "short")
+
+    def test_nothing_matches_better(self):
+        chosen, output = self.check([b"garbage"] * 10, "short")
+        self.assertEqual(chosen, "short")
+        self.assertIn("garbage", output)
+        self.assertIn("None of the log formats in your nginx config match it any better", output)
+
+
+class AccessLogsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.conf = os.path.join(self.dir, "nginx.conf")
+        self.installer = NginxInstaller("key", "nginx", "honeytail", False, None, None, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def log(self, name):
+        path = os.path.join(self.dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as fh:
+            fh.write("")
+        return path
+
+
+class GroupAccessLogsTest(AccessLogsTest):
+    def group(self, conf, log_filename, name="main"):
+        index = ConfigIndex(confparser.loads(conf))
+        with CliRunner().isolation() as out:
+            groups = self.installer._group_access_logs(index, self.conf, log_filename, name)
+        return groups, out.getvalue()
+
+    def test_same_basename_in_different_directories(self):
+        a, b, other = self.log("a/access.log"), self.log("b/access.log"), self.log("b/other.log")
+        groups, output = self.group("""
+            log_format main '$remote_addr $status';
+            access_log {} main;
+            access_log {} main;
+            access_log {} main;
+        """.format(a, b, other), a)
+        # a and b would share a <basename>.leash.state, so they get a honeytail each
+        self.assertEqual([files for conf, name, files in groups], [[a, other], [b]])
+        self.assertEqual([name for conf, name, files in groups], ["main", "main"])
+        for conf, name, files in groups:
+            basenames = [os.path.basename(f) for f in files]
+            self.assertEqual(len(basenames), len(set(basenames)))
+
+    def test_formats_grouped_and_skips(self):
+        main, combined, gzipped = self.log("main.log"), self.log("combined.log"), self.log("gzipped.log.gz")
+        groups, output = self.group("""
+            log_format main '$remote_addr $status';
+            access_log {} main;
+            access_log {};
+            access_log {} main gzip;
+            access_log {} undefined;
+            access_log syslog:server=10.0.0.1;
+        """.format(main, combined, gzipped, self.log("undefined.log")), main)
+        self.assertEqual([(name, files) for conf, name, files in groups], [("main", [main]), ("combined", [combined])])
+        self.assertIn("Skipping {}: it's gzipped".format(gzipped), output)
+        self.assertIn("its log_format 'undefined' isn't in your nginx config", output)
+
+
+class UncompressedLogTest(AccessLogsTest):
+    def choose(self, conf, gzipped, answer):
+        index = ConfigIndex(confparser.loads(conf))
+        with CliRunner().isolation(input=answer) as out:
+            chosen = self.installer._choose_uncompressed_log(index, self.conf, gzipped, "main")
+        return chosen, out.getvalue()
+
+    def test_other_logs_offered(self):
+        gzipped, plain, other = self.log("access.log.gz"), self.log("access.log"), self.log("other.log")
+        chosen, output = self.choose("""
+            access_log {} main gzip;
+            access_log {} main gzip=9;
+            access_log {} main;
+            access_log {} combined;
+            access_log syslog:server=10.0.0.1;
+        """.format(gzipped, self.log("also.log.gz"), plain, other), gzipped, "2\n")
+        self.assertEqual(chosen, (other, "combined"))
+        self.assertIn("[1] {} (main)".format(plain), output)
+        self.assertNotIn(".gz (", output)
+        self.assertNotIn("syslog", output)
+
+    def test_asks_without_other_logs(self):
+        gzipped, plain = self.log("access.log.gz"), self.log("access.log")
+        chosen, output = self.choose("access_log {} main gzip;".format(gzipped), gzipped,
+                                     "{}\n{}\n".format(os.path.join(self.dir, "missing.log"), plain))
+        self.assertEqual(chosen, (plain, "main"))
+        self.assertIn("add a second, uncompressed access_log", output)
+        self.assertIn("missing.log doesn't exist", output)
+
+
+class LogRecsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.dir, "access.log")
+        with open(self.log, "w") as fh:
+            fh.write("")
+        self.installer = NginxInstaller("key", "nginx", "honeytail", False, self.log, None, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def recs(self, conf):
+        index = ConfigIndex(confparser.loads("""
+            http {{
+                log_format main '$remote_addr [$time_local] "$request" $status';
+                {}
+            }}
+        """.format(conf)))
+        with CliRunner().isolation(input="y\ny\n") as out:
+            self.installer._give_log_recs("/etc/nginx/nginx.conf", "main", self.log, index.log_format("main"),
+                                          "1.10.0", NginxBuild(), index=index)
+        return out.getvalue()
+
+    def test_config_uses(self):
+        index = ConfigIndex(confparser.loads("gzip off; server { location / { proxy_pass http://backend; } }"))
+        self.assertTrue(self.installer._config_uses(index, ("fastcgi_pass", "proxy_pass")))
+        self.assertFalse(self.installer._config_uses(index, ("gzip",)))
+        self.assertFalse(self.installer._config_uses(index, ("proxy_cache",)))
+
+    def test_no_backend(self):
+        output = self.recs("gzip off;")
+        self.assertIn("$connection_requests", output)
+        for var in ["$upstream_response_time", "$upstream_cache_status", "$gzip_ratio", "$ssl_protocol"]:
+            self.assertNotIn(var, output)
+
+    def test_proxied_and_gzipped(self):
+        output = self.recs("gzip on; server { location / { proxy_pass http://backend; } }")
+        self.assertIn("$gzip_ratio", output)
+        self.assertNotIn("$upstream_cache_status", output)
+        # in the suggested log_format, timings stay bare and upstream lists are quoted
+        self.assertIn(' $request_time ', output)
+        self.assertIn(' "$upstream_response_time" ', output)
+        self.assertIn(' "$upstream_addr" ', output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import context
+from nginxbuild import NginxBuild, load_build, parse_build, save_build
+
+NGINX_V = """nginx version: nginx/1.10.3 (Ubuntu)
+built with OpenSSL 1.0.2g  1 Mar 2016
+TLS SNI support enabled
+configure arguments: --with-cc-opt='-g -O2 -fstack-protector' --prefix=/usr/share/nginx --conf-path=/etc/nginx/nginx.conf --http-log-path=/var/log/nginx/access.log --with-http_ssl_module --with-http_realip_module --without-http_gzip_module
+"""
+
+
+class NginxBuildTest(unittest.TestCase):
+    def test_parse(self):
+        build = parse_build("/usr/sbin/nginx", NGINX_V)
+        self.assertTrue(build.known)
+        self.assertEqual(build.version, "1.10.3")
+        self.assertEqual(build.conf_path, "/etc/nginx/nginx.conf")
+        self.assertEqual(build.http_log_path, "/var/log/nginx/access.log")
+        self.assertEqual(build.modules, ["http_realip_module", "http_ssl_module"])
+
+    def test_relative_paths_use_prefix(self):
+        build = parse_build("nginx", "nginx version: nginx/1.12.0\nconfigure arguments: --prefix=/opt/nginx\n")
+        self.assertEqual(build.conf_path, "/opt/nginx/conf/nginx.conf")
+        self.assertEqual(build.http_log_path, "/opt/nginx/logs/access.log")
+
+    def test_supports_variable(self):
+        build = parse_build("/usr/sbin/nginx", NGINX_V)
+        self.assertTrue(build.supports_variable("$ssl_protocol"))
+        self.assertTrue(build.supports_variable("$upstream_response_time"))
+        self.assertFalse(build.supports_variable("$gzip_ratio"))
+        self.assertFalse(build.supports_variable('"$geoip_country_code"'))
+        self.assertTrue(build.supports_variable("$request_time"))
+
+    def test_unknown_build_supports_everything(self):
+        build = NginxBuild()
+        self.assertFalse(build.known)
+        self.assertTrue(build.supports_variable("$ssl_protocol"))
+        self.assertTrue(build.supports_variable("$gzip_ratio"))
+
+    def test_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            binary = os.path.join(directory, "nginx")
+            with open(binary, "w") as fh:
+                fh.write("#!/bin/sh\n")
+            cache_path = os.path.join(directory, "cache", "nginx-build.json")
+            save_build(cache_path, binary, parse_build(binary, NGINX_V))
+            self.assertEqual(load_build(cache_path, binary).version, "1.10.3")
+            with open(binary, "a") as fh:
+                fh.write("# rebuilt\n")
+            self.assertIsNone(load_build(cache_path, binary))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import context
+import confparser
+from includes import IncludeResolver
+from parsecache import ParseCache
+
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = ParseCache(os.path.join(self.dir, "cache"))
+        self.parsed = []
+        self.conf = self.write("nginx.conf", "http { include conf.d/*.conf; }")
+        self.site = self.write("conf.d/site.conf", "server { listen 80; }")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, source, mtime=1475323200):
+        path = os.path.join(self.dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as fh:
+            fh.write(source)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def parse(self, source, path):
+        tree = self.cache.get(path, source)
+        if tree is None:
+            self.parsed.append(path)
+            tree = confparser.loads(source)
+            self.cache.put(path, source, tree)
+        return tree
+
+    def load(self):
+        self.parsed = []
+        return IncludeResolver(self.parse).load(self.conf)
+
+    def test_hit(self):
+        first = self.load()
+        self.assertEqual(sorted(self.parsed), sorted([self.conf, self.site]))
+        self.assertEqual(self.load(), first)
+        self.assertEqual(self.parsed, [])
+        self.assertEqual(self.cache.hits, 2)
+
+    def test_included_file_size_changed(self):
+        self.load()
+        self.write("conf.d/site.conf", "server { listen 8080; }")
+        tree = self.load()
+        self.assertEqual(self.parsed, [self.site])
+        self.assertEqual(tree[0][1][0][1], [["listen", "8080"]])
+
+    def test_included_file_mtime_changed(self):
+        self.load()
+        os.utime(self.site, (1475323300, 1475323300))
+        self.load()
+        self.assertEqual(self.parsed, [self.site])
+
+    def test_same_size_and_mtime_new_source(self):
+        self.load()
+        self.write("conf.d/site.conf", "server { listen 81; }")
+        tree = self.load()
+        self.assertEqual(self.parsed, [self.site])
+        self.assertEqual(tree[0][1][0][1], [["listen", "81"]])
+
+    def test_corrupt_entry(self):
+        self.load()
+        with open(self.cache._entry_path(self.site), "wb") as fh:
+            fh.write(b"\x00not marshal")
+        self.load()
+        self.assertEqual(self.parsed, [self.site])
+        # and it's rewritten
+        self.load()
+        self.assertEqual(self.parsed, [])
+
+    def test_unwritable_cache(self):
+        cache = ParseCache(os.path.join(self.site, "cache"))
+        cache.put(self.site, "server { listen 80; }", [])
+        self.assertIsNone(cache.get(self.site, "server { listen 80; }"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import context
+from backfill import RECORD_START
+from probe import MIN_PARSE_TIME, Calibration, count_events, net_bytes_per_sec, probe_log
+
+
+class CountEventsTest(unittest.TestCase):
+    def test_lines(self):
+        self.assertEqual(count_events(b"a\nb\nc\n"), 3)
+        self.assertEqual(count_events(b"a\nb\nc"), 3)
+        self.assertEqual(count_events(b""), 0)
+
+    def test_mongo_counts_every_line(self):
+        data = (b"2016-10-01T12:00:00.000+0000 I NETWORK  [conn1] end connection\n"
+                b"2016-10-01T12:00:00.001+0000 I NETWORK  [conn2] end connection\n"
+                b"2016-10-01T12:00:00.002+0000 I NETWORK  [conn3] end connection\n")
+        self.assertEqual(count_events(data, RECORD_START["mongo"]), 3)
+
+    def test_mysql_header_run_is_one_record(self):
+        data = (b"# Time: 161001 12:00:00\n"
+                b"# User@Host: root[root] @ localhost []\n"
+                b"select 1;\n"
+                b"# User@Host: root[root] @ localhost []\n"
+                b"select 2;\n"
+                b"# Time: 161001 12:00:01\n"
+                b"# User@Host: root[root] @ localhost []\n"
+                b"select 3;\n")
+        self.assertEqual(count_events(data, RECORD_START["mysql"]), 3)
+
+
+class ProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_probe_small_file(self):
+        path = os.path.join(self.dir, "log")
+        with open(path, "wb") as fh:
+            fh.write(b"0123456789\n" * 100)
+        probe, samples = probe_log(path)
+        self.assertEqual(len(samples), 1)
+        self.assertEqual(probe.sample_events, 100)
+        self.assertEqual(probe.bytes_per_event, 11)
+        self.assertEqual(probe.projected_events, 100)
+
+    def test_calibration_blends(self):
+        path = os.path.join(self.dir, "calibration.json")
+        calibration = Calibration(path)
+        self.assertIsNone(calibration.bytes_per_sec("nginx"))
+        calibration.record("nginx", 100.0)
+        calibration.record("nginx", 200.0)
+        self.assertEqual(Calibration(path).bytes_per_sec("nginx"), 150.0)
+
+    def test_net_rate_leaves_out_startup(self):
+        # 2MB in 1.5s, 0.5s of which was honeytail starting up
+        self.assertEqual(net_bytes_per_sec(2 * 1024 * 1024, 1.5, 0.5), 2 * 1024 * 1024)
+
+    def test_net_rate_too_quick_to_time(self):
+        self.assertIsNone(net_bytes_per_sec(1024, 0.5, 0.5 - MIN_PARSE_TIME / 2))
+        self.assertIsNone(net_bytes_per_sec(1024, 0.4, 0.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+import context
+from progress import ThroughputBar, format_eta, read_offset
+
+sizeM = 1024 * 1024
+
+
+@unittest.skipUnless(os.path.isdir("/proc/self/fdinfo"), "needs /proc")
+class ReadOffsetTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "log")
+        with open(self.path, "wb") as fh:
+            fh.write(b"x" * 4096)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_own_position(self):
+        with open(self.path, "rb") as fh:
+            fh.seek(1000)
+            self.assertEqual(read_offset(os.getpid(), self.path), 1000)
+
+    def test_through_symlink(self):
+        link = os.path.join(self.dir, "link")
+        os.symlink(self.path, link)
+        with open(self.path, "rb") as fh:
+            fh.seek(123)
+            self.assertEqual(read_offset(os.getpid(), link), 123)
+
+    def test_other_file(self):
+        other = os.path.join(self.dir, "other")
+        with open(other, "wb") as fh:
+            fh.write(b"y")
+        with open(self.path, "rb") as fh:
+            fh.seek(10)
+            self.assertIsNone(read_offset(os.getpid(), other))
+
+    def test_under_a_shell(self):
+        # the shell's child has the file open, as honeytail does under shell=True
+        p = subprocess.Popen(["sh", "-c", "(dd bs=100 count=1 of=/dev/null 2>/dev/null; exec sleep 30) < '{}'".format(self.path)])
+        try:
+            offset = None
+            deadline = time.time() + 5
+            while offset != 100 and time.time() < deadline:
+                time.sleep(0.05)
+                offset = read_offset(p.pid, self.path)
+            self.assertEqual(offset, 100)
+        finally:
+            p.kill()
+            p.wait()
+
+
+class ThroughputBarTest(unittest.TestCase):
+    def test_rate(self):
+        bar = ThroughputBar(100 * sizeM, bytes_per_event=512)
+        self.assertEqual(bar.rate(20 * sizeM, 4), 5 * sizeM)
+
+    def test_eta(self):
+        bar = ThroughputBar(100 * sizeM)
+        # 20MB in 4s leaves 80MB at 5MB/s
+        self.assertEqual(bar.eta(20 * sizeM, 4), 16)
+        self.assertIsNone(bar.eta(0, 4))
+        self.assertEqual(bar.eta(100 * sizeM, 4), 0)
+
+    def test_label(self):
+        bar = ThroughputBar(100 * sizeM, bytes_per_event=512)
+        self.assertEqual(bar.label(20 * sizeM, 4), "5.0 MB/s, 10240 events/s, ETA 00:00:16")
+        self.assertEqual(bar.label(50 * sizeM, 10, percent=True), "50% done, 5.0 MB/s, 10240 events/s, ETA 00:00:10")
+
+    def test_resumed_bar(self):
+        # 40MB were done by an earlier run, and don't count towards the rate
+        bar = ThroughputBar(100 * sizeM, start=40 * sizeM)
+        self.assertEqual(bar.rate(60 * sizeM, 4), 5 * sizeM)
+        self.assertEqual(bar.eta(60 * sizeM, 4), 8)
+
+    def test_format_eta(self):
+        self.assertEqual(format_eta(3725.4), "01:02:05")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import signal
+import sys
+import threading
+import time
+import unittest
+
+import context
+from backfill import run_pool
+from installer import SpawnError, spawn
+from supervisor import Supervisor, forward_signals
+
+
+class SupervisorTest(unittest.TestCase):
+    def test_exit_status(self):
+        self.assertEqual(Supervisor(["sh", "-c", "exit 3"], restart=False).run(), 3)
+
+    def test_supervise_from_threads(self):
+        # Supervisor.run would raise ValueError off the main thread
+        supervisors = [Supervisor(["sleep", "30"], restart=True) for i in range(3)]
+        timer = threading.Timer(0.5, lambda: os.kill(os.getpid(), signal.SIGTERM))
+        began = time.time()
+        timer.start()
+        with forward_signals(supervisors):
+            returncodes = run_pool(lambda supervisor: supervisor.supervise(), supervisors, len(supervisors))
+        self.assertEqual(returncodes, [-signal.SIGTERM] * 3)
+        self.assertLess(time.time() - began, 10)
+        self.assertEqual([s.restarts for s in supervisors], [0, 0, 0])
+        self.assertEqual(signal.getsignal(signal.SIGTERM), signal.SIG_DFL)
+
+    def test_spawn_failure_raises(self):
+        supervisors = [Supervisor(["/nonexistent/honeytail"], restart=True, popen=spawn)]
+        with self.assertRaises(SpawnError):
+            with forward_signals(supervisors):
+                run_pool(lambda supervisor: supervisor.supervise(), supervisors, 1)
+
+    def test_exit_in_pool_thread(self):
+        with self.assertRaises(SystemExit) as cm:
+            run_pool(lambda n: sys.exit(n), [3, 4], 2)
+        self.assertIn(cm.exception.code, (3, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import calendar
+import os
+import shutil
+import tempfile
+import unittest
+
+import context
+from backfill import RECORD_START
+from timestamps import (find_offset_since, parse_mongo_timestamp, parse_mysql_timestamp, parse_nginx_timestamp,
+                        parse_since)
+
+T0 = calendar.timegm((2016, 10, 1, 12, 0, 0, 0, 0, 0))
+
+
+class ParseTest(unittest.TestCase):
+    def test_nginx_time_local(self):
+        line = b'127.0.0.1 - - [01/Oct/2016:05:00:00 -0700] "GET / HTTP/1.1" 200 612\n'
+        self.assertEqual(parse_nginx_timestamp(line), T0)
+
+    def test_nginx_iso8601(self):
+        self.assertEqual(parse_nginx_timestamp(b'{"time": "2016-10-01T12:00:00+00:00"}\n'), T0)
+
+    def test_nginx_no_time(self):
+        self.assertIsNone(parse_nginx_timestamp(b"garbage\n"))
+
+    def test_mysql(self):
+        self.assertEqual(parse_mysql_timestamp(b"SET timestamp=%d;\n" % T0), T0)
+        self.assertEqual(parse_mysql_timestamp(b"# Time: 2016-10-01T12:00:00.123456Z\n"), T0)
+        self.assertIsNone(parse_mysql_timestamp(b"select 1;\n"))
+
+    def test_mongo(self):
+        self.assertEqual(parse_mongo_timestamp(b"2016-10-01T14:00:00.123+0200 I NETWORK  [conn1] end\n"), T0)
+        self.assertIsNotNone(parse_mongo_timestamp(b"Sat Oct  1 12:00:00.123 [conn1] end\n"))
+
+    def test_since(self):
+        self.assertEqual(parse_since("6h", now=T0), T0 - 6 * 3600)
+        self.assertEqual(parse_since("1.5d", now=T0), T0 - 1.5 * 86400)
+        self.assertEqual(parse_since("2016-10-01T12:00:00Z"), T0)
+        self.assertRaises(ValueError, parse_since, "yesterday")
+
+
+class OffsetSinceTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, data):
+        path = os.path.join(self.dir, "log")
+        with open(path, "wb") as fh:
+            fh.write(data)
+        return path
+
+    def test_nginx(self):
+        lines = [b'127.0.0.1 - - [01/Oct/2016:12:%02d:00 +0000] "GET / HTTP/1.1" 200 612\n' % i for i in range(60)]
+        path = self.write(b"".join(lines))
+        offset = find_offset_since(path, T0 + 30 * 60, "nginx")
+        self.assertEqual(offset, len(b"".join(lines[:30])))
+        self.assertEqual(find_offset_since(path, T0 + 3600, "nginx"), os.path.getsize(path))
+
+    def test_json(self):
+        # nginx's escape=json logs, backfilled with honeytail's JSON parser
+        lines = [b'{"time_local":"01/Oct/2016:12:%02d:00 +0000","status":200}\n' % i for i in range(60)]
+        path = self.write(b"".join(lines))
+        self.assertEqual(find_offset_since(path, T0 + 45 * 60, "json"), len(b"".join(lines[:45])))
+
+    def test_mysql_starts_at_header_run(self):
+        records = [(b"# Time: 2016-10-01T12:%02d:00Z\n"
+                    b"# User@Host: root[root] @ localhost []\n"
+                    b"SET timestamp=%d;\n"
+                    b"select 1;\n") % (i, T0 + i * 60 + 30) for i in range(10)]
+        path = self.write(b"".join(records))
+        # the "# Time:" of record 5 is before since, its SET timestamp after
+        offset = find_offset_since(path, T0 + 5 * 60 + 15, "mysql", RECORD_START["mysql"])
+        self.assertEqual(offset, len(b"".join(records[:5])))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import context
+from tracing import Tracer, redact
+
+
+class RedactTest(unittest.TestCase):
+    def test_plain(self):
+        self.assertEqual(redact("honeytail --writekey=abc123 --dataset=x"),
+                         "honeytail --writekey=<redacted> --dataset=x")
+        self.assertEqual(redact(["honeytail", "--mysql.pass", "s3cret"]),
+                         "honeytail --mysql.pass <redacted>")
+
+    def test_quoted_with_spaces(self):
+        self.assertEqual(redact("""honeytail --mysql.pass="two words" --file=x"""),
+                         "honeytail --mysql.pass=<redacted> --file=x")
+        self.assertEqual(redact("""mysql --password='a b "c' -e 'select 1'"""),
+                         "mysql --password=<redacted> -e 'select 1'")
+
+    def test_unterminated_quote(self):
+        self.assertEqual(redact('honeytail --writekey="abc def'), "honeytail --writekey=<redacted>")
+
+    def test_nothing_secret(self):
+        self.assertEqual(redact("honeytail --file=/var/log/mysql/slow.log"), "honeytail --file=/var/log/mysql/slow.log")
+
+
+class TracerTest(unittest.TestCase):
+    def test_spans_and_processes(self):
+        tracer = Tracer()
+        with tracer.span("step", size=1) as extra:
+            extra["more"] = 2
+        token = tracer.start_process(["honeytail", "--writekey=abc"])
+        tracer.end_process(["honeytail", "--writekey=abc"], token, 0)
+
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "trace.json")
+            tracer.write(path, installer="test")
+            with open(path) as fh:
+                trace = json.load(fh)
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(trace["installer"], "test")
+        self.assertEqual(trace["children"], 1)
+        self.assertIn("cpu_user", trace["process"])
+        step, process = trace["spans"]
+        self.assertEqual((step["name"], step["size"], step["more"]), ("step", 1, 2))
+        self.assertNotIn("cpu_user", step)
+        self.assertEqual(process["name"], "honeytail --writekey=<redacted>")
+        self.assertEqual(process["returncode"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
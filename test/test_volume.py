@@ -0,0 +1,70 @@
+import calendar
+import os
+import shutil
+import tempfile
+import unittest
+
+import context
+from backfill import RECORD_START
+from volume import VolumeStats, analyze_volume, tune_flags
+
+T0 = calendar.timegm((2016, 10, 1, 12, 0, 0, 0, 0, 0))
+
+
+class AnalyzeVolumeTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, data):
+        path = os.path.join(self.dir, "log")
+        with open(path, "wb") as fh:
+            fh.write(data)
+        return path
+
+    def test_mongo_counts_every_line(self):
+        # 5 events a second for 10 seconds
+        data = b"".join(b"2016-10-01T12:00:%02d.%03d+0000 I COMMAND  [conn1] command test.foo\n" % (i // 5, i)
+                        for i in range(50))
+        stats = analyze_volume(self.write(data), "mongo", RECORD_START["mongo"])
+        self.assertEqual(stats.events, 50)
+        self.assertEqual(stats.seconds, 10)
+        self.assertEqual(stats.mean, 5.0)
+
+    def test_mysql_header_runs(self):
+        records = []
+        for i in range(20):
+            if i % 2 == 0:
+                records.append(b"# Time: 2016-10-01T12:00:%02dZ\n" % (i // 2))
+            records.append(b"# User@Host: root[root] @ localhost []\nSET timestamp=%d;\nselect 1;\n" % (T0 + i // 2))
+        stats = analyze_volume(self.write(b"".join(records)), "mysql", RECORD_START["mysql"])
+        self.assertEqual(stats.events, 20)
+        self.assertEqual(stats.peak, 2)
+
+    def test_no_timestamps(self):
+        self.assertIsNone(analyze_volume(self.write(b"nothing to see\n"), "nginx"))
+
+
+class TuneFlagsTest(unittest.TestCase):
+    def stats(self, per_second):
+        return VolumeStats(per_second * 100, per_second * 100 * 200, dict((T0 + i, per_second) for i in range(100)))
+
+    def test_no_sampling_without_target(self):
+        flags = dict(tune_flags(self.stats(50000)))
+        self.assertEqual(flags["--samplerate"], 1)
+        self.assertEqual(flags["--send_frequency_ms"], 100)
+
+    def test_sampling_down_to_target(self):
+        self.assertEqual(dict(tune_flags(self.stats(50000), 10000))["--samplerate"], 5)
+        self.assertEqual(dict(tune_flags(self.stats(5000), 10000))["--samplerate"], 1)
+
+    def test_quiet_log(self):
+        flags = dict(tune_flags(self.stats(1)))
+        self.assertEqual(flags["--send_frequency_ms"], 500)
+        self.assertEqual(flags["--send_batch_size"], 50)
+
+
+if __name__ == "__main__":
+    unittest.main()